@@ -0,0 +1,85 @@
+"""
+Parse-time benchmark for DocParser.parse_document.
+
+Generates synthetic handbooks of increasing size and reports the parse time per
+body element, which stays flat when parsing is linear in the document size.
+
+    PYTHONPATH=. python benchmarks/bench_docx_parse.py
+    PYTHONPATH=. python benchmarks/bench_docx_parse.py --pages 10 100 1000 --legacy
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from docx import Document
+
+from worker.utils.evaluate_doc import DocParser
+
+PARAGRAPHS_PER_PAGE = 8
+TABLE_EVERY_PAGES = 5
+
+
+def build_document(pages: int, path: str):
+    doc = Document()
+    for page in range(pages):
+        doc.add_heading(f"Chapter {page}", level=1 if page % 10 == 0 else 2)
+        for paragraph in range(PARAGRAPHS_PER_PAGE):
+            doc.add_paragraph(f"Page {page} paragraph {paragraph}: the IT emergency handbook describes recovery steps.")
+        if page % TABLE_EVERY_PAGES == 0:
+            table = doc.add_table(rows=4, cols=3)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = "contact"
+    doc.save(path)
+
+
+def legacy_parse(path: str) -> int:
+    """The previous index based walk, for comparison on small documents."""
+    doc = Document(path)
+    paragraph_nr = 0
+    table_nr = 0
+    for element in doc.element.body:
+        if element.tag.endswith('p'):
+            doc.paragraphs[paragraph_nr].style.name
+            paragraph_nr += 1
+        elif element.tag.endswith('tbl'):
+            for row in doc.tables[table_nr].rows:
+                [cell.text for cell in row.cells]
+            table_nr += 1
+    return paragraph_nr + table_nr
+
+
+def count_elements(path: str) -> int:
+    return len(Document(path).element.body)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500, 1000, 5000])
+    arg_parser.add_argument("--legacy", action="store_true", help="also time the previous quadratic parser")
+    arg_parser.add_argument("--legacy-max-pages", type=int, default=500)
+    args = arg_parser.parse_args()
+
+    print(f"{'pages':>6} {'elements':>9} {'parse s':>9} {'us/elem':>8} {'legacy s':>9}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for pages in args.pages:
+            path = os.path.join(temp_dir, f"handbook_{pages}.docx")
+            build_document(pages, path)
+            elements = count_elements(path)
+
+            start = time.perf_counter()
+            DocParser().parse_document(path)
+            elapsed = time.perf_counter() - start
+
+            legacy = ""
+            if args.legacy and pages <= args.legacy_max_pages:
+                start = time.perf_counter()
+                legacy_parse(path)
+                legacy = f"{time.perf_counter() - start:9.3f}"
+
+            print(f"{pages:>6} {elements:>9} {elapsed:>9.3f} {elapsed / elements * 1e6:>8.1f} {legacy:>9}")
+
+
+if __name__ == "__main__":
+    main()
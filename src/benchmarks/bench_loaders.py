@@ -0,0 +1,60 @@
+"""
+Parse-throughput benchmark for every registered document loader.
+
+Builds a synthetic handbook per file type, loads it through ``get_loader`` (so
+the type is sniffed from the content) and reports MB/s and nodes/s, for the
+whole document and for a lazy load of a few checklist sections.
+
+    PYTHONPATH=. python benchmarks/bench_loaders.py
+    PYTHONPATH=. python benchmarks/bench_loaders.py --pages 200 --sections "Chapter 10" "Chapter 150"
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import bench_docx_parse
+import bench_pdf_parse
+from worker.utils.document_loader import get_loader
+
+# synthetic document builders per loader, keyed by loader class name
+BUILDERS = {
+    "WordLoader": lambda pages, path: bench_docx_parse.build_document(pages, path),
+    "PDFLoader": lambda pages, path: bench_pdf_parse.build_document(pages, path, outline=True),
+}
+
+
+def timed_load(path: str, sections=None):
+    loader = get_loader(path)
+    start = time.perf_counter()
+    loader.load(sections)
+    return time.perf_counter() - start, loader
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--pages", type=int, nargs="+", default=[50, 200])
+    arg_parser.add_argument("--sections", nargs="+", default=["Chapter 10", "Chapter 21"])
+    args = arg_parser.parse_args()
+
+    print(f"{'loader':>11} {'pages':>6} {'MB':>6} {'nodes':>7} {'load s':>8} {'MB/s':>7} {'nodes/s':>9} "
+          f"{'lazy s':>8} {'lazy nodes':>11}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, build in BUILDERS.items():
+            for pages in args.pages:
+                # no suffix, the loader is chosen by content
+                path = os.path.join(temp_dir, f"{name}_{pages}")
+                build(pages, path)
+                size = os.path.getsize(path) / 1e6
+
+                elapsed, loader = timed_load(path)
+                assert type(loader).__name__ == name
+                nodes = len(loader.tree)
+                lazy, lazy_loader = timed_load(path, args.sections)
+
+                print(f"{name:>11} {pages:>6} {size:>6.2f} {nodes:>7} {elapsed:>8.3f} {size / elapsed:>7.2f} "
+                      f"{nodes / elapsed:>9.0f} {lazy:>8.3f} {len(lazy_loader.tree):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Parse-time benchmark for PDFLoader.
+
+Generates synthetic handbooks with a larger heading font, optionally with an
+outline, and reports pages per second for the sequential and the process pool
+extraction together with the number of recovered headings.
+
+    PYTHONPATH=. python benchmarks/bench_pdf_parse.py
+    PYTHONPATH=. python benchmarks/bench_pdf_parse.py --pages 10 100 500 --outline
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import PyPDF2
+
+from worker.core.config import settings
+from worker.utils.document_loader import PDFLoader
+
+LINES_PER_PAGE = 30
+
+
+def _escape(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _page_stream(page: int) -> bytes:
+    level = 1 if page % 10 == 0 else 2
+    commands = [f"BT /F1 {22 if level == 1 else 16} Tf 72 750 Td ({_escape(f'Chapter {page}')}) Tj ET"]
+    for line in range(LINES_PER_PAGE):
+        text = f"Page {page} line {line}: the IT emergency handbook describes recovery steps."
+        commands.append(f"BT /F1 10 Tf 72 {720 - line * 20} Td ({_escape(text)}) Tj ET")
+    return '\n'.join(commands).encode('latin-1')
+
+
+def build_document(pages: int, path: str, outline: bool = False):
+    """A minimal PDF with one Helvetica font, written by hand to avoid extra dependencies."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        stream = _page_stream(page)
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content)
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), pages)
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as file:
+        file.write(data)
+
+    if outline:
+        writer = PyPDF2.PdfWriter()
+        writer.append_pages_from_reader(PyPDF2.PdfReader(path))
+        parent = None
+        for page in range(pages):
+            if page % 10 == 0:
+                parent = writer.add_outline_item(f"Chapter {page}", page)
+            else:
+                writer.add_outline_item(f"Chapter {page}", page, parent=parent)
+        with open(path, "wb") as file:
+            writer.write(file)
+
+
+def timed_load(path: str, min_pages: int):
+    previous = settings.PDF_PARALLEL_MIN_PAGES
+    settings.PDF_PARALLEL_MIN_PAGES = min_pages
+    try:
+        loader = PDFLoader(path)
+        start = time.perf_counter()
+        loader.load()
+        return time.perf_counter() - start, loader.tree
+    finally:
+        settings.PDF_PARALLEL_MIN_PAGES = previous
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500])
+    arg_parser.add_argument("--outline", action="store_true", help="add bookmarks for every chapter")
+    args = arg_parser.parse_args()
+
+    print(f"{'pages':>6} {'nodes':>7} {'headings':>9} {'seq s':>8} {'pages/s':>8} {'pool s':>8} {'pages/s':>8}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for pages in args.pages:
+            path = os.path.join(temp_dir, f"handbook_{pages}.pdf")
+            build_document(pages, path, outline=args.outline)
+
+            sequential, tree = timed_load(path, min_pages=pages + 1)
+            pooled, _ = timed_load(path, min_pages=1)
+            headings = sum(1 for i in range(len(tree)) if tree.style(i).startswith("Heading"))
+
+            print(f"{pages:>6} {len(tree):>7} {headings:>9} {sequential:>8.3f} {pages / sequential:>8.0f} "
+                  f"{pooled:>8.3f} {pages / pooled:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+
+# the settings of the worker are read on import, only the required ones are set here
+for name, value in {
+    "POSTGRES_SERVER": "localhost",
+    "POSTGRES_USER": "test",
+    "EVAL_API_BASE_PATH": "http://localhost",
+    "CELERY_BROKER_URL": "redis://localhost:6379/0",
+    "CELERY_RESULT_BACKEND": "redis://localhost:6379/0",
+    "GENEXT_APP_ID_PROD": "test",
+    "GENEXT_API_KEY_PROD": "test",
+    "GENEXT_API_SECRET_PROD": "test",
+    "CLIENT_ID_PROD": "test",
+    "CLIENT_SECRET_PROD": "test",
+    "TENANT_ID_PROD": "test",
+}.items():
+    os.environ.setdefault(name, value)
+
+# importing the Celery app sets up the OTLP exporters, nothing should be sent from the tests
+os.environ["OTEL_SDK_DISABLED"] = "true"
+
+# the worker modules are imported once the settings above are in place
+import hashlib
+from typing import Dict, List
+
+import httpx
+import pytest
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from worker.utils import helper
+
+
+class _BrokenStream(httpx.SyncByteStream):
+    """A body that breaks off after ``data``."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def __iter__(self):
+        yield self.data
+        raise httpx.ReadError("connection reset by peer")
+
+
+class FileServer:
+    """
+    Files served over a mocked httpx transport, with ETags, conditional GETs
+    and byte ranges. ``cuts`` are the sizes after which the next bodies break off.
+    """
+
+    def __init__(self):
+        self.files: Dict[str, bytes] = {}
+        self.requests: List[httpx.Request] = []
+        self.head = True
+        self.ranges = True
+        self.cuts: List[int] = []
+
+    @staticmethod
+    def url(name: str) -> str:
+        return f"http://files.test/{name}"
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        data = self.files.get(request.url.path.lstrip("/"))
+        if data is None:
+            return httpx.Response(404)
+        headers = {"etag": f'"{hashlib.sha256(data).hexdigest()[:16]}"'}
+        if self.ranges:
+            headers["accept-ranges"] = "bytes"
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={**headers, "content-length": str(len(data))}) if self.head \
+                else httpx.Response(405)
+        if request.headers.get("if-none-match") == headers["etag"]:
+            return httpx.Response(304, headers=headers)
+        status = 200
+        if self.ranges and "range" in request.headers:
+            start, end = request.headers["range"].removeprefix("bytes=").split("-")
+            data = data[int(start):int(end) + 1 if end else None]
+            status = 206
+        if self.cuts:
+            return httpx.Response(status, headers=headers, stream=_BrokenStream(data[:self.cuts.pop(0)]))
+        return httpx.Response(status, headers=headers, content=data)
+
+    def gets(self, name: str) -> List[httpx.Request]:
+        return [request for request in self.requests if request.method == "GET" and request.url.path == f"/{name}"]
+
+
+@pytest.fixture
+def file_server(monkeypatch):
+    """A FileServer behind the pooled HTTP client of the worker."""
+    server = FileServer()
+    monkeypatch.setattr(helper, "_http_client", httpx.Client(transport=httpx.MockTransport(server)))
+    return server
+
+
+class MetricReader(InMemoryMetricReader):
+    """Keeps the metrics of ``self.meter`` in memory."""
+
+    def __init__(self):
+        super().__init__()
+        self.meter = MeterProvider(metric_readers=[self]).get_meter("test")
+
+    def exported(self) -> dict:
+        """The value of every data point by metric name and attributes, histograms by their sample count."""
+        points = {}
+        for resource_metrics in self.get_metrics_data().resource_metrics:
+            for scope_metrics in resource_metrics.scope_metrics:
+                for metric in scope_metrics.metrics:
+                    for point in metric.data.data_points:
+                        key = (metric.name,) + tuple(sorted(point.attributes.items()))
+                        points[key] = point.count if hasattr(point, "count") else point.value
+        return points
+
+
+@pytest.fixture
+def metric_reader(monkeypatch):
+    # the SDK is disabled for the tests, see above
+    monkeypatch.delenv("OTEL_SDK_DISABLED")
+    return MetricReader()
@@ -0,0 +1,104 @@
+from pathlib import Path
+
+import pytest
+import yaml
+
+from worker.utils.checklist_compiler import ChecklistError, compile_checklist, validate_checklist
+from worker.utils.evaluate_doc import ValidationRules, build_content
+
+CHECKLIST = Path(__file__).resolve().parents[2] / "data" / "checklist.yaml"
+
+CHECKLIST_YAML = b"""
+sections:
+  - section_text: Scope
+    validation_rules:
+      - rule_id: S1
+        prompt: Is the scope stated?
+        criteria:
+          - The scope names the system.
+          - The scope names the users.
+      - rule_id: S2
+        prompt: Is the scope bounded?
+        criteria: []
+  - section_text: Contacts
+    validation_rules:
+      - rule_id: C1
+        prompt: Are contacts given?
+        criteria:
+          - A named owner.
+"""
+
+
+def _legacy(data: bytes):
+    return ValidationRules().create_list_of_rules(yaml.safe_load(data))
+
+
+@pytest.mark.parametrize("data", [
+    pytest.param(CHECKLIST_YAML, id="inline"),
+    pytest.param(CHECKLIST.read_bytes() if CHECKLIST.exists() else b"", id="data/checklist.yaml",
+                 marks=pytest.mark.skipif(not CHECKLIST.exists(), reason="no data/checklist.yaml")),
+])
+def test_rules_render_like_the_legacy_parser(data):
+    sections, rules, rule_ids = _legacy(data)
+
+    checklist = compile_checklist(data)
+
+    assert list(checklist.sections) == sections
+    assert list(checklist.rules) == rules
+    assert list(checklist.rule_ids) == rule_ids
+    assert list(checklist.system_prompts) == [build_content(rule) for rule in rules]
+
+
+def _errors(data: bytes):
+    with pytest.raises(ChecklistError) as error:
+        validate_checklist(data)
+    return error.value.errors
+
+
+def test_every_problem_is_reported():
+    errors = _errors(b"""
+sections:
+  - section_text: Scope
+    validation_rules:
+      - rule_id: S1
+      - prompt: Is the scope stated?
+        criteria: not a list
+""")
+
+    assert "sections.0.validation_rules.0.prompt: Field required" in errors
+    assert "sections.0.validation_rules.1.rule_id: Field required" in errors
+    assert any(error.startswith("sections.0.validation_rules.1.criteria:") for error in errors)
+    assert len(errors) == 3
+
+
+def test_repeated_rule_id_is_rejected():
+    errors = _errors(CHECKLIST_YAML.replace(b"rule_id: C1", b"rule_id: S1"))
+
+    assert errors == ["checklist: Value error, rule_id 'S1' is used more than once"]
+
+
+def test_routing_is_validated():
+    errors = _errors(b"""
+routing:
+  models: [no-such-model]
+sections:
+  - section_text: Scope
+    routing:
+      escalate_band: [8, 3]
+    validation_rules:
+      - rule_id: S1
+        prompt: Is the scope stated?
+""")
+
+    assert any(error.startswith("routing.models:") for error in errors)
+    assert any(error.startswith("sections.0.routing.escalate_band:") for error in errors)
+
+
+@pytest.mark.parametrize("data, error", [
+    (b"sections: [", "not valid YAML"),
+    (b"- just\n- a list\n", "checklist: must be a mapping"),
+])
+def test_unreadable_checklists(data, error):
+    errors = _errors(data)
+
+    assert len(errors) == 1 and errors[0].startswith(error)
@@ -0,0 +1,64 @@
+import billiard
+import pytest
+
+from benchmarks.bench_pdf_parse import build_document
+from worker.core.config import settings
+from worker.utils import document_loader
+from worker.utils.document_loader import PDFLoader
+
+
+def _parse(path: str, min_pages: int):
+    """The node texts and styles of the PDF and the process contexts of its page pools."""
+    contexts = []
+    executor = document_loader.ProcessPoolExecutor
+
+    def recording(*args, mp_context=None, **kwargs):
+        contexts.append(type(mp_context).__module__ if mp_context is not None else None)
+        return executor(*args, mp_context=mp_context, **kwargs)
+
+    previous = settings.PDF_PARALLEL_MIN_PAGES
+    document_loader.ProcessPoolExecutor = recording
+    settings.PDF_PARALLEL_MIN_PAGES = min_pages
+    try:
+        loader = PDFLoader(path)
+        loader.load()
+    finally:
+        document_loader.ProcessPoolExecutor = executor
+        settings.PDF_PARALLEL_MIN_PAGES = previous
+    tree = loader.tree
+    return [(tree.text(i), tree.style(i)) for i in range(len(tree))], contexts
+
+
+def _is_daemon() -> bool:
+    return billiard.current_process().daemon
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = str(tmp_path / "handbook.pdf")
+    build_document(12, path)
+    return path
+
+
+def test_pages_are_extracted_in_a_pool_from_a_daemonic_worker(pdf, monkeypatch):
+    monkeypatch.setattr(settings, "PDF_PAGES_PER_TASK", 4)
+    sequential, contexts = _parse(pdf, min_pages=100)
+    assert contexts == []
+
+    # a prefork Celery worker is a daemonic billiard process
+    with billiard.Pool(processes=1) as worker:
+        assert worker.apply(_is_daemon)
+        pooled, contexts = worker.apply(_parse, (pdf, 1))
+
+    assert contexts == ["billiard.context"]
+    assert pooled == sequential
+    assert sum(1 for _, style in pooled if style.startswith("Heading")) == 12
+
+
+def test_pages_are_extracted_with_multiprocessing_outside_celery(pdf):
+    sequential, _ = _parse(pdf, min_pages=100)
+
+    pooled, contexts = _parse(pdf, min_pages=1)
+
+    assert contexts == [None]
+    assert pooled == sequential
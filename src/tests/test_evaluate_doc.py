@@ -0,0 +1,126 @@
+import threading
+
+from worker.utils import evaluate_doc
+from worker.utils.genext import DeadlineExceededError, GenextAPI
+from worker.utils.prompt_builder import PromptChunk
+from worker.utils.response_parser import REASK_INSTRUCTION
+
+
+def _answers(monkeypatch, *completions):
+    """Answer the GenextAPI requests with ``completions`` in turn, returns the sent payloads."""
+    payloads = []
+    answers = iter(completions)
+
+    def run(self, use_m2m=False, m2m_token="", deadline=None):
+        payloads.append(self.payload)
+        return {"completion": next(answers)}
+
+    monkeypatch.setattr(GenextAPI, "run", run)
+    return payloads
+
+
+def _question(payload) -> str:
+    return payload["history"][-1]["content"]
+
+
+def test_evaluate_rule_reasks_with_instruction(monkeypatch):
+    payloads = _answers(monkeypatch, "no idea", '{"score": 7, "feedback": "Fine."}')
+
+    score, answer = evaluate_doc.evaluate_rule("Rule ID: R1", "the document")
+
+    assert score == 7
+    assert len(payloads) == 2
+    assert _question(payloads[0]) == "the document"
+    assert _question(payloads[1]) == "the document" + REASK_INSTRUCTION
+    assert payloads[0]["history"][0] == payloads[1]["history"][0]
+
+
+def test_evaluate_rule_fails_after_second_malformed_answer(monkeypatch):
+    payloads = _answers(monkeypatch, "no idea", "still no idea")
+
+    score, answer = evaluate_doc.evaluate_rule("Rule ID: R1", "the document")
+
+    assert score is None
+    assert answer == "still no idea"
+    assert len(payloads) == 2
+
+
+def test_evaluate_rule_does_not_reask_parsed_answer(monkeypatch):
+    payloads = _answers(monkeypatch, '{"score": 3, "feedback": "Missing contacts."}')
+
+    score, _ = evaluate_doc.evaluate_rule("Rule ID: R1", "the document")
+
+    assert score == 3
+    assert len(payloads) == 1
+
+
+class _Document:
+    content_hash = "document"
+    text = "- Scope\n  - The whole document.\n"
+
+    def section_text(self, section: str) -> str:
+        return f"Text of {section}"
+
+
+def _checklist(*rule_ids: str) -> evaluate_doc.ParsedChecklist:
+    return evaluate_doc.ParsedChecklist("checklist", tuple(f"Section {rule_id}" for rule_id in rule_ids),
+                                        tuple(f"Rule ID: {rule_id}" for rule_id in rule_ids), rule_ids)
+
+
+def _route_results(monkeypatch, results):
+    """Answer evaluate_rule_routed per rule id, an exception in ``results`` is raised."""
+    def evaluate_rule_routed(rule_id, rule, prompt, route, start=0, content=None):
+        result = results[rule_id]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    monkeypatch.setattr(evaluate_doc, "evaluate_rule_routed", evaluate_rule_routed)
+
+
+def test_only_deadline_misses_are_timed_out(monkeypatch):
+    _route_results(monkeypatch, {
+        "R1": DeadlineExceededError("too late"),
+        "R2": (None, "Evaluation failed for rule R2", "gpt-4o"),
+        "R3": (8, "Fine.", "gpt-4o"),
+    })
+    checklist = _checklist("R1", "R2", "R3")
+    streamed = {}
+
+    lt_score, lt_answer, lt_model, lt_timed_out = evaluate_doc.do_evaluation(
+        _Document(), checklist, max_workers=2, batch_rules=False, use_retrieval=False,
+        on_result=lambda index, *result: streamed.setdefault(index, result))
+
+    assert lt_timed_out == [True, False, False]
+    assert lt_score[0] is None and lt_score[2] == 8
+    assert [streamed[i][3] for i in range(3)] == lt_timed_out
+
+    findings = evaluate_doc.build_findings(checklist.sections, lt_score, lt_answer, checklist.rule_ids,
+                                           models=lt_model, timed_out=lt_timed_out)
+    assert findings[0]["timed_out"] is True and findings[0]["score"] is None
+    assert "timed_out" not in findings[1]
+    assert "timed_out" not in findings[2]
+
+
+def test_chunks_of_a_single_rule_run_concurrently(monkeypatch):
+    class ThreeChunks:
+        def __init__(self, model, max_completion_tokens):
+            pass
+
+        def build(self, text, system_prompt, quoted=True):
+            return [PromptChunk(prompt=f"part {i}", tokens=100) for i in range(3)]
+
+    # every chunk waits for the other two, which only returns when they are in flight together
+    barrier = threading.Barrier(3, timeout=5)
+
+    def evaluate_rule_routed(rule_id, rule, prompt, route, start=0, content=None):
+        barrier.wait()
+        return 5, prompt, "gpt-4o"
+
+    monkeypatch.setattr(evaluate_doc, "PromptBuilder", ThreeChunks)
+    monkeypatch.setattr(evaluate_doc, "evaluate_rule_routed", evaluate_rule_routed)
+
+    lt_score, _, _, _ = evaluate_doc.do_evaluation(_Document(), _checklist("R1"), max_workers=4,
+                                                   batch_rules=False, use_retrieval=False)
+
+    assert lt_score == [5]
@@ -0,0 +1,30 @@
+import pytest
+
+from worker.utils.file_cache import FileCache
+
+
+def test_unchanged_files_are_served_from_the_cache(file_server, tmp_path):
+    file_server.files["checklist.yaml"] = b"sections: []\n"
+    cache = FileCache(str(tmp_path / "cache"), max_bytes=1024)
+
+    assert not cache.fetch(file_server.url("checklist.yaml"), str(tmp_path / "first.yaml"))
+    assert cache.fetch(file_server.url("checklist.yaml"), str(tmp_path / "second.yaml"))
+
+    assert (tmp_path / "second.yaml").read_bytes() == b"sections: []\n"
+    assert file_server.gets("checklist.yaml")[-1].headers["if-none-match"]
+    assert cache.stats()["hit_ratio"] == 0.5
+
+
+def test_hits_and_saved_bytes_are_exported(file_server, tmp_path, metric_reader):
+    file_server.files["document.docx"] = b"x" * 100
+    cache = FileCache(str(tmp_path / "cache"), max_bytes=1024, meter=metric_reader.meter)
+
+    for name in ("first", "second", "third"):
+        cache.fetch(file_server.url("document.docx"), str(tmp_path / name))
+
+    exported = metric_reader.exported()
+    assert exported[("file_cache.requests", ("hit", False))] == 1
+    assert exported[("file_cache.requests", ("hit", True))] == 2
+    assert exported[("file_cache.bytes_saved",)] == 200
+    assert exported[("file_cache.hit_ratio",)] == pytest.approx(2 / 3)
+    assert exported[("file_cache.size",)] == 100
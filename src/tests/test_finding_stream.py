@@ -0,0 +1,124 @@
+from collections import Counter
+from types import SimpleNamespace
+
+import fakeredis
+import httpx
+import pytest
+
+from worker.utils import finding_stream
+from worker.utils.finding_stream import FindingStream
+
+
+class JobApi:
+    """
+    The findings endpoint of one job. Requests carrying a known Idempotency-Key
+    are answered without storing their findings again; ``lost`` responses time
+    out after the findings were stored, ``failing`` requests before.
+    """
+
+    def __init__(self):
+        self.stored = []
+        self.keys = []
+        self.progress = []
+        self.lost = 0
+        self.failing = 0
+
+    def add_job_findings(self, org, job_id, job_name, findings, idempotency_key=None):
+        self.keys.append(idempotency_key)
+        if self.failing:
+            self.failing -= 1
+            raise httpx.ConnectError("connection refused")
+        if idempotency_key not in {key for key, _ in self.stored}:
+            self.stored.append((idempotency_key, [finding["rule_id"] for finding in findings]))
+        if self.lost:
+            self.lost -= 1
+            raise httpx.ReadTimeout("response lost")
+
+    def update_job_status(self, org, job_id, job_name, status, progress=None, **kwargs):
+        self.progress.append(progress)
+
+    def rule_ids(self) -> Counter:
+        return Counter(rule_id for _, rule_ids in self.stored for rule_id in rule_ids)
+
+
+@pytest.fixture
+def api(monkeypatch):
+    api = JobApi()
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(finding_stream, "get_artifact_store", lambda: SimpleNamespace(redis=client))
+    monkeypatch.setattr(finding_stream, "add_job_findings", api.add_job_findings)
+    monkeypatch.setattr(finding_stream, "update_job_status", api.update_job_status)
+    return api
+
+
+def _stream(total: int = 4) -> FindingStream:
+    return FindingStream("org", "job-1", "job", total, batch_size=2, flush_interval=60)
+
+
+def _finding(rule_id: str) -> dict:
+    return {"rule_id": rule_id, "score": 7}
+
+
+def test_findings_are_posted_in_batches_with_progress(api):
+    stream = _stream(total=3)
+    for rule_id in ("R1", "R2", "R3"):
+        stream.add(_finding(rule_id))
+    assert api.rule_ids() == Counter({"R1": 1, "R2": 1})
+
+    stream.close()
+
+    assert [rule_ids for _, rule_ids in api.stored] == [["R1", "R2"], ["R3"]]
+    assert api.progress == [(2, 3), (3, 3)]
+
+
+def test_a_retried_task_does_not_post_its_findings_again(api):
+    first = _stream()
+    for rule_id in ("R1", "R2", "R3"):
+        first.add(_finding(rule_id))
+    # the task dies before closing the stream, R3 was never posted
+
+    retried = _stream()
+    for rule_id in ("R1", "R2", "R3", "R4"):
+        retried.add(_finding(rule_id))
+    retried.close()
+
+    assert api.rule_ids() == Counter({"R1": 1, "R2": 1, "R3": 1, "R4": 1})
+    assert api.progress[-1] == (4, 4)
+
+
+def test_a_failed_batch_is_retried_under_the_same_key(api):
+    stream = _stream()
+    # the API stores the batch but the answer never arrives
+    api.lost = 1
+    stream.add(_finding("R1"))
+    stream.add(_finding("R2"))
+    assert api.progress == []
+
+    stream.add(_finding("R3"))
+    stream.add(_finding("R4"))
+    stream.close()
+
+    assert api.keys[0] == api.keys[1]
+    assert api.rule_ids() == Counter({"R1": 1, "R2": 1, "R3": 1, "R4": 1})
+    assert api.progress[-1] == (4, 4)
+
+
+def test_an_unreachable_api_keeps_the_batch(api):
+    stream = _stream()
+    api.failing = 2
+    for rule_id in ("R1", "R2", "R3", "R4"):
+        stream.add(_finding(rule_id))
+    assert api.stored == []
+
+    stream.close()
+
+    assert api.rule_ids() == Counter({"R1": 1, "R2": 1, "R3": 1, "R4": 1})
+
+
+def test_close_raises_when_the_last_post_fails(api):
+    stream = _stream()
+    api.failing = 1
+    stream.add(_finding("R1"))
+
+    with pytest.raises(httpx.ConnectError):
+        stream.close()
@@ -0,0 +1,265 @@
+import os
+from http import HTTPStatus
+from types import SimpleNamespace
+from typing import Tuple
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+from requests.exceptions import HTTPError
+
+from worker.utils import genext, prompt_builder
+from worker.utils.genext import GenextAPI, GenextClient, LlmApiModel
+
+
+@pytest.fixture
+def counted_tokens(monkeypatch):
+    calls = []
+    count_tokens = prompt_builder.count_tokens
+
+    def counting(text, model):
+        calls.append(text)
+        return count_tokens(text, model)
+
+    monkeypatch.setattr(prompt_builder, "count_tokens", counting)
+    return calls
+
+
+def test_prompt_is_tokenized_once_per_request(monkeypatch, counted_tokens):
+    api = GenextAPI("the document", model_name=LlmApiModel.GPT_4o, temperature=0.2, content="the rule")
+    monkeypatch.setattr(GenextAPI, "_run", lambda self, session, deadline=None: {"completion": "fine"})
+    monkeypatch.setattr(genext, "get_genext_client", lambda: type("Client", (), {"session": None})())
+
+    assert api.run() == {"completion": "fine"}
+
+    # the system prompt and the question once, the completion once
+    assert counted_tokens.count("the document") == 1
+    assert counted_tokens.count("the rule") == 1
+    assert api._estimated_tokens() == api._prompt_tokens() + api.max_completion_token_count
+    assert counted_tokens.count("the document") == 1
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    from worker.utils import model_metrics
+
+    fresh = model_metrics.ModelMetrics()
+    monkeypatch.setattr(model_metrics, "model_metrics", fresh)
+    return fresh
+
+
+def _answer_at_once(monkeypatch):
+    monkeypatch.setattr(GenextAPI, "post_generate_chat_request", staticmethod(lambda session, payload: "request-1"))
+    monkeypatch.setattr(GenextAPI, "get_generate_chat_request",
+                        lambda self, session, request_id: {"status": "COMPLETED", "completion": "fine"})
+    monkeypatch.setattr(genext, "get_genext_client", lambda: type("Client", (), {"session": None})())
+
+
+def test_hedging_window_excludes_rate_limit_waits(monkeypatch, metrics):
+    _answer_at_once(monkeypatch)
+
+    def slow_limit(model, tokens, call, deadline=None):
+        # a rate limit wait or a retry backoff before the request goes out
+        genext.time.sleep(0.2)
+        return call()
+
+    monkeypatch.setattr(GenextAPI, "_call_limited", staticmethod(slow_limit))
+
+    GenextAPI("the document", model_name=LlmApiModel.GPT_4o, temperature=0.2).run()
+
+    assert metrics.snapshot()["gpt-4o"]["latency_seconds"] >= 0.2
+    assert metrics.latency_percentile("gpt-4o", 95) < 0.1
+
+
+def test_hedged_duplicate_counts_its_prompt_tokens(monkeypatch, metrics):
+    _answer_at_once(monkeypatch)
+    api = GenextAPI("the document", model_name=LlmApiModel.GPT_4o, temperature=0.2)
+    request_ids = ["request-0"]
+
+    assert api._hedge(None, request_ids)
+
+    counts = metrics.snapshot()["gpt-4o"]
+    assert request_ids == ["request-0", "request-1"]
+    assert counts["hedged"] == 1
+    assert counts["prompt_tokens"] == api._prompt_tokens()
+    assert counts["cost_usd"] > 0
+
+
+class StubAdapter(BaseAdapter):
+    """Answers every request with the next of ``statuses``, keeps the Authorization headers."""
+
+    def __init__(self, *statuses: int):
+        super().__init__()
+        self.statuses = list(statuses)
+        self.authorizations = []
+
+    def send(self, request, **kwargs):
+        self.authorizations.append(request.headers.get("Authorization"))
+        response = requests.Response()
+        response.status_code = self.statuses.pop(0)
+        response.request = request
+        response.url = request.url
+        response._content = b"{}"
+        return response
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """The monotonic clock of the genext module, advanced by the tests."""
+    now = [1000.0]
+    monkeypatch.setattr(genext, "time", SimpleNamespace(monotonic=lambda: now[0], sleep=lambda seconds: None))
+    return now
+
+
+@pytest.fixture
+def tokens(monkeypatch):
+    """The M2M tokens handed out so far, every token lives for an hour."""
+    issued = []
+
+    def request_token(session):
+        issued.append(f"token-{len(issued) + 1}")
+        return issued[-1], 3600
+
+    monkeypatch.setattr(GenextAPI, "load_and_get_bmw_ca", staticmethod(lambda: "ca.pem"))
+    monkeypatch.setattr(GenextAPI, "request_webeam_access_token", staticmethod(request_token))
+    return issued
+
+
+def _client(*statuses: int, **kwargs) -> Tuple[GenextClient, StubAdapter]:
+    client = GenextClient(**kwargs)
+    adapter = StubAdapter(*statuses)
+    client.session.mount("https://", adapter)
+    return client, adapter
+
+
+def test_token_is_cached_until_shortly_before_it_expires(clock, tokens):
+    client, _ = _client()
+
+    assert client.get_token() == "token-1"
+    clock[0] += 3600 - genext.TOKEN_EXPIRY_MARGIN - 1
+    assert client.get_token() == "token-1"
+    clock[0] += 1
+    assert client.get_token() == "token-2"
+
+
+def test_unauthorized_answer_invalidates_the_token(clock, tokens):
+    client, adapter = _client(HTTPStatus.OK, HTTPStatus.UNAUTHORIZED, HTTPStatus.OK)
+
+    client.session.get("https://genext.test/chat")
+    with pytest.raises(HTTPError):
+        client.session.get("https://genext.test/chat")
+    client.session.get("https://genext.test/chat")
+
+    assert adapter.authorizations == ["Bearer token-1", "Bearer token-1", "Bearer token-2"]
+
+
+def test_static_token_is_never_refreshed(clock, tokens):
+    client, adapter = _client(HTTPStatus.UNAUTHORIZED, HTTPStatus.OK, static_token="caller-token")
+
+    with pytest.raises(HTTPError):
+        client.session.get("https://genext.test/chat")
+    client.session.get("https://genext.test/chat")
+
+    assert adapter.authorizations == ["Bearer caller-token", "Bearer caller-token"]
+    assert tokens == []
+
+
+def test_requests_share_the_pooled_session(monkeypatch, tokens):
+    monkeypatch.setattr(genext, "_client", None)
+    sessions = []
+
+    def post(session, payload):
+        sessions.append(session)
+        return "request-1"
+
+    monkeypatch.setattr(GenextAPI, "post_generate_chat_request", staticmethod(post))
+    monkeypatch.setattr(GenextAPI, "get_generate_chat_request",
+                        lambda self, session, request_id: {"status": "COMPLETED", "completion": "fine"})
+
+    for _ in range(2):
+        GenextAPI("the document", model_name=LlmApiModel.GPT_4o, temperature=0.2).run()
+
+    assert genext.get_genext_client() is genext.get_genext_client()
+    assert sessions == [genext.get_genext_client().session] * 2
+
+
+def test_forked_worker_creates_its_own_client(monkeypatch):
+    parent_client = object()
+    monkeypatch.setattr(genext, "_client", parent_client)
+
+    pid = os.fork()
+    if pid == 0:
+        # the child must not reuse the pooled sockets of the parent
+        os._exit(0 if genext._client is None else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert genext._client is parent_client
+
+
+class RecordingLimiter:
+    def __init__(self):
+        self.calls = []
+
+    def acquire(self, model, tokens, deadline=None):
+        self.calls.append(("acquire", model))
+
+    def throttle(self, model, retry_after=None):
+        self.calls.append(("throttle", model, retry_after))
+
+    def success(self, model):
+        self.calls.append(("success", model))
+
+
+def _error(status: int, retry_after: str) -> HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    response.headers["Retry-After"] = retry_after
+    return HTTPError(response=response)
+
+
+def test_rate_limited_poll_does_not_post_the_chat_again(monkeypatch, clock):
+    from worker.utils import rate_limiter
+
+    limiter = RecordingLimiter()
+    monkeypatch.setattr(rate_limiter, "get_rate_limiter", lambda: limiter)
+    monkeypatch.setattr(genext, "get_genext_client", lambda: type("Client", (), {"session": None})())
+    sleeps = []
+    monkeypatch.setattr(genext.time, "sleep", sleeps.append)
+    posts = []
+    answers = [_error(HTTPStatus.TOO_MANY_REQUESTS, "7"), {"status": "COMPLETED", "completion": "fine"}]
+
+    def post(session, payload):
+        posts.append(payload)
+        return "request-1"
+
+    def get(self, session, request_id):
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(GenextAPI, "post_generate_chat_request", staticmethod(post))
+    monkeypatch.setattr(GenextAPI, "get_generate_chat_request", get)
+
+    answer = GenextAPI("the document", model_name=LlmApiModel.GPT_4o, temperature=0.2).run()
+
+    assert answer["completion"] == "fine"
+    assert len(posts) == 1
+    assert limiter.calls == [("acquire", "gpt-4o"), ("throttle", "gpt-4o", 7.0), ("success", "gpt-4o")]
+    # the next poll waits for the Retry-After period
+    assert sleeps == [7.0]
+
+
+def test_failed_poll_is_raised_unless_retryable(monkeypatch, clock):
+    def get(self, session, request_id):
+        raise _error(HTTPStatus.NOT_FOUND, "1")
+
+    monkeypatch.setattr(GenextAPI, "get_generate_chat_request", get)
+    api = GenextAPI("the document", model_name=LlmApiModel.GPT_4o, temperature=0.2)
+
+    with pytest.raises(HTTPError):
+        api.poll_get_generate_chat_request(None, "request-1")
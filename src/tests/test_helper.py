@@ -0,0 +1,114 @@
+import hashlib
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from worker.core.config import settings
+from worker.utils import helper
+
+
+def test_pooled_client_speaks_http2():
+    # raises ImportError when the http2 extra of httpx is not installed
+    client = helper._create_http_client()
+    try:
+        assert client._transport._pool._http2
+    finally:
+        client.close()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(helper, "time", SimpleNamespace(sleep=lambda seconds: None, time=time.time))
+
+
+def _content(size: int) -> bytes:
+    return bytes(i % 251 for i in range(size))
+
+
+def test_download_streams_the_file_and_returns_its_validators(file_server, tmp_path):
+    file_server.files["document.docx"] = _content(1000)
+
+    validators = helper.download_file(file_server.url("document.docx"), str(tmp_path / "document.docx"))
+
+    assert (tmp_path / "document.docx").read_bytes() == _content(1000)
+    assert set(validators) == {"etag"}
+    assert [request.method for request in file_server.requests] == ["HEAD", "GET"]
+    assert not (tmp_path / "document.docx.part").exists()
+
+
+def test_truncated_transfer_resumes_from_the_last_byte(file_server, tmp_path):
+    file_server.files["document.docx"] = _content(1000)
+    file_server.cuts = [300, 200]
+
+    helper.download_file(file_server.url("document.docx"), str(tmp_path / "document.docx"))
+
+    assert (tmp_path / "document.docx").read_bytes() == _content(1000)
+    ranges = [request.headers.get("range") for request in file_server.gets("document.docx")]
+    assert ranges == [None, "bytes=300-", "bytes=500-"]
+
+
+def test_transfer_restarts_when_the_server_ignores_ranges(file_server, tmp_path):
+    file_server.files["document.docx"] = _content(1000)
+    file_server.ranges = False
+    file_server.cuts = [300]
+
+    helper.download_file(file_server.url("document.docx"), str(tmp_path / "document.docx"))
+
+    assert (tmp_path / "document.docx").read_bytes() == _content(1000)
+
+
+def test_large_files_are_assembled_from_parallel_ranges(file_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DOWNLOAD_PARALLEL_THRESHOLD", 100)
+    monkeypatch.setattr(settings, "DOWNLOAD_MAX_PARTS", 4)
+    file_server.files["document.pdf"] = _content(1000)
+    # one of the ranges breaks off and is resumed
+    file_server.cuts = [50]
+
+    helper.download_file(file_server.url("document.pdf"), str(tmp_path / "document.pdf"))
+
+    assert (tmp_path / "document.pdf").read_bytes() == _content(1000)
+    ranges = {request.headers["range"] for request in file_server.gets("document.pdf")}
+    assert {"bytes=0-249", "bytes=250-499", "bytes=500-749", "bytes=750-999"} <= ranges
+    assert len(ranges) == 5
+
+
+def test_download_without_head_falls_back_to_a_plain_get(file_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "DOWNLOAD_PARALLEL_THRESHOLD", 100)
+    file_server.files["document.pdf"] = _content(1000)
+    file_server.head = False
+
+    validators = helper.download_file(file_server.url("document.pdf"), str(tmp_path / "document.pdf"))
+
+    assert (tmp_path / "document.pdf").read_bytes() == _content(1000)
+    assert validators == {}
+    assert [request.headers.get("range") for request in file_server.gets("document.pdf")] == [None]
+
+
+@pytest.mark.parametrize("expected", [
+    {"expected_size": 999},
+    {"expected_sha256": hashlib.sha256(b"something else").hexdigest()},
+])
+def test_mismatching_downloads_raise_and_leave_no_file(file_server, tmp_path, expected):
+    file_server.files["document.docx"] = _content(1000)
+
+    with pytest.raises(helper.DownloadError):
+        helper.download_file(file_server.url("document.docx"), str(tmp_path / "document.docx"), **expected)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_matching_sha256_is_accepted(file_server, tmp_path):
+    file_server.files["document.docx"] = _content(1000)
+
+    helper.download_file(file_server.url("document.docx"), str(tmp_path / "document.docx"),
+                         expected_size=1000, expected_sha256=hashlib.sha256(_content(1000)).hexdigest().upper())
+
+    assert (tmp_path / "document.docx").read_bytes() == _content(1000)
+
+
+def test_missing_files_raise_a_download_error(file_server, tmp_path):
+    with pytest.raises(helper.DownloadError):
+        helper.download_file(file_server.url("missing.docx"), str(tmp_path / "missing.docx"))
+
+    assert list(tmp_path.iterdir()) == []
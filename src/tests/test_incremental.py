@@ -0,0 +1,63 @@
+import json
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+
+from worker.utils import evaluate_doc, incremental
+from worker.utils.prompt_builder import PromptChunk
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(incremental, "get_artifact_store", lambda: SimpleNamespace(redis=client))
+    return client
+
+
+def _chunk(tokens: int) -> PromptChunk:
+    return PromptChunk(prompt="", tokens=tokens)
+
+
+def test_failed_single_chunk_keeps_no_score():
+    assert evaluate_doc._merge_chunk_results([(None, "failed", "gpt-4o")], [_chunk(10)]) == \
+        (None, "failed", "gpt-4o")
+
+
+def test_failed_chunk_fails_the_rule():
+    score, _, model = evaluate_doc._merge_chunk_results(
+        [(8, "fine", "gpt-4o"), (None, "failed", "gpt-4o")], [_chunk(10), _chunk(10)])
+    assert score is None
+    assert model == "gpt-4o"
+
+
+def test_put_many_skips_rules_without_score(redis_client):
+    store = incremental.FindingStore(ttl=60)
+
+    store.put_many("org", {"scored": (0, "Nothing found.", "gpt-4o"), "failed": (None, "failed", "gpt-4o")})
+
+    assert json.loads(redis_client.get("finding:org:scored"))["score"] == 0
+    assert redis_client.get("finding:org:failed") is None
+
+
+def test_failed_rules_are_evaluated_again(redis_client, monkeypatch):
+    calls = []
+
+    def evaluate_rule_routed(rule_id, rule, prompt, route, start=0, content=None):
+        calls.append(rule_id)
+        return (None, f"Evaluation failed for rule {rule_id}", "gpt-4o") if rule_id == "R2" else \
+            (6, "Fine.", "gpt-4o")
+
+    monkeypatch.setattr(evaluate_doc, "evaluate_rule_routed", evaluate_rule_routed)
+    monkeypatch.setattr(incremental, "evaluation_fingerprints",
+                        lambda document, checklist: [("section", rule_id) for rule_id in checklist.rule_ids])
+    checklist = evaluate_doc.ParsedChecklist("checklist", ("A", "B"), ("Rule ID: R1", "Rule ID: R2"), ("R1", "R2"))
+    document = SimpleNamespace(content_hash="document", text="", section_text=lambda section: f"Text of {section}")
+
+    first = incremental.evaluate_incrementally("org", document, checklist, max_workers=1, batch_rules=False)
+    second = incremental.evaluate_incrementally("org", document, checklist, max_workers=1, batch_rules=False)
+
+    assert first.findings[1]["failed"] is True and first.findings[1]["score"] == 0
+    assert "timed_out" not in first.findings[1]
+    assert (second.reused, second.rescored) == (1, 1)
+    assert calls == ["R1", "R2", "R2"]
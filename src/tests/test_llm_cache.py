@@ -0,0 +1,81 @@
+from types import SimpleNamespace
+
+import fakeredis
+import pytest
+
+from worker.utils import llm_cache
+from worker.utils.llm_cache import RedisResponseCache
+
+
+@pytest.fixture(autouse=True)
+def fake_redis(monkeypatch):
+    monkeypatch.setattr(llm_cache.redis.Redis, "from_url", lambda url: fakeredis.FakeRedis())
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def _cache(max_entries: int = 10) -> RedisResponseCache:
+    return RedisResponseCache("redis://localhost:6379/0", ttl=60, max_entries=max_entries)
+
+
+def _expire(cache: RedisResponseCache, *keys: str):
+    # what Redis does once the ttl of the entries passed
+    cache.redis.delete(*[cache._key(key) for key in keys])
+
+
+def _indexed(cache: RedisResponseCache) -> set:
+    members = {member.decode() for member in cache.redis.zrange(cache.index_key, 0, -1)}
+    assert members == {member.decode() for member in cache.redis.zrange(cache.written_key, 0, -1)}
+    return members
+
+
+def test_expired_entries_leave_the_index(clock):
+    cache = _cache()
+    cache.set("a", {"completion": "a"})
+    cache.set("b", {"completion": "b"})
+    clock[0] += 61
+    _expire(cache, "a", "b")
+
+    cache.set("c", {"completion": "c"})
+
+    assert _indexed(cache) == {"c"}
+
+
+def test_eviction_only_counts_live_entries(clock):
+    cache = _cache(max_entries=2)
+    cache.set("a", {"completion": "a"})
+    clock[0] += 30
+    cache.set("b", {"completion": "b"})
+    clock[0] += 29
+    # used last after b was written, but a expires with the ttl of its write
+    assert cache.get("a") is not None
+    clock[0] += 2
+    _expire(cache, "a")
+    cache.set("c", {"completion": "c"})
+    cache.set("d", {"completion": "d"})
+
+    # the expired a freed no room, b is the least recently used live entry
+    assert cache.get("b") is None
+    assert cache.get("c") == {"completion": "c"}
+    assert cache.get("d") == {"completion": "d"}
+    assert _indexed(cache) == {"c", "d"}
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = _cache(max_entries=2)
+    cache.set("a", {"completion": "a"})
+    clock[0] += 1
+    cache.set("b", {"completion": "b"})
+    clock[0] += 1
+    assert cache.get("a") is not None
+    clock[0] += 1
+
+    cache.set("c", {"completion": "c"})
+
+    assert cache.get("b") is None
+    assert _indexed(cache) == {"a", "c"}
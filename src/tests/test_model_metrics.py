@@ -0,0 +1,17 @@
+from worker.utils.model_metrics import ModelMetrics
+
+
+def test_counters_are_exported_per_model(metric_reader):
+    metrics = ModelMetrics(metric_reader.meter)
+
+    metrics.record("gpt-4o", 1.5, prompt_tokens=1000, completion_tokens=200)
+    metrics.record("gpt-4o", 0.5, prompt_tokens=500, completion_tokens=0, failed=True)
+    metrics.increment("gpt-4o", "escalations")
+
+    exported = metric_reader.exported()
+    assert exported[("genext.requests", ("failed", False), ("model", "gpt-4o"))] == 1
+    assert exported[("genext.requests", ("failed", True), ("model", "gpt-4o"))] == 1
+    assert exported[("genext.tokens", ("model", "gpt-4o"), ("type", "prompt"))] == 1500
+    assert exported[("genext.events", ("event", "escalations"), ("model", "gpt-4o"))] == 1
+    assert exported[("genext.request.duration", ("model", "gpt-4o"))] == 2
+    assert abs(exported[("genext.cost", ("model", "gpt-4o"))] - metrics.snapshot()["gpt-4o"]["cost_usd"]) < 1e-9
@@ -0,0 +1,113 @@
+import time
+
+import fakeredis
+import pytest
+
+from worker.core.config import settings
+from worker.utils.genext import DeadlineExceededError
+from worker.utils.rate_limiter import RateLimiter
+
+
+def _limiter(rpm: int = 60, tpm: int = 10_000) -> RateLimiter:
+    return RateLimiter(fakeredis.FakeRedis(), {"gpt-4o": (rpm, tpm)}, (rpm, tpm), max_wait=60)
+
+
+def _factor(limiter: RateLimiter, model: str = "gpt-4o") -> float:
+    return float(limiter.redis.hget(limiter._key(model), "factor") or 1.0)
+
+
+def test_request_bucket_refills_at_rpm():
+    limiter = _limiter(rpm=2)
+
+    assert limiter.try_acquire("gpt-4o", 10)
+    assert limiter.try_acquire("gpt-4o", 10)
+    # the next request is due once a full request refilled, 60 / rpm seconds
+    assert limiter._try_acquire("gpt-4o", 10) == pytest.approx(30, abs=0.5)
+
+
+def test_token_bucket_waits_for_missing_tokens():
+    limiter = _limiter(rpm=600, tpm=1000)
+
+    assert limiter.try_acquire("gpt-4o", 600)
+    # 200 tokens of the 600 are missing, at 1000 tokens per minute
+    assert limiter._try_acquire("gpt-4o", 600) == pytest.approx(12, abs=0.5)
+    # a request larger than the whole budget is capped instead of waiting forever
+    assert limiter._try_acquire("gpt-4o", 10**9) == pytest.approx(60 * 0.6, abs=0.5)
+
+
+def test_models_have_separate_buckets():
+    limiter = _limiter(rpm=1)
+
+    assert limiter.try_acquire("gpt-4o", 10)
+    assert not limiter.try_acquire("gpt-4o", 10)
+    assert limiter.try_acquire("anthropic.claude-3-haiku-20240307-v1:0", 10)
+
+
+def test_acquire_gives_up_before_the_deadline():
+    limiter = _limiter(rpm=1)
+    limiter.acquire("gpt-4o", 10)
+
+    with pytest.raises(DeadlineExceededError):
+        limiter.acquire("gpt-4o", 10, deadline=time.monotonic() + 1)
+
+
+def test_throttle_blocks_the_model_until_retry_after():
+    limiter = _limiter()
+
+    limiter.throttle("gpt-4o", retry_after=5)
+
+    assert limiter._try_acquire("gpt-4o", 10) == pytest.approx(5, abs=0.5)
+
+
+def test_concurrent_429s_decrease_the_budget_once():
+    limiter = _limiter()
+
+    # every worker in flight reports the same 429 window
+    for _ in range(5):
+        limiter.throttle("gpt-4o", retry_after=0.2)
+
+    assert _factor(limiter) == pytest.approx(settings.GENEXT_RATE_LIMIT_DECREASE)
+
+    # a 429 after the window is a new one
+    time.sleep(0.25)
+    limiter.throttle("gpt-4o", retry_after=0.2)
+    assert _factor(limiter) == pytest.approx(settings.GENEXT_RATE_LIMIT_DECREASE ** 2)
+
+
+def test_throttle_extends_the_block_of_a_later_retry_after():
+    limiter = _limiter()
+
+    limiter.throttle("gpt-4o", retry_after=1)
+    limiter.throttle("gpt-4o", retry_after=5)
+
+    assert limiter._try_acquire("gpt-4o", 10) == pytest.approx(5, abs=0.5)
+    assert _factor(limiter) == pytest.approx(settings.GENEXT_RATE_LIMIT_DECREASE)
+
+
+def test_budget_never_drops_below_the_minimum_factor():
+    limiter = _limiter()
+
+    for _ in range(30):
+        limiter.throttle("gpt-4o", retry_after=0)
+
+    assert _factor(limiter) == pytest.approx(settings.GENEXT_RATE_LIMIT_MIN_FACTOR)
+
+
+def test_successes_recover_the_budget_additively():
+    limiter = _limiter()
+    limiter.throttle("gpt-4o", retry_after=0)
+
+    limiter.success("gpt-4o")
+    assert _factor(limiter) == pytest.approx(settings.GENEXT_RATE_LIMIT_DECREASE + settings.GENEXT_RATE_LIMIT_INCREASE)
+
+    for _ in range(100):
+        limiter.success("gpt-4o")
+    assert _factor(limiter) == 1.0
+
+
+def test_throttled_factor_scales_the_budget():
+    limiter = _limiter(rpm=10)
+    limiter.throttle("gpt-4o", retry_after=0)
+
+    # 10 * 0.7 requests per minute, the bucket restarts empty after the 429
+    assert limiter._try_acquire("gpt-4o", 10) == pytest.approx(60 / (10 * settings.GENEXT_RATE_LIMIT_DECREASE), abs=0.5)
@@ -0,0 +1,69 @@
+import threading
+
+import numpy as np
+import pytest
+
+from worker.core.config import settings
+from worker.utils import embeddings, retrieval
+from worker.utils.embeddings import EmbeddingCoalescer
+from worker.utils.retrieval import DocumentRetriever, embed_texts
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    """The texts of every embedding request, each text embeds as ``[len(text)]``."""
+    sent = []
+
+    def embed_group(texts):
+        sent.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(embeddings, "_embed_group", embed_group)
+    # a batch is only sent once two texts are queued
+    monkeypatch.setattr(embeddings, "_coalescer", EmbeddingCoalescer(batch_size=2, max_wait=5))
+    return sent
+
+
+def test_concurrent_rule_embeddings_share_a_request(requests):
+    results = {}
+
+    def embed(text):
+        results[text] = embed_texts([text], coalesce=True)
+
+    threads = [threading.Thread(target=embed, args=(text,)) for text in ("rule one", "rule number two")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert len(requests) == 1 and sorted(requests[0]) == ["rule number two", "rule one"]
+    np.testing.assert_array_equal(results["rule one"], [[8.0]])
+    np.testing.assert_array_equal(results["rule number two"], [[15.0]])
+
+
+def test_cached_texts_are_not_sent_again(requests):
+    embed_texts(["chunk a", "chunk bb"])
+    assert requests == [["chunk a", "chunk bb"]]
+
+    np.testing.assert_array_equal(embed_texts(["chunk bb", "chunk a"], coalesce=True), [[8.0], [7.0]])
+    assert len(requests) == 1
+
+
+def test_retrieved_neighbours_do_not_repeat_their_overlap(monkeypatch):
+    monkeypatch.setattr(settings, "RETRIEVAL_CHUNK_TOKENS", 40)
+    monkeypatch.setattr(settings, "RETRIEVAL_CHUNK_OVERLAP_TOKENS", 10)
+    # one direction per chunk, a query is closest to the chunks it adds up
+    monkeypatch.setattr(retrieval, "embed_texts", lambda texts: np.eye(len(texts), dtype=np.float32))
+    text = "".join(f"Line {i} of the recovery plan.\n" for i in range(40))
+    retriever = DocumentRetriever(text)
+    assert len(retriever.chunks) > 3
+    assert retriever.chunks[1].startswith(retriever.chunks[0].splitlines(keepends=True)[-1])
+
+    query = np.zeros((1, len(retriever.chunks)), dtype=np.float32)
+    query[0, [0, 1, 3]] = 1.0
+    joined, = retriever.retrieve(query, k=3)
+
+    first, _ = retriever.spans[0]
+    _, second = retriever.spans[1]
+    start, end = retriever.spans[3]
+    assert joined == text[first:second] + text[start:end]
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from worker.utils.doc_tree import DocTreeBuilder
+from worker.utils.section_index import SectionIndex
+
+TEXTS = [
+    ("Scope", "Heading 1"),
+    ("The scope of the recovery plan covers the data centre.", "Normal"),
+    ("Roles and responsibilities", "Heading 2"),
+    ("The incident manager_on_call escalates to the CIO.", "Normal"),
+    ("Recovery procedures", "Heading 1"),
+    ("Restore the backups (nightly, weekly) in this order.", "Normal"),
+    ("['Owner', 'Recovery time']", "Table_0_Row_1"),
+]
+
+
+@pytest.fixture
+def tree():
+    builder = DocTreeBuilder()
+    parent = 0
+    for text, style in TEXTS:
+        if style.startswith("Heading"):
+            parent = builder.add(text, style, int(style.split()[1]), 0 if style == "Heading 1" else parent)
+        else:
+            builder.add(text, style, 3, parent)
+    return builder.build()
+
+
+def _substrings(tree, count: int):
+    texts = [tree.text(i).lower() for i in range(len(tree))]
+    rng = random.Random(7)
+    for _ in range(count):
+        text = rng.choice(texts[1:])
+        start = rng.randrange(len(text))
+        yield text[start:start + rng.randint(1, 25)]
+
+
+def test_matches_every_node_containing_the_text(tree):
+    index = SectionIndex(tree, fuzzy=False)
+    searches = list(_substrings(tree, 500)) + ["SCOPE", "cope of", "scope plan", "manager_on", ", weekly)", "xyz"]
+
+    for search in searches:
+        expected = [i for i in range(len(tree)) if search.lower() in tree.text(i).lower()]
+        assert [start for start, _ in index.spans(search)] == expected, search
+
+
+def test_fuzzy_matches_only_headings(tree):
+    index = SectionIndex(tree, fuzzy=True, fuzzy_cutoff=0.8)
+
+    assert [tree.text(start) for start, _ in index.spans("Recovery procedure steps")] == ["Recovery procedures"]
+    # close to a paragraph, but paragraphs are not sections
+    assert index.spans("The incident manager on call escalates to the CEO") == []
+
+
+def test_long_words_are_indexed_in_linear_space():
+    # text extracted from a PDF without spaces ends up as one long word
+    text = "".join(f"clause{i}recovery" for i in range(5000))
+    builder = DocTreeBuilder()
+    builder.add("Appendix", "Heading 1", 1, 0)
+    builder.add(text, "Normal", 2, 1)
+    index = SectionIndex(builder.build(), fuzzy=False)
+
+    assert sum(len(tokens) for tokens in index.grams.values()) <= 3 * len(text)
+    assert [start for start, _ in index.spans("clause4999rec")] == [2]
+    assert [start for start, _ in index.spans("1234recovery clause")] == []
+    assert [start for start, _ in index.spans("ause12recove")] == [2]
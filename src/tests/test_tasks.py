@@ -0,0 +1,63 @@
+import pytest
+
+from worker.core.config import settings
+from worker.services import tasks
+
+
+@pytest.fixture
+def job(monkeypatch, tmp_path):
+    """A job whose downloads write ``files[name]``, returns the job status updates."""
+    monkeypatch.setattr(settings, "JOB_SCRATCH_DIR", str(tmp_path))
+    monkeypatch.setattr(tasks, "get_job_info", lambda org, job_id: {
+        "job_name": "job", "repo_name": "repo", "checklist_file_path": "checklist.yaml",
+        "sandbox_name": "sandbox", "document_url": "document.docx",
+    })
+    files = {"checklist.yaml": b"", "document.docx": b""}
+
+    def fetch_file(url, local_path):
+        with open(local_path, "wb") as file:
+            file.write(files[local_path.rsplit("/", 1)[-1]])
+
+    monkeypatch.setattr(tasks, "fetch_file", fetch_file)
+    updates = []
+    monkeypatch.setattr(tasks, "update_job_status",
+                        lambda org, job_id, job_name, status, **kwargs: updates.append((status, kwargs)))
+    return files, updates
+
+
+@pytest.mark.parametrize("fan_out", [False, True])
+def test_invalid_checklist_fails_the_job(job, monkeypatch, fan_out):
+    files, updates = job
+    files["checklist.yaml"] = b"""
+sections:
+  - section_text: Scope
+    validation_rules:
+      - rule_id: S1
+        prompt: Is the scope stated?
+      - rule_id: S1
+        prompt: Is the scope bounded?
+"""
+    monkeypatch.setattr(settings, "EVAL_FAN_OUT", fan_out)
+
+    tasks.run_evaluation("org", "job-1")
+
+    assert updates == [
+        ("running", {}),
+        ("failed", {"errors": ["checklist: Value error, rule_id 'S1' is used more than once"]}),
+    ]
+
+
+def test_reused_and_rescored_rules_are_exported(monkeypatch, metric_reader):
+    monkeypatch.setattr(tasks, "evaluated_rules", metric_reader.meter.create_counter("evaluation.rules"))
+    monkeypatch.setattr(tasks, "add_job_findings", lambda *args: None)
+    monkeypatch.setattr(tasks, "update_job_status", lambda *args, **kwargs: None)
+    results = [
+        {"rows": [[0, {"score": 7}], [1, {"score": 5}]], "reused": 2, "rescored": 0},
+        {"rows": [[2, {"score": 9}]], "reused": 0, "rescored": 1},
+    ]
+
+    tasks.finalize_evaluation(results, "org", "job-1", "job")
+
+    exported = metric_reader.exported()
+    assert exported[("evaluation.rules", ("source", "reused"))] == 2
+    assert exported[("evaluation.rules", ("source", "rescored"))] == 1
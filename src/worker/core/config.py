@@ -55,6 +55,23 @@ class Settings(BaseSettings):
 
     # Eval API Base path
     EVAL_API_BASE_PATH: str
+    EVAL_API_TIMEOUT: float = 30.0
+    EVAL_API_CONNECT_TIMEOUT: float = 5.0
+    EVAL_API_MAX_CONNECTIONS: int = 20
+    EVAL_API_RETRIES: int = 4
+
+    # Downloads
+    DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024
+    DOWNLOAD_PARALLEL_THRESHOLD: int = 32 * 1024 * 1024
+    DOWNLOAD_MAX_PARTS: int = 4
+    DOWNLOAD_RETRIES: int = 3
+    # worker-local cache of downloaded checklists and documents, revalidated with ETag / Last-Modified
+    FILE_CACHE_ENABLED: bool = False
+    FILE_CACHE_DIR: str = "/tmp/doc_evaluator/file_cache"
+    FILE_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    # per-job scratch folders (system temp dir when unset), older ones are left over from killed workers
+    JOB_SCRATCH_DIR: str | None = None
+    JOB_SCRATCH_MAX_AGE: int = 24 * 3600
 
     # Celery
     CELERY_BROKER_URL: str
@@ -68,6 +85,95 @@ class Settings(BaseSettings):
     CLIENT_ID_PROD: str
     CLIENT_SECRET_PROD: str
     TENANT_ID_PROD: str
+    GENEXT_POOL_MAXSIZE: int = 16
+    GENEXT_POLL_INITIAL_INTERVAL: float = 0.5
+    GENEXT_POLL_MAX_INTERVAL: float = 5.0
+    GENEXT_POLL_TIMEOUT: float = 300.0
+    # requests are retried on 429 and 5xx, honouring Retry-After
+    GENEXT_MAX_RETRIES: int = 4
+    # token buckets in Redis shared by all workers, per model requests and tokens per minute
+    GENEXT_RATE_LIMIT: bool = False
+    GENEXT_RATE_LIMIT_REDIS_URL: str | None = None
+    GENEXT_DEFAULT_RPM: int = 60
+    GENEXT_DEFAULT_TPM: int = 90_000
+    # e.g. {"gpt-4o": [300, 300000]}
+    GENEXT_MODEL_LIMITS: dict[str, tuple[int, int]] = {}
+    GENEXT_RATE_LIMIT_MAX_WAIT: float = 300.0
+    GENEXT_RATE_LIMIT_DEFAULT_BACKOFF: float = 10.0
+    GENEXT_RATE_LIMIT_DECREASE: float = 0.7
+    GENEXT_RATE_LIMIT_INCREASE: float = 0.02
+    GENEXT_RATE_LIMIT_MIN_FACTOR: float = 0.1
+    # USD per 1000 prompt and completion tokens per model, e.g. {"gpt-4o": [0.005, 0.015]}
+    GENEXT_MODEL_PRICES: dict[str, tuple[float, float]] = {}
+    # send a duplicate chat request when the first one is still pending after this
+    # percentile of the recent latencies of its model, the first answer wins
+    GENEXT_HEDGE: bool = False
+    GENEXT_HEDGE_PERCENTILE: float = 95.0
+    GENEXT_HEDGE_MIN_SAMPLES: int = 20
+    GENEXT_HEDGE_MIN_DELAY: float = 2.0
+
+    # LLM response cache
+    LLM_CACHE_BACKEND: Literal["none", "redis", "disk"] = "none"
+    LLM_CACHE_REDIS_URL: str | None = None
+    LLM_CACHE_DIR: str = "/tmp/doc_evaluator/llm_cache"
+    LLM_CACHE_TTL: int = 7 * 24 * 3600
+    LLM_CACHE_MAX_ENTRIES: int = 100_000
+    LLM_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    # also cache answers generated with temperature > 0
+    LLM_CACHE_NONDETERMINISTIC: bool = False
+
+    # Evaluation
+    EVAL_MAX_CONCURRENCY: int = 8
+    # ask all rules of a section in one request, with per-rule fallback
+    EVAL_BATCH_RULES: bool = False
+    # parsed artifacts kept in memory per worker process, keyed by file content hash
+    DOCUMENT_CACHE_SIZE: int = 8
+    CHECKLIST_CACHE_SIZE: int = 64
+    # fall back to the closest heading when a section_text is not found verbatim
+    SECTION_FUZZY_MATCH: bool = False
+    SECTION_FUZZY_CUTOFF: float = 0.85
+    # prompts above the model context (or PROMPT_MAX_TOKENS when set) are chunked
+    PROMPT_MAX_TOKENS: int | None = None
+    PROMPT_CHUNK_OVERLAP_TOKENS: int = 200
+    PROMPT_SCORE_REDUCTION: Literal["min", "max", "mean", "weighted_mean"] = "min"
+    # send only the top-k most similar chunks for rules without a matching section
+    EVAL_RETRIEVAL: bool = False
+    RETRIEVAL_TOP_K: int = 5
+    RETRIEVAL_CHUNK_TOKENS: int = 400
+    RETRIEVAL_CHUNK_OVERLAP_TOKENS: int = 50
+    EMBEDDING_CACHE_SIZE: int = 20_000
+    EMBEDDING_BATCH_SIZE: int = 16
+    EMBEDDING_COALESCE_WAIT: float = 0.02
+    # PDFs with at least PDF_PARALLEL_MIN_PAGES pages are extracted in a process pool
+    PDF_PARALLEL_MIN_PAGES: int = 16
+    PDF_PAGES_PER_TASK: int = 8
+    PDF_MAX_WORKERS: int | None = None
+    # load only the parts of a document containing the checklist sections (PDFs with an outline)
+    LAZY_SECTION_LOADING: bool = False
+    # evaluate with the cheapest model first, escalate when the score is in the band or does not parse;
+    # checklists can override this with a ``routing`` entry
+    EVAL_ROUTING: bool = False
+    EVAL_ROUTE_MODELS: list[str] = ["HAIKU", "GPT_4o"]
+    EVAL_ESCALATE_BAND: tuple[int, int] = (4, 7)
+    # seconds a rule (or chunk of a rule) may take including retries and escalations, a rule
+    # without a score by then is reported as timed out and the job as partial
+    EVAL_RULE_DEADLINE: float | None = None
+    # split a job into a chord of subtasks of EVAL_FAN_OUT_RULES rules each
+    EVAL_FAN_OUT: bool = False
+    EVAL_FAN_OUT_RULES: int = 5
+    # parsed documents and checklists shared with the subtasks, defaults to the result backend
+    ARTIFACT_STORE_URL: str | None = None
+    ARTIFACT_STORE_TTL: int = 6 * 3600
+    # share compiled checklists between workers by content hash, see worker.utils.checklist_compiler
+    CHECKLIST_PRECOMPILED: bool = False
+    CHECKLIST_COMPILED_TTL: int = 30 * 24 * 3600
+    # reuse the findings of (section, rule) pairs whose fingerprints did not change
+    EVAL_INCREMENTAL: bool = False
+    FINDING_REUSE_TTL: int = 90 * 24 * 3600
+    # post findings in batches while the rules complete instead of once at the end
+    EVAL_STREAM_FINDINGS: bool = False
+    FINDINGS_BATCH_SIZE: int = 10
+    FINDINGS_FLUSH_INTERVAL: float = 5.0
 
 
     @computed_field  # type: ignore[prop-decorator]
@@ -1,13 +1,17 @@
 from celery import Celery, signals
-from opentelemetry import trace
+from opentelemetry import metrics, trace
+from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
 from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
 from opentelemetry.instrumentation.celery import CeleryInstrumentor
 from opentelemetry.instrumentation.redis import RedisInstrumentor
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
 from opentelemetry.sdk.trace import TracerProvider
 from opentelemetry.sdk.trace.export import BatchSpanProcessor
 from opentelemetry.sdk.resources import Resource
 
 from worker.core.config import settings
+from worker.utils.helper import clean_stale_scratch, close_http_client, init_http_client
 
 # Set up OpenTelemetry
 resource = Resource.create({
@@ -27,6 +31,12 @@ trace.get_tracer_provider().add_span_processor(
     BatchSpanProcessor(otlp_exporter)
 )
 
+# Export the per-model request, token and cost metrics the same way
+metrics.set_meter_provider(MeterProvider(
+    resource=resource,
+    metric_readers=[PeriodicExportingMetricReader(OTLPMetricExporter(endpoint=settings.OTLP_ENDPOINT, insecure=True))],
+))
+
 # Instrument Redis - this will automatically instrument all Redis clients
 RedisInstrumentor().instrument(
     trace_internal_commands=True,  # Optional: trace Redis internal commands
@@ -49,6 +59,24 @@ celery_app.conf.update(
     enable_utc=True,
 )
 
+# One pooled HTTP client per worker process for the evaluation API
+@signals.worker_process_init.connect
+def init_worker_http_client(**kwargs):
+    init_http_client()
+
+
+# scratch folders of jobs killed with the previous worker are never cleaned up otherwise
+@signals.worker_init.connect
+def clean_worker_scratch(**kwargs):
+    clean_stale_scratch()
+
+
+@signals.worker_process_shutdown.connect
+@signals.worker_shutdown.connect
+def close_worker_http_client(**kwargs):
+    close_http_client()
+
+
 # # Add Celery task ID to trace
 # @signals.task_prerun.connect
 # def add_task_id_to_span(task_id, task, *args, **kwargs):
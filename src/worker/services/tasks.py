@@ -1,16 +1,31 @@
+from celery import chord
+from worker.core.config import settings
 from worker.eval_app import celery_app
+from worker.utils.artifact_store import restore_checklist, restore_document, save_checklist, save_document
+from worker.utils.checklist_compiler import ChecklistError, compile_checklist, save_compiled_checklist
 from worker.utils.document_loader import PDFLoader, WordLoader
-from opentelemetry import trace
-from worker.utils.evaluate_doc import perform_evaluation
-from worker.utils.helper import download_file, get_job_info, create_temp_folder, update_job_status, add_job_findings
+from opentelemetry import metrics, trace
+from worker.utils.evaluate_doc import (
+    checklist_subset, document_sections, load_checklist, load_document, perform_evaluation,
+)
+from worker.utils.finding_stream import FindingStream
+from worker.utils.incremental import evaluate_incrementally
+from worker.utils.file_cache import fetch_file, get_file_cache
+from worker.utils.helper import get_job_info, job_scratch, update_job_status, add_job_findings
 tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 # Configure logger
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+evaluated_rules = meter.create_counter("evaluation.rules", unit="{rule}",
+                                       description="Rules of finished jobs, by reused or re-scored")
+
 
 @celery_app.task
 def run_evaluation(org:str, job_id: str):
@@ -25,32 +40,56 @@ def run_evaluation(org:str, job_id: str):
     sandbox_name=job_info["sandbox_name"]
     sandbox_filename=job_info["document_url"]
 
-    # create a temp folder
-    temp_folder = create_temp_folder()
-    logger.info(f"Temporary directory created at: {temp_folder}")
+    # the downloads only live as long as the job, parsed artifacts are cached by content
+    with job_scratch(job_id) as temp_folder:
+        # download the checklist and the document file concurrently
+        checklist_file_path = os.path.join(temp_folder, repository_filename)
+        CHECKLIST_ENDPOINT=checklist_endpoint(org, repository, repository_filename)
+        document_file_path = os.path.join(temp_folder, sandbox_filename)
+        SANDBOX_DOC_ENDPOINT=f"http://10.22.98.9:9000/api/v1/orgs/{org}/sandboxes/{sandbox_name}/files/download?filename={sandbox_filename}"
+        with ThreadPoolExecutor(max_workers=2, thread_name_prefix="download") as executor:
+            checklist_download = executor.submit(fetch_file, CHECKLIST_ENDPOINT, checklist_file_path)
+            document_download = executor.submit(fetch_file, SANDBOX_DOC_ENDPOINT, document_file_path)
+            checklist_download.result()
+            logger.info(f"Checklist file downloaded to {checklist_file_path}")
+            document_download.result()
+            logger.info(f"Document file downloaded to {document_file_path}")
+        report_file_cache(job_id)
 
-    # download the checklist file
-    checklist_file_path = os.path.join(temp_folder, repository_filename)
-    CHECKLIST_ENDPOINT=f"http://10.22.98.9:9000/api/v1/orgs/{org}/repos/{repository}/checklist?filename={repository_filename}"
-    download_file(CHECKLIST_ENDPOINT, checklist_file_path)
-    logger.info(f"Checklist file downloaded to {checklist_file_path}")
+        # a malformed checklist fails the job with its problems instead of the task
+        try:
+            checklist = load_checklist(checklist_file_path)
+        except ChecklistError as e:
+            logger.error(f"Job {job_id}: checklist {repository_filename} is invalid: {e.errors}")
+            update_job_status(org, job_id, job_info['job_name'], "failed", errors=e.errors)
+            return
 
-    # download the document file
-    document_file_path = os.path.join(temp_folder, sandbox_filename)
-    SANDBOX_DOC_ENDPOINT=f"http://10.22.98.9:9000/api/v1/orgs/{org}/sandboxes/{sandbox_name}/files/download?filename={sandbox_filename}"
-    download_file(SANDBOX_DOC_ENDPOINT, document_file_path)
-    logger.info(f"Document file downloaded to {document_file_path}")
+        if settings.EVAL_FAN_OUT:
+            fan_out_evaluation(org, job_id, job_info['job_name'], document_file_path, checklist_file_path)
+            return
 
-    # perform evaluation
-    findings = perform_evaluation(document_file_path, checklist_file_path) 
+        # perform evaluation
+        if settings.EVAL_INCREMENTAL or settings.EVAL_STREAM_FINDINGS:
+            stream = job_stream(org, job_id, job_info['job_name'], len(checklist.rules))
+            evaluation = evaluate_incrementally(org if settings.EVAL_INCREMENTAL else None,
+                                                load_document(document_file_path, document_sections(checklist)), checklist,
+                                                on_finding=stream_finding(stream))
+            report_reuse(job_id, evaluation.reused, evaluation.rescored)
+            findings = evaluation.findings
+        else:
+            stream = None
+            findings = perform_evaluation(document_file_path, checklist_file_path)
 
 
-    # add findings to the job
-    add_job_findings(org, job_id, job_info['job_name'], findings)
+        # add findings to the job
+        if stream is not None:
+            stream.close()
+        else:
+            add_job_findings(org, job_id, job_info['job_name'], findings)
 
-    # complete the job
+        # complete the job
 
-    update_job_status(org, job_id, job_info['job_name'], "completed")
+        update_job_status(org, job_id, job_info['job_name'], "completed", partial=is_partial(job_id, findings))
     
     
 
@@ -62,6 +101,136 @@ def run_evaluation(org:str, job_id: str):
     # yaml_file_path = '/home/qxz1viq/doc_eval_latest/evaluation_processor/data/checklist.yaml'
     # perform_evaluation(document_path, yaml_file_path)
 
+
+def checklist_endpoint(org: str, repository: str, filename: str) -> str:
+    return f"http://10.22.98.9:9000/api/v1/orgs/{org}/repos/{repository}/checklist?filename={filename}"
+
+
+@celery_app.task
+def validate_checklist(org: str, repository: str, filename: str):
+    """
+    Validate and compile a checklist when it is uploaded.
+
+    Returns ``{"valid": ..., "errors": [...]}`` so the API can reject a
+    malformed checklist right away; a valid one is stored compiled (with
+    CHECKLIST_PRECOMPILED) for the jobs that will use it.
+    """
+    with job_scratch(f"checklist-{org}") as temp_folder:
+        checklist_file_path = os.path.join(temp_folder, os.path.basename(filename))
+        fetch_file(checklist_endpoint(org, repository, filename), checklist_file_path)
+        with open(checklist_file_path, 'rb') as file:
+            data = file.read()
+        try:
+            checklist = compile_checklist(data)
+        except ChecklistError as e:
+            logger.info(f"Checklist {filename} of {org}/{repository} is invalid: {e.errors}")
+            return {"valid": False, "errors": e.errors}
+        if settings.CHECKLIST_PRECOMPILED:
+            save_compiled_checklist(checklist)
+        return {"valid": True, "errors": [], "content_hash": checklist.content_hash, "rules": len(checklist.rules)}
+
+
+def job_stream(org: str, job_id: str, job_name: str, total: int) -> Optional[FindingStream]:
+    return FindingStream(org, job_id, job_name, total) if settings.EVAL_STREAM_FINDINGS else None
+
+
+def stream_finding(stream: Optional[FindingStream]):
+    return (lambda index, finding: stream.add(finding)) if stream is not None else None
+
+
+def is_partial(job_id: str, findings: list) -> bool:
+    timed_out = sum(1 for finding in findings if finding.get("timed_out"))
+    if timed_out:
+        logger.warning(f"Job {job_id}: {timed_out} of {len(findings)} rules missed their deadline")
+    return timed_out > 0
+
+
+def report_file_cache(job_id: str):
+    cache = get_file_cache()
+    if cache is None:
+        return
+    stats = cache.stats()
+    # the counters themselves are exported by the cache, see FileCache
+    logger.info(f"Job {job_id}: file cache hit ratio {stats['hit_ratio']:.0%} "
+                f"({stats['hits']} hits, {stats['misses']} misses, {stats['bytes_saved']} bytes not downloaded)")
+
+
+def report_reuse(job_id: str, reused: int, rescored: int):
+    logger.info(f"Job {job_id}: {reused} rules reused from earlier evaluations, {rescored} rules re-scored")
+    evaluated_rules.add(reused, {"source": "reused"})
+    evaluated_rules.add(rescored, {"source": "rescored"})
+
+
+def fan_out_evaluation(org: str, job_id: str, job_name: str, document_file_path: str, checklist_file_path: str):
+    """
+    Evaluate the job as a chord of ``evaluate_rules`` subtasks.
+
+    The document and checklist are parsed once here and shared through the
+    artifact store, the subtasks only receive the store keys and their rule
+    indices. ``finalize_evaluation`` collects the results and completes the job.
+    """
+    checklist = load_checklist(checklist_file_path)
+    document = load_document(document_file_path, document_sections(checklist))
+    document_key = save_document(document)
+    checklist_key = save_checklist(checklist)
+
+    size = max(settings.EVAL_FAN_OUT_RULES, 1)
+    groups = [list(range(start, min(start + size, len(checklist.rules))))
+              for start in range(0, len(checklist.rules), size)]
+    logger.info(f"Fanning out {len(checklist.rules)} rules of job {job_id} into {len(groups)} subtasks")
+
+    callback = finalize_evaluation.s(org, job_id, job_name).on_error(fail_evaluation.s(org, job_id, job_name))
+    scope = org if settings.EVAL_INCREMENTAL else None
+    job = [org, job_id, job_name, len(checklist.rules)] if settings.EVAL_STREAM_FINDINGS else None
+    chord(evaluate_rules.s(document_key, checklist_key, indices, scope, job) for indices in groups)(callback)
+
+
+@celery_app.task
+def evaluate_rules(document_key: str, checklist_key: str, indices: list, scope: str = None, job: list = None):
+    """
+    Evaluate the checklist rules at ``indices``.
+
+    Returns the ``[index, finding]`` rows and how many rules were reused from
+    earlier evaluations in ``scope`` and how many were re-scored. With ``job``
+    (org, job id, job name, rule count) the findings are posted as they complete.
+    """
+    document = restore_document(document_key)
+    checklist = checklist_subset(restore_checklist(checklist_key), indices)
+    stream = FindingStream(*job) if job else None
+    # at most EVAL_MAX_CONCURRENCY requests per subtask, chunks of one rule count separately
+    evaluation = evaluate_incrementally(scope, document, checklist, on_finding=stream_finding(stream))
+    if stream is not None:
+        stream.close()
+    return {
+        "rows": [[index, finding] for index, finding in zip(indices, evaluation.findings)],
+        "reused": evaluation.reused,
+        "rescored": evaluation.rescored,
+    }
+
+
+@celery_app.task
+def finalize_evaluation(results: list, org: str, job_id: str, job_name: str):
+    # findings keep the checklist order whatever order the subtasks finished in
+    rows = sorted((row for result in results for row in result["rows"]), key=lambda row: row[0])
+    report_reuse(job_id, sum(result["reused"] for result in results), sum(result["rescored"] for result in results))
+    findings = [finding for _, finding in rows]
+    stream = job_stream(org, job_id, job_name, len(findings))
+    if stream is not None:
+        # only findings a subtask could not post are sent again
+        for finding in findings:
+            stream.add(finding)
+        stream.close()
+    else:
+        add_job_findings(org, job_id, job_name, findings)
+    update_job_status(org, job_id, job_name, "completed", partial=is_partial(job_id, findings))
+
+
+@celery_app.task
+def fail_evaluation(request, exc, traceback, org: str, job_id: str, job_name: str):
+    logger.error(f"Evaluation of job {job_id} failed in subtask {request.id}: {exc}")
+    update_job_status(org, job_id, job_name, "failed")
+
+
 # @celery_app.task
 # def run_evaluation(document_path: str):
 #     print(f"Evaluating document {document_path}")
@@ -0,0 +1,35 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Callable
+
+
+class ArtifactCache:
+    """Small thread-safe in-process LRU of derived artifacts keyed by content hash."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        return None
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def get_or_create(self, key: str, factory: Callable[[], Any]) -> Any:
+        value = self.get(key)
+        if value is not None:
+            return value
+        # build outside the lock, a duplicate parse is cheaper than serialising jobs
+        value = factory()
+        self.put(key, value)
+        return value
@@ -0,0 +1,83 @@
+import json
+import logging
+import threading
+import zlib
+from typing import Any, Dict, Optional
+
+import redis
+
+from worker.core.config import settings
+from worker.utils.artifact_cache import ArtifactCache
+from worker.utils.doc_tree import DocTree
+from worker.utils.evaluate_doc import ParsedChecklist, ParsedDocument, document_from_tree
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class ArtifactStore:
+    """
+    Parsed artifacts shared between the tasks of one job through Redis.
+
+    Artifacts are stored as compressed JSON under a key derived from their
+    content hash, so jobs on the same document or checklist share one entry.
+    """
+
+    def __init__(self, url: str, ttl: int, prefix: str = "artifact"):
+        self.redis = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def key(self, kind: str, content_hash: str) -> str:
+        return f"{self.prefix}:{kind}:{content_hash}"
+
+    def put(self, kind: str, content_hash: str, data: Dict[str, Any]) -> str:
+        key = self.key(kind, content_hash)
+        payload = zlib.compress(json.dumps(data).encode("utf-8"))
+        self.redis.set(key, payload, ex=self.ttl)
+        logger.info(f"Stored {kind} artifact {key} ({len(payload)} bytes)")
+        return key
+
+    def get(self, key: str) -> Dict[str, Any]:
+        payload = self.redis.get(key)
+        if payload is None:
+            raise KeyError(f"Artifact {key} is missing or expired")
+        # refresh the ttl while tasks of the job still use it
+        self.redis.expire(key, self.ttl)
+        return json.loads(zlib.decompress(payload))
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+# artifacts already restored in this worker process
+_restored = ArtifactCache(settings.DOCUMENT_CACHE_SIZE + settings.CHECKLIST_CACHE_SIZE)
+
+
+def get_artifact_store() -> ArtifactStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArtifactStore(settings.ARTIFACT_STORE_URL or settings.CELERY_RESULT_BACKEND,
+                                       settings.ARTIFACT_STORE_TTL)
+    return _store
+
+
+def save_document(document: ParsedDocument) -> str:
+    return get_artifact_store().put("document", document.content_hash, document.parser.tree.to_dict())
+
+
+def save_checklist(checklist: ParsedChecklist) -> str:
+    return get_artifact_store().put("checklist", checklist.content_hash, checklist.to_dict())
+
+
+def restore_document(key: str) -> ParsedDocument:
+    content_hash = key.rsplit(":", 1)[-1]
+    return _restored.get_or_create(
+        key, lambda: document_from_tree(content_hash, DocTree.from_dict(get_artifact_store().get(key))))
+
+
+def restore_checklist(key: str) -> ParsedChecklist:
+    return _restored.get_or_create(
+        key, lambda: ParsedChecklist.from_dict(key.rsplit(":", 1)[-1], get_artifact_store().get(key)))
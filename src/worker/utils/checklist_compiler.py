@@ -0,0 +1,231 @@
+import argparse
+import hashlib
+import logging
+import sys
+import threading
+from typing import Annotated, List, Optional, Tuple
+
+import yaml
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, ValidationError, field_validator, model_validator
+
+from worker.core.config import settings
+from worker.utils.artifact_store import ArtifactStore
+from worker.utils.evaluate_doc import EVALUATION_MODEL, ParsedChecklist, build_content
+from worker.utils.model_routing import ModelRoute, default_route, resolve_model
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# bump whenever the rendered rules or system prompts change, older artifacts are recompiled
+COMPILER_VERSION = 1
+
+RULE_TEMPLATE = "Rule ID: {rule_id}\nPrompt: {prompt}\nCriteria: \n{criteria}"
+CRITERION_TEMPLATE = "    - {criterion}\n"
+
+
+class ChecklistError(ValueError):
+    """Raised when a checklist YAML does not match the checklist schema."""
+
+    def __init__(self, errors: List[str]):
+        super().__init__("Invalid checklist:\n" + "\n".join(f"- {error}" for error in errors))
+        self.errors = errors
+
+
+def _empty_if_none(value):
+    # an empty YAML key ("criteria:") loads as None
+    return [] if value is None else value
+
+
+# lists that may be left empty in the YAML
+OptionalList = BeforeValidator(_empty_if_none)
+
+
+class RoutingSpec(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    models: Optional[List[str]] = None
+    escalate_band: Optional[Tuple[int, int]] = None
+
+    @field_validator("models")
+    @classmethod
+    def _known_models(cls, value):
+        if value is not None:
+            if not value:
+                raise ValueError("needs at least one model")
+            for name in value:
+                resolve_model(name)
+        return value
+
+    @field_validator("escalate_band")
+    @classmethod
+    def _ordered(cls, value):
+        if value is not None and value[0] > value[1]:
+            raise ValueError("must be [low, high] with low <= high")
+        return value
+
+    def route(self, base: ModelRoute) -> ModelRoute:
+        return ModelRoute.from_dict(self.model_dump(exclude_none=True), base)
+
+
+class RuleSpec(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    rule_id: str = Field(min_length=1)
+    prompt: str = Field(min_length=1)
+    criteria: Annotated[List[str], OptionalList] = Field(default_factory=list)
+    routing: Optional[RoutingSpec] = None
+
+
+class SectionSpec(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    # an empty section text evaluates the rules on the whole document
+    section_text: str = ''
+    validation_rules: Annotated[List[RuleSpec], OptionalList] = Field(default_factory=list)
+    routing: Optional[RoutingSpec] = None
+
+    @field_validator("section_text", mode="before")
+    @classmethod
+    def _no_section(cls, value):
+        return '' if value is None else value
+
+
+class ChecklistSpec(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    sections: Annotated[List[SectionSpec], OptionalList] = Field(default_factory=list)
+    routing: Optional[RoutingSpec] = None
+
+    @model_validator(mode="after")
+    def _unique_rule_ids(self):
+        # batch answers and stored findings are matched by rule id
+        seen = set()
+        for section in self.sections:
+            for rule in section.validation_rules:
+                if rule.rule_id in seen:
+                    raise ValueError(f"rule_id '{rule.rule_id}' is used more than once")
+                seen.add(rule.rule_id)
+        return self
+
+
+def render_rule(rule: RuleSpec) -> str:
+    criteria = ''.join(CRITERION_TEMPLATE.format(criterion=criterion) for criterion in rule.criteria)
+    return RULE_TEMPLATE.format(rule_id=rule.rule_id, prompt=rule.prompt, criteria=criteria)
+
+
+def _format_errors(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in item['loc']) or 'checklist'}: {item['msg']}"
+            for item in error.errors()]
+
+
+def validate_checklist(data: bytes) -> ChecklistSpec:
+    """The checklist schema of a YAML document, raises ChecklistError listing every problem."""
+    try:
+        raw = yaml.safe_load(data)
+    except yaml.YAMLError as e:
+        raise ChecklistError([f"not valid YAML: {e}"]) from e
+    if not isinstance(raw, dict):
+        raise ChecklistError(["checklist: must be a mapping with a 'sections' list"])
+    try:
+        return ChecklistSpec.model_validate(raw)
+    except ValidationError as e:
+        raise ChecklistError(_format_errors(e)) from e
+
+
+def compile_checklist(data: bytes, content_hash: Optional[str] = None) -> ParsedChecklist:
+    """
+    Validate a checklist YAML and render its rules, routes and system prompts.
+
+    The result only depends on the content, the compiler version and the
+    default model route, so it can be compiled once and shared by every job.
+    """
+    spec = validate_checklist(data)
+    checklist_route = default_route(EVALUATION_MODEL)
+    if spec.routing is not None:
+        checklist_route = spec.routing.route(checklist_route)
+
+    sections, rules, rule_ids, routes = [], [], [], []
+    for section in spec.sections:
+        section_route = section.routing.route(checklist_route) if section.routing else checklist_route
+        for rule in section.validation_rules:
+            sections.append(section.section_text)
+            rules.append(render_rule(rule))
+            rule_ids.append(rule.rule_id)
+            routes.append(rule.routing.route(section_route) if rule.routing else section_route)
+    return ParsedChecklist(content_hash or hashlib.sha256(data).hexdigest(), tuple(sections), tuple(rules),
+                           tuple(rule_ids), tuple(routes), tuple(build_content(rule) for rule in rules))
+
+
+def _compiled_with() -> str:
+    # artifacts compiled by another compiler version or with another default route are stale
+    return f"{COMPILER_VERSION}:{default_route(EVALUATION_MODEL).describe()}"
+
+
+_store: Optional[ArtifactStore] = None
+_store_lock = threading.Lock()
+
+
+def _compiled_store() -> ArtifactStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArtifactStore(settings.ARTIFACT_STORE_URL or settings.CELERY_RESULT_BACKEND,
+                                       settings.CHECKLIST_COMPILED_TTL, prefix="compiled")
+    return _store
+
+
+def save_compiled_checklist(checklist: ParsedChecklist) -> str:
+    return _compiled_store().put("checklist", checklist.content_hash,
+                                 {"compiled_with": _compiled_with(), **checklist.to_dict()})
+
+
+def load_compiled_checklist(data: bytes, content_hash: str) -> ParsedChecklist:
+    """
+    The compiled checklist of ``data``. With CHECKLIST_PRECOMPILED the artifact
+    is looked up by content hash and stored after compiling, so a checklist
+    validated at upload time is not compiled again by the workers.
+    """
+    if not settings.CHECKLIST_PRECOMPILED:
+        return compile_checklist(data, content_hash)
+    store = _compiled_store()
+    try:
+        compiled = store.get(store.key("checklist", content_hash))
+        if compiled.get("compiled_with") == _compiled_with():
+            return ParsedChecklist.from_dict(content_hash, compiled)
+    except KeyError:
+        pass
+    except Exception as e:
+        logger.warning(f"Could not read compiled checklist {content_hash[:12]}, compiling it: {e}")
+    checklist = compile_checklist(data, content_hash)
+    try:
+        save_compiled_checklist(checklist)
+    except Exception as e:
+        logger.warning(f"Could not store compiled checklist {content_hash[:12]}: {e}")
+    return checklist
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Validate and compile checklist YAML files.")
+    parser.add_argument("paths", nargs="+", help="checklist YAML files")
+    parser.add_argument("--store", action="store_true", help="store the compiled artifacts for the workers")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for path in args.paths:
+        with open(path, "rb") as file:
+            data = file.read()
+        try:
+            checklist = compile_checklist(data)
+        except ChecklistError as e:
+            failed += 1
+            print(f"{path}: {e}")
+            continue
+        key = f", stored as {save_compiled_checklist(checklist)}" if args.store else ""
+        print(f"{path}: {len(checklist.rules)} rules in {len(set(checklist.sections))} sections{key}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import base64
+from array import array
+from itertools import accumulate
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+def _encode_array(values: array) -> Dict[str, str]:
+    return {"typecode": values.typecode, "data": base64.b64encode(values.tobytes()).decode("ascii")}
+
+
+def _decode_array(data: Dict[str, str]) -> array:
+    values = array(data["typecode"])
+    values.frombytes(base64.b64decode(data["data"]))
+    return values
+
+
+class DocTree:
+    """
+    Columnar document tree.
+
+    Nodes are numbered in pre-order and stored as parallel arrays (parent,
+    level, depth, style id, subtree end) plus one text buffer with offsets, so
+    a large document costs a handful of arrays instead of one object per
+    paragraph. The subtree of node ``i`` is the range ``i .. ends[i]``, which
+    makes subtree slicing O(1) and every traversal a plain loop.
+    """
+
+    __slots__ = ("parents", "levels", "depths", "style_ids", "ends", "offsets", "buffer", "styles")
+
+    def __init__(self, parents: array, levels: array, depths: array, style_ids: array,
+                 ends: array, offsets: array, buffer: str, styles: List[str]):
+        self.parents = parents
+        self.levels = levels
+        self.depths = depths
+        self.style_ids = style_ids
+        self.ends = ends
+        self.offsets = offsets
+        self.buffer = buffer
+        self.styles = styles
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def text(self, i: int) -> str:
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]]
+
+    def style(self, i: int) -> str:
+        return self.styles[self.style_ids[i]]
+
+    def subtree(self, i: int) -> range:
+        """Node ``i`` followed by all of its descendants."""
+        return range(i, self.ends[i])
+
+    def children(self, i: int) -> Iterator[int]:
+        j = i + 1
+        end = self.ends[i]
+        while j < end:
+            yield j
+            j = self.ends[j]
+
+    def walk(self, i: int = 0) -> Iterator[Tuple[int, int]]:
+        """Pre-order ``(node, depth relative to i)`` pairs of the subtree of ``i``."""
+        base = self.depths[i]
+        depths = self.depths
+        for j in range(i, self.ends[i]):
+            yield j, depths[j] - base
+
+    def node(self, i: int) -> "DocTreeNode":
+        return DocTreeNode(self, i)
+
+    @property
+    def root(self) -> "DocTreeNode":
+        return DocTreeNode(self, 0)
+
+    _ARRAYS = ("parents", "levels", "depths", "style_ids", "ends", "offsets")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON serialisable form, the arrays are stored as base64 encoded bytes."""
+        data: Dict[str, Any] = {name: _encode_array(getattr(self, name)) for name in self._ARRAYS}
+        data["buffer"] = self.buffer
+        data["styles"] = list(self.styles)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DocTree":
+        arrays = {name: _decode_array(data[name]) for name in cls._ARRAYS}
+        return cls(buffer=data["buffer"], styles=list(data["styles"]), **arrays)
+
+
+class DocTreeBuilder:
+    """
+    Collects nodes in document (pre-order) order and freezes them into a DocTree.
+
+    Nodes can only be added below an ancestor of the most recently added node,
+    which is how both the .docx and the PDF parsers grow their trees.
+    """
+
+    def __init__(self, root_text: str = "", root_style: str = "root"):
+        self.parents = array('i')
+        self.levels = array('i')
+        self.depths = array('i')
+        self.style_ids = array('i')
+        self.texts: List[str] = []
+        self.styles: List[str] = []
+        self._style_index: Dict[str, int] = {}
+        self.add(root_text, root_style, 0, -1)
+
+    def add(self, text: str, style: str, level: int, parent: int) -> int:
+        style_id = self._style_index.get(style)
+        if style_id is None:
+            style_id = len(self.styles)
+            self._style_index[style] = style_id
+            self.styles.append(style)
+        self.parents.append(parent)
+        self.levels.append(level)
+        self.depths.append(self.depths[parent] + 1 if parent >= 0 else 0)
+        self.style_ids.append(style_id)
+        self.texts.append(text)
+        return len(self.texts) - 1
+
+    def build(self) -> DocTree:
+        count = len(self.texts)
+        ends = array('i', range(1, count + 1))
+        # in pre-order every descendant comes after its parent, one reverse sweep closes all subtrees
+        parents = self.parents
+        for i in range(count - 1, 0, -1):
+            parent = parents[i]
+            if ends[i] > ends[parent]:
+                ends[parent] = ends[i]
+        offsets = array('q', [0])
+        offsets.extend(accumulate(len(text) for text in self.texts))
+        return DocTree(self.parents, self.levels, self.depths, self.style_ids, ends,
+                       offsets, ''.join(self.texts), self.styles)
+
+
+class DocTreeNode:
+    """
+    Lightweight view on one node of a DocTree.
+
+    Offers the attributes of the former ``DocNode`` / ``DocumentNode`` objects
+    (``text``/``content``, ``style``, ``level``, ``children``, ``parent``) so
+    existing callers keep working; views are created on demand and hold no data.
+    """
+
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree: DocTree, index: int):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def text(self) -> str:
+        return self.tree.text(self.index)
+
+    @property
+    def content(self) -> str:
+        return self.tree.text(self.index)
+
+    @property
+    def style(self) -> str:
+        return self.tree.style(self.index)
+
+    @property
+    def level(self) -> int:
+        return self.tree.levels[self.index]
+
+    @property
+    def parent(self) -> Optional["DocTreeNode"]:
+        parent = self.tree.parents[self.index]
+        return DocTreeNode(self.tree, parent) if parent >= 0 else None
+
+    @property
+    def children(self) -> List["DocTreeNode"]:
+        return [DocTreeNode(self.tree, i) for i in self.tree.children(self.index)]
+
+    def subnodes(self) -> List["DocTreeNode"]:
+        return [DocTreeNode(self.tree, i) for i in range(self.index + 1, self.tree.ends[self.index])]
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, DocTreeNode) and other.tree is self.tree and other.index == self.index
+
+    def __hash__(self) -> int:
+        return hash((id(self.tree), self.index))
+
+    def __repr__(self) -> str:
+        return f"DocTreeNode(index={self.index}, style={self.style!r}, level={self.level}, text={self.text[:40]!r})"
@@ -1,39 +1,76 @@
+import logging
+import math
+import multiprocessing
+import os
+import re
 from abc import ABC, abstractmethod
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Type
+import zipfile
+import billiard
 import PyPDF2
 import docx 
+from worker.core.config import settings
+from worker.utils.doc_tree import DocTree, DocTreeBuilder, DocTreeNode
 
-class DocumentNode:
-    def __init__(self, content: str, level: int = 0, parent: Optional['DocumentNode'] = None):
-        self.content = content
-        self.level = level
-        self.parent = parent
-        self.children: List[DocumentNode] = []
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# loaders return views on a flat DocTree, ``content`` is an alias of ``text``
+DocumentNode = DocTreeNode
+
+_HEADER_BYTES = 8
+
+
+def _read_header(path: Path) -> bytes:
+    with open(path, 'rb') as file:
+        return file.read(_HEADER_BYTES)
 
-    def add_child(self, child: 'DocumentNode'):
-        child.parent = self
-        self.children.append(child)
 
 class DocumentLoader(ABC):
-    """Base class for document loaders that parse PDF and Word documents into a tree structure"""
-    
+    """
+    Base class for document loaders that parse PDF and Word documents into a tree structure.
+
+    Every loader produces the ``Heading N`` section tree of ``DocParser`` in
+    ``self.tree``. The file type is recognised from its content, not its name.
+    """
+
+    # human readable type for error messages
+    file_type = "document"
+
     def __init__(self, file_path: str):
         self.file_path = Path(file_path)
         if not self.file_path.exists():
             raise FileNotFoundError(f"File {file_path} not found")
         
         self.root: Optional[DocumentNode] = None
+        self.tree: Optional[DocTree] = None
+        # True when only the parts of the document containing the requested sections were loaded
+        self.partial = False
         self._validate_file_type()
 
+    @classmethod
     @abstractmethod
+    def matches(cls, header: bytes, path: Path) -> bool:
+        """Whether the file with these first bytes can be loaded by this loader"""
+        pass
+
     def _validate_file_type(self):
         """Validate that the file is of the correct type"""
-        pass
+        if not self.matches(_read_header(self.file_path), self.file_path):
+            raise ValueError(f"File must be a {self.file_type}")
 
     @abstractmethod
-    def load(self) -> DocumentNode:
-        """Load and parse the document into a tree structure"""
+    def load(self, sections: Optional[Iterable[str]] = None) -> DocumentNode:
+        """
+        Load and parse the document into a tree structure. Loaders may skip the
+        parts of the document that contain none of ``sections``.
+        """
         pass
 
     @abstractmethod
@@ -42,8 +79,8 @@ class DocumentLoader(ABC):
         pass
 
     @abstractmethod
-    def _build_tree(self, text: str) -> DocumentNode:
-        """Build a document tree from extracted text"""
+    def _build_tree(self, *content) -> DocumentNode:
+        """Build a document tree from the extracted content"""
         pass
 
     def get_tree(self) -> Optional[DocumentNode]:
@@ -53,80 +90,284 @@ class DocumentLoader(ABC):
         return self.root
 
 
+_LOADERS: List[Type[DocumentLoader]] = []
+
+
+def register_loader(loader: Type[DocumentLoader]) -> Type[DocumentLoader]:
+    """Class decorator adding a loader to the ones ``get_loader`` chooses from"""
+    _LOADERS.append(loader)
+    return loader
+
+
+def get_loader(file_path: str) -> DocumentLoader:
+    """The loader for a file, chosen by sniffing its first bytes"""
+    path = Path(file_path)
+    if not path.exists():
+        raise FileNotFoundError(f"File {file_path} not found")
+    header = _read_header(path)
+    for loader in _LOADERS:
+        if loader.matches(header, path):
+            return loader(file_path)
+    raise ValueError("Unsupported document type. Must be PDF or Word document.")
+
+
+# one page as ``(line text, font size)`` pairs
+PageLines = List[Tuple[str, float]]
+
+# a line is a heading candidate when its font is this much larger than the body text
+_HEADING_SIZE_RATIO = 1.15
+_MAX_HEADING_CHARS = 150
+_MAX_HEADING_LEVELS = 6
+_SPACE_PATTERN = re.compile(r'\s+')
+
+
+def _normalize(text: str) -> str:
+    return _SPACE_PATTERN.sub(' ', text).strip().lower()
+
+
+def _vertical_scale(matrix) -> float:
+    return math.hypot(matrix[2], matrix[3]) or 1.0
+
+
+def _page_lines(page) -> PageLines:
+    """The non-empty lines of a page with the largest font size used on each."""
+    lines: PageLines = []
+    parts: List[str] = []
+    size = 0.0
+
+    def flush():
+        nonlocal size
+        line = ''.join(parts).strip()
+        if line:
+            lines.append((line, size))
+        parts.clear()
+        size = 0.0
+
+    def visit(text, cm_matrix, tm_matrix, font_dict, font_size):
+        nonlocal size
+        if not text:
+            return
+        effective = round(font_size * _vertical_scale(tm_matrix) * _vertical_scale(cm_matrix), 1)
+        for i, piece in enumerate(text.split('\n')):
+            if i > 0:
+                flush()
+            if piece.strip():
+                parts.append(piece)
+                size = max(size, effective)
+
+    page.extract_text(visitor_text=visit)
+    flush()
+    return lines
+
+
+@lru_cache(maxsize=4)
+def _open_reader(path: str, mtime: float) -> PyPDF2.PdfReader:
+    # pool workers keep the reader between their page ranges
+    return PyPDF2.PdfReader(path)
+
+
+def _extract_page_range(path: str, mtime: float, start: int, end: int) -> List[PageLines]:
+    reader = _open_reader(path, mtime)
+    return [_page_lines(reader.pages[i]) for i in range(start, end)]
+
+
+def _page_runs(page_numbers: Sequence[int], step: int) -> List[Tuple[int, int]]:
+    """``(start, end)`` ranges of consecutive pages, at most ``step`` pages each."""
+    runs: List[Tuple[int, int]] = []
+    for number in page_numbers:
+        if runs and runs[-1][1] == number and runs[-1][1] - runs[-1][0] < step:
+            runs[-1] = (runs[-1][0], number + 1)
+        else:
+            runs.append((number, number + 1))
+    return runs
+
+
+@register_loader
 class PDFLoader(DocumentLoader):
-    """Loader for PDF documents"""
-    
-    def _validate_file_type(self):
-        """Validate that the file is a PDF"""
-        if not self.file_path.suffix == '.pdf':
-            raise ValueError("File must be a PDF")
-        
+    """
+    Loader for PDF documents.
+
+    Pages are extracted in a process pool for larger files and consumed page by
+    page in document order. Headings come from the outline (bookmarks) when the
+    PDF has one and from font sizes otherwise, and the result is the same
+    ``Heading N`` / ``Normal`` tree ``DocParser`` builds for .docx files. With
+    an outline, only the pages of the requested sections are extracted.
+    """
+
+    file_type = "PDF"
+
+    @classmethod
+    def matches(cls, header: bytes, path: Path) -> bool:
+        return header.startswith(b'%PDF-')
+
+    def _iter_pages(self, reader: PyPDF2.PdfReader,
+                    page_numbers: Optional[Sequence[int]] = None) -> Iterator[Tuple[int, PageLines]]:
+        """``(page number, lines)`` of the pages in order, extracted in parallel when worthwhile."""
+        if page_numbers is None:
+            page_numbers = range(len(reader.pages))
+        if len(page_numbers) < settings.PDF_PARALLEL_MIN_PAGES:
+            for number in page_numbers:
+                yield number, _page_lines(reader.pages[number])
+            return
+
+        path = str(self.file_path)
+        mtime = self.file_path.stat().st_mtime
+        runs = _page_runs(page_numbers, max(settings.PDF_PAGES_PER_TASK, 1))
+        workers = min(settings.PDF_MAX_WORKERS or os.cpu_count() or 1, len(runs))
+        # multiprocessing refuses to start children from daemonic processes like the
+        # prefork Celery workers, billiard's processes do not have that restriction
+        context = billiard.get_context() if multiprocessing.current_process().daemon else None
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            for (start, _), pages in zip(runs, executor.map(_extract_page_range, repeat(path), repeat(mtime),
+                                                             *zip(*runs))):
+                yield from enumerate(pages, start=start)
+
     def _extract_text(self) -> str:
         """Extract text from the PDF"""
-        with open(self.file_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ''
-            for page in reader.pages:
-                text += page.extract_text()
-        return text
-    
-    def _build_tree(self, text: str) -> DocumentNode:
-        """Build a document tree from extracted text"""
-        # Split text into lines and create nodes based on indentation
-        lines = text.split('\n')
-        root = DocumentNode("Root")
-        current_node = root
-        
-        for line in lines:
-            if not line.strip():
-                continue
-                
-            # Count leading spaces to determine level
-            level = len(line) - len(line.lstrip())
-            content = line.strip()
-            
-            # Create new node
-            new_node = DocumentNode(content, level=level)
-            
-            # Find appropriate parent based on level
-            while current_node.parent and current_node.level >= level:
-                current_node = current_node.parent
-                
-            current_node.add_child(new_node)
-            current_node = new_node
-            
-        return root
-    
-    def load(self) -> DocumentNode:
+        reader = PyPDF2.PdfReader(str(self.file_path))
+        return '\n'.join(line for _, page in self._iter_pages(reader) for line, _ in page)
+
+    def _outline_entries(self, reader: PyPDF2.PdfReader) -> List[Tuple[int, str, int]]:
+        """``(page number, title, level)`` of every outline entry in outline order."""
+        entries: List[Tuple[int, str, int]] = []
+
+        def walk(items, level: int):
+            for item in items:
+                if isinstance(item, list):
+                    walk(item, level + 1)
+                else:
+                    entries.append((reader.get_destination_page_number(item), str(item.title), level))
+
+        try:
+            walk(reader.outline, 1)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable outline of {self.file_path}: {e}")
+            return []
+        return entries
+
+    @staticmethod
+    def _section_pages(entries: List[Tuple[int, str, int]], sections: Iterable[str],
+                       page_count: int) -> Optional[List[int]]:
+        """
+        The pages spanned by the outline entries matching ``sections``, None
+        when a section has no outline entry and the whole document is needed.
+        """
+        pages = set()
+        for section in set(sections):
+            key = _normalize(section)
+            matched = False
+            for position, (page, title, level) in enumerate(entries):
+                if not key or key not in _normalize(title):
+                    continue
+                matched = True
+                # a section ends on the page where the next entry of the same or a higher level starts
+                end = next((next_page for next_page, _, next_level in entries[position + 1:]
+                            if next_level <= level), page_count - 1)
+                pages.update(range(page, max(end, page) + 1))
+            if not matched:
+                return None
+        return sorted(pages)
+
+    @staticmethod
+    def _font_heading_levels(pages: List[PageLines]) -> Dict[float, int]:
+        """Heading level per font size, the larger the font the higher the heading."""
+        chars = Counter()
+        for page in pages:
+            for line, size in page:
+                chars[size] += len(line)
+        if not chars:
+            return {}
+        body_size = chars.most_common(1)[0][0]
+        sizes = sorted((size for size in chars if size >= body_size * _HEADING_SIZE_RATIO), reverse=True)
+        return {size: level for level, size in enumerate(sizes[:_MAX_HEADING_LEVELS], start=1)}
+
+    def _build_tree(self, pages: List[Tuple[int, PageLines]], entries: List[Tuple[int, str, int]]) -> DocumentNode:
+        """Build the section tree from the page lines and the outline headings"""
+        builder = DocTreeBuilder()
+        outline: Dict[int, List[Tuple[str, int]]] = defaultdict(list)
+        for page, title, level in entries:
+            outline[page].append((title, level))
+        font_levels = {} if outline else self._font_heading_levels([lines for _, lines in pages])
+        current_node = 0
+
+        def add_heading(text: str, level: int):
+            nonlocal current_node
+            # Move up the tree to the parent section of this level
+            while builder.parents[current_node] >= 0 and builder.levels[current_node] >= level:
+                current_node = builder.parents[current_node]
+            current_node = builder.add(text, f"Heading {level}", level, current_node)
+
+        for page_number, lines in pages:
+            page_headings = {_normalize(title): level for title, level in outline.get(page_number, ())}
+            if page_headings:
+                # outline entries whose title does not appear as a line open the page
+                line_keys = {_normalize(line) for line, _ in lines}
+                for title, level in outline[page_number]:
+                    if _normalize(title) not in line_keys:
+                        add_heading(title, level)
+
+            for line, size in lines:
+                key = _normalize(line)
+                if key in page_headings:
+                    # a title repeated on the page (e.g. in a running header) is a heading once
+                    add_heading(line, page_headings.pop(key))
+                elif size in font_levels and len(line) <= _MAX_HEADING_CHARS:
+                    add_heading(line, font_levels[size])
+                else:
+                    builder.add(line, "Normal", builder.levels[current_node] + 1, current_node)
+
+        self.tree = builder.build()
+        return self.tree.root
+
+    def load(self, sections: Optional[Iterable[str]] = None) -> DocumentNode:
         """Load and parse the PDF document into a tree structure"""
-        self._validate_file_type()
-        text = self._extract_text()
-        return self._build_tree(text)
-    
+        reader = PyPDF2.PdfReader(str(self.file_path))
+        entries = self._outline_entries(reader)
+        page_numbers = None
+        if sections is not None and entries:
+            page_numbers = self._section_pages(entries, sections, len(reader.pages))
+        self.partial = page_numbers is not None and len(page_numbers) < len(reader.pages)
+        if self.partial:
+            logger.info(f"Loading {len(page_numbers)} of {len(reader.pages)} pages of {self.file_path.name}")
+        pages = list(self._iter_pages(reader, page_numbers))
+        self.root = self._build_tree(pages, entries)
+        return self.root
+
+
+@register_loader
 class WordLoader(DocumentLoader):
-    """Loader for Word documents"""
-    
-    def _validate_file_type(self):
-        """Validate that the file is a Word document"""
-        if not self.file_path.suffix == '.docx':
-            raise ValueError("File must be a Word document")
-        
+    """Loader for Word documents, builds the section tree with ``DocParser``"""
+
+    file_type = "Word document"
+
+    @classmethod
+    def matches(cls, header: bytes, path: Path) -> bool:
+        # a .docx is a zip archive with the main document part in word/
+        if not header.startswith(b'PK\x03\x04'):
+            return False
+        try:
+            with zipfile.ZipFile(path) as archive:
+                return 'word/document.xml' in archive.namelist()
+        except zipfile.BadZipFile:
+            return False
+
     def _extract_text(self) -> str:
         """Extract text from the Word document"""
         doc = docx.Document(self.file_path)
-        text = ''
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + '\n'
-        return text
-    
-    def _build_tree(self, text: str) -> DocumentNode:
-        """Build a document tree from extracted text"""
-        root = DocumentNode(text)
-
-        return root
-    
-    def load(self) -> DocumentNode:
+        return ''.join(paragraph.text + '\n' for paragraph in doc.paragraphs)
+
+    def _build_tree(self) -> DocumentNode:
+        """Build the section tree of the Word document"""
+        # imported here, evaluate_doc loads documents through this module
+        from worker.utils.evaluate_doc import DocParser
+
+        parser = DocParser()
+        parser.parse_document(str(self.file_path))
+        self.tree = parser.tree
+        return self.tree.root
+
+    def load(self, sections: Optional[Iterable[str]] = None) -> DocumentNode:
         """Load and parse the Word document into a tree structure"""
-        self._validate_file_type()
-        text = self._extract_text()
-        return self._build_tree(text)
+        # the document XML is parsed as a whole, so every section is loaded
+        self.root = self._build_tree()
+        return self.root
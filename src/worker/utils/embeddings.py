@@ -0,0 +1,161 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from worker.core.config import settings
+from worker.utils.genext import GenextAPI, LlmApiModel
+from worker.utils.prompt_builder import count_tokens
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+EMBEDDING_MODEL = LlmApiModel.ADA
+# the embedding endpoint rejects requests above the model input limit
+MAX_BATCH_TOKENS = 8_000
+
+
+def extract_embeddings(response: Dict[str, Any], count: int) -> List[List[float]]:
+    """The ``count`` vectors of a finished embedding request, in input order."""
+    if response is None:
+        raise RuntimeError("No response received from the embedding API")
+    for key in ("data", "embeddings", "embedding", "result"):
+        value = response.get(key)
+        if isinstance(value, dict):
+            value = value.get("embeddings") or value.get("embedding")
+        if not isinstance(value, list) or not value:
+            continue
+        first = value[0]
+        if isinstance(first, dict):
+            # OpenAI style items carry their input position
+            items = sorted(value, key=lambda item: item.get("index", 0))
+            vectors = [item["embedding"] for item in items]
+        elif isinstance(first, list):
+            vectors = value
+        else:
+            vectors = [value]
+        if len(vectors) != count:
+            raise ValueError(f"Expected {count} embeddings, received {len(vectors)}")
+        return vectors
+    raise ValueError(f"Embedding response without vectors: {sorted(response)}")
+
+
+def _groups(texts: Sequence[str], batch_size: int) -> List[Tuple[int, int]]:
+    """``(start, end)`` ranges of at most ``batch_size`` texts and ``MAX_BATCH_TOKENS`` tokens."""
+    groups = []
+    start = 0
+    tokens = 0
+    for i, text in enumerate(texts):
+        text_tokens = count_tokens(text, EMBEDDING_MODEL)
+        if i > start and (i - start >= batch_size or tokens + text_tokens > MAX_BATCH_TOKENS):
+            groups.append((start, i))
+            start, tokens = i, 0
+        tokens += text_tokens
+    if start < len(texts):
+        groups.append((start, len(texts)))
+    return groups
+
+
+def _embed_group(texts: Sequence[str]) -> List[List[float]]:
+    input_text = texts[0] if len(texts) == 1 else list(texts)
+    response = GenextAPI(question="").generate_embedding(input_text)
+    return extract_embeddings(response, len(texts))
+
+
+def embed_batch(texts: Sequence[str], batch_size: Optional[int] = None, max_workers: Optional[int] = None) -> np.ndarray:
+    """
+    Embed ``texts`` with as few requests as possible.
+
+    The texts are split into request sized groups which are sent concurrently,
+    the result is a ``len(texts) x dim`` float32 matrix in input order.
+    """
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+    groups = _groups(texts, batch_size)
+    workers = max(1, min(max_workers or settings.EVAL_MAX_CONCURRENCY, len(groups)))
+    logger.info(f"Embedding {len(texts)} texts in {len(groups)} requests")
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed") as executor:
+        results = list(executor.map(lambda group: _embed_group(texts[group[0]:group[1]]), groups))
+    return np.asarray([vector for vectors in results for vector in vectors], dtype=np.float32)
+
+
+class EmbeddingCoalescer:
+    """
+    Merges single-text embedding calls from concurrent tasks into shared batches.
+
+    Callers block in ``embed`` while a background thread collects requests for
+    at most ``max_wait`` seconds or until ``batch_size`` texts are queued, then
+    sends them as one request.
+    """
+
+    def __init__(self, batch_size: Optional[int] = None, max_wait: Optional[float] = None, max_workers: Optional[int] = None):
+        self.batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        self.max_wait = settings.EMBEDDING_COALESCE_WAIT if max_wait is None else max_wait
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or settings.EVAL_MAX_CONCURRENCY,
+                                            thread_name_prefix="embed-batch")
+        self._thread = threading.Thread(target=self._collect, name="embedding-coalescer", daemon=True)
+        self._thread.start()
+
+    def embed(self, text: str, timeout: Optional[float] = None) -> np.ndarray:
+        return self.submit(text).result(timeout=timeout)
+
+    def submit(self, text: str) -> Future:
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _collect(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._send, batch)
+
+    @staticmethod
+    def _send(batch: List[Tuple[str, Future]]):
+        try:
+            vectors = embed_batch([text for text, _ in batch], batch_size=len(batch), max_workers=1)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+
+_coalescer: Optional[EmbeddingCoalescer] = None
+_coalescer_lock = threading.Lock()
+
+
+def get_embedding_coalescer() -> EmbeddingCoalescer:
+    global _coalescer
+    if _coalescer is None:
+        with _coalescer_lock:
+            if _coalescer is None:
+                _coalescer = EmbeddingCoalescer()
+    return _coalescer
+
+
+def _reset_coalescer_after_fork():
+    # the collector thread does not survive a fork
+    global _coalescer, _coalescer_lock
+    _coalescer = None
+    _coalescer_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_coalescer_after_fork)
@@ -1,9 +1,26 @@
+import hashlib
 import re
+import time
 import yaml
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from docx import Document
-from typing import List, Optional
-from worker.utils.genext import GenextAPI, LlmApiModel
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+from typing import IO, Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from worker.core.config import settings
+from worker.utils.artifact_cache import ArtifactCache
+from worker.utils.doc_tree import DocTree, DocTreeBuilder, DocTreeNode
+from worker.utils.document_loader import get_loader
+from worker.utils.genext import DeadlineExceededError, GenextAPI, LlmApiModel
+from worker.utils.model_metrics import model_metrics
+from worker.utils.model_routing import ModelRoute, default_route
+from worker.utils.prompt_builder import MODEL_CONTEXT_TOKENS, PromptBuilder, PromptChunk, merge_scores
+from worker.utils.response_parser import REASK_INSTRUCTION, parse_assessment, parse_batch_assessments, parse_counters
+from worker.utils.retrieval import embed_texts, get_document_retriever
+from worker.utils.section_index import SectionIndex
 import logging
 
 
@@ -11,93 +28,106 @@ import logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+EVALUATION_MODEL = LlmApiModel.GPT_4o
+EVALUATION_TEMPERATURE = 0.2
+EVALUATION_MAX_COMPLETION_TOKENS = 400
 
+_PARAGRAPH_TAG = qn('w:p')
+_TABLE_TAG = qn('w:tbl')
 
-@dataclass
-class DocNode:
-    text: str
-    style: str
-    level: int
-    children: List['DocNode']
-    parent: Optional['DocNode'] = None
+
+# nodes are views on the flat DocTree, kept under the old name for callers
+DocNode = DocTreeNode
 
 
 class DocParser:
     def __init__(self):
         self.heading_pattern = re.compile(r'Heading (\d+)')
-        self.root = DocNode("", "root", 0, [])
+        self.tree = DocTreeBuilder().build()
+
+    @property
+    def root(self) -> DocNode:
+        return self.tree.root
 
-    def parse_document(self, file_path: str) -> DocNode:
+    def parse_document(self, file_path: Union[str, IO[bytes]]) -> DocNode:
+        """
+        Build the section tree in a single pass over the document body.
+
+        Body elements are wrapped as they are met instead of being looked up in
+        ``doc.paragraphs`` / ``doc.tables``, which python-docx rebuilds on every
+        access and made parsing quadratic in the number of body elements.
+        """
         doc = Document(file_path)
-        current_node = self.root
+        body = doc._body
+        builder = DocTreeBuilder()
+        style_names = {}
+        current_node = 0
         current_level = 0
-        counter = 0
-        paragraph_nr = 0
         table_nr = 0
         # loop through all the items
-        for element in doc.element.body:
-            counter = counter + 1
-
-            if element.tag.endswith('p'):
-                # print(counter, 'P', paragraph_nr)
-
-                paragraph = doc.paragraphs[paragraph_nr]
-                style = paragraph.style.name
+        for element in doc.element.body.iterchildren():
+            if element.tag == _PARAGRAPH_TAG:
+                paragraph = Paragraph(element, body)
+                style = self._style_name(paragraph, style_names)
                 heading_match = self.heading_pattern.match(style)
 
                 if heading_match:
                     level = int(heading_match.group(1))
-                    node = DocNode(paragraph.text, style, level, [])
 
                     # Move up the tree if needed
-                    while current_level >= level and current_node.parent:
-                        current_node = current_node.parent
+                    while current_level >= level and builder.parents[current_node] >= 0:
+                        current_node = builder.parents[current_node]
                         current_level -= 1
 
                     # Add new node as child of current node
-                    node.parent = current_node
-                    current_node.children.append(node)
-                    current_node = node
+                    current_node = builder.add(paragraph.text, style, level, current_node)
                     current_level = level
                 else:
                     # Regular paragraph - add as child of current section
-                    node = DocNode(paragraph.text, style, current_level + 1, [])
-                    # node = DocNode(paragraph.text, 'Normal', current_level + 1, [])
-                    node.parent = current_node
-                    current_node.children.append(node)
-                paragraph_nr = paragraph_nr + 1
-
-            elif element.tag.endswith('tbl'):
-                # print(counter, 'T', table_nr)
-
-                row_nr = 0
-
-                table = doc.tables[table_nr]
-                table_data = []
-                for row in table.rows:
-                    row_nr = row_nr + 1
-                    table_name = 'Table_' + str(table_nr) + '_Row_' + str(row_nr)
-                    row_data = [cell.text.strip() for cell in row.cells]
-                    table_data.append(row_data)
-                    node = DocNode(str(row_data), table_name, current_level + 1, [])
-                    node.parent = current_node
-                    current_node.children.append(node)
+                    builder.add(paragraph.text, style, current_level + 1, current_node)
 
+            elif element.tag == _TABLE_TAG:
+                table_name = 'Table_' + str(table_nr)
+                self._add_table(builder, Table(element, body), table_name, current_node, current_level + 1)
                 table_nr = table_nr + 1
 
-            # else:
-            # print(counter, 'O')
-
-
+        self.tree = builder.build()
         return self.root
 
+    @staticmethod
+    def _style_name(paragraph: Paragraph, style_names: dict) -> str:
+        # resolving a style searches the whole styles part, do it once per style id
+        style_id = paragraph._p.style
+        if style_id not in style_names:
+            style_names[style_id] = paragraph.style.name
+        return style_names[style_id]
+
+    def _add_table(self, builder: DocTreeBuilder, table: Table, table_name: str, parent: int, level: int):
+        for row_nr, row in enumerate(table.rows, start=1):
+            row_name = table_name + '_Row_' + str(row_nr)
+            cells = row.cells
+            row_data = [cell.text.strip() for cell in cells]
+            node = builder.add(str(row_data), row_name, level, parent)
+
+            # nested tables become children of the row that contains them,
+            # merged cells show up several times in row.cells so visit each once
+            seen = set()
+            nested_nr = 0
+            for cell in cells:
+                if id(cell._tc) in seen:
+                    continue
+                seen.add(id(cell._tc))
+                for nested in cell.tables:
+                    self._add_table(builder, nested, row_name + '_Table_' + str(nested_nr), node, level + 1)
+                    nested_nr = nested_nr + 1
+
     def traverse_depth_first(self, node: DocNode = None, level: int = 0):
         if node is None:
             node = self.root
 
-        yield (node, level)
-        for child in node.children:
-            yield from self.traverse_depth_first(child, level + 1)
+        tree = node.tree
+        for index, depth in tree.walk(node.index):
+            yield (tree.node(index), level + depth)
 
     def find_sections_by_style(self, style: str) -> List[DocNode]:
         return [node for node, _ in self.traverse_depth_first()
@@ -118,11 +148,8 @@ class DocParser:
         return matching_nodes
 
     def get_subnodes(self, node: DocNode) -> List[DocNode]:
-        subnodes = []
-        for child in node.children:
-            subnodes.append(child)
-            subnodes.extend(self.get_subnodes(child))
-        return subnodes
+        # descendants are the pre-order range right after the node
+        return node.subnodes()
 
 
 class ValidationRules:
@@ -159,126 +186,576 @@ class ValidationRules:
 
 
 def extract_score(response):
-    score = 0
-    lv_response = response
-    lv_response = lv_response.replace('Score: ', '')
-    lv_response = lv_response.replace('score: ', '')
-    lv_response = lv_response.replace('Rating: ', '')
-    lv_response = lv_response.replace('rating: ', '')
-
-    while True:
-        try:
-            # Extract the first number from the response string
-            match = re.search(r'\d+', lv_response)
-            if match:
-                score = int(match.group(0))
-                break  # Exit the loop if a number is found
-            else:
-                print('ERROR!!!: ' + lv_response)
-                score = 0
-        except ValueError:
-            print('ERROR!!!: ' + lv_response)
-        # score = 5  # or any default value you prefer
-
-    return score
-
-
-def do_evaluation(document_path, yaml_file_path):
-    # read the document
-    parser = DocParser()
-    doc_tree = parser.parse_document(document_path)
-
-    # Print document structure and put in a string
-    document_text = ''
-    for node, level in parser.traverse_depth_first():
-        if node.text != '':
-            document_text = document_text + ("  " * level + f"- {node.text}\n")
-    # read yaml and prepare the prompt
-    valRules = ValidationRules()
-    rule_data = valRules.read_yaml_file(yaml_file_path)
-    sections, rules, rules_id = valRules.create_list_of_rules(rule_data)
+    """The score (0-10) of an answer, 0 when none can be found."""
+    assessment = parse_assessment(response)
+    return assessment.score if assessment is not None else 0
 
-    # evaluate the document
-    index = 0
-    lt_score = []
-    lt_answer = []
-
-    for rule in rules:
-
-        # get the content
-        content = ('TASK: You evaluate documents based on evaluation criteria and provide a rating out of 10.' +
-                   'You first provide a number out of 10 for the score then provide feedback based on this evaluation criteria:' +
-                #    'Section Text: Provide the section_text as is in the output to help with referencing. Add the perfix section_text: ' +
-                   'EVALUATION CRITERIA: ' +
-                    rule +
-                   'SCORING: The scoring is out of 10 and you always give a score. For example:  \'10 - The document seems complete.\'' +
-                   'Or: \'5 - Your document still needs work, for example it is missing contact information. \'' +
-                   'Or: \'0 - Your document is not good enough, please revisit. \'')
-
-        # get the prompt
-        section = sections[index]
-        rule_id = rules_id[index]
-
-        # print('-------------------------------------------------------------------')
-        # print('Rule Id: ' + rule_id)
-
-        index = index + 1
-
-        # no section then use the whole document
-        if section != '':
-            # print(' - ' + section)
-            results = parser.find_text_with_subnodes(section)
-            document_text_sub = ''
-            for result in results:
-                document_text_sub = document_text_sub + result.text + '\n'
-            prompt = 'Please evaluate this document: "' + document_text_sub + '"'
-            # print('Sub text' + document_text_sub)
-        else:
-            # print(' - Complete Document')
-            prompt = 'Please evaluate this document: ' + document_text
-            # print(document_text)
-
-        # call the API
-        genext_api = GenextAPI(
-            question=prompt,
-            model_name=LlmApiModel.GPT_4o,
-            temperature=0.2,
-            max_completion_token_count=400,
+
+def build_content(rule: str) -> str:
+    return ('TASK: You evaluate documents based on evaluation criteria and provide a rating out of 10.' +
+            'You provide a score out of 10 and feedback based on this evaluation criteria:' +
+            #    'Section Text: Provide the section_text as is in the output to help with referencing. Add the perfix section_text: ' +
+            'EVALUATION CRITERIA: ' +
+            rule +
+            'SCORING: The scoring is out of 10 and you always give a score. ' +
+            'OUTPUT: Answer only with a JSON object with the score, your feedback and short quotes from the document ' +
+            'supporting it, like {"score": 5, "feedback": "Your document still needs work, for example it is missing ' +
+            'contact information.", "evidence": ["Contact: TBD"]}')
+
+
+def rule_deadline() -> Optional[float]:
+    """The ``time.monotonic()`` deadline of a rule starting now, None without EVAL_RULE_DEADLINE."""
+    if settings.EVAL_RULE_DEADLINE is None:
+        return None
+    return time.monotonic() + settings.EVAL_RULE_DEADLINE
+
+
+def timed_out_answer(rule_ids: Sequence[str]) -> str:
+    return f"No answer for rule {', '.join(rule_ids)} within the deadline of {settings.EVAL_RULE_DEADLINE} seconds"
+
+
+def evaluate_rule(rule: str, prompt: str, model: LlmApiModel = EVALUATION_MODEL, deadline: Optional[float] = None,
+                  content: Optional[str] = None):
+    """Send a single rule to the LLM and return (score, answer), ``content`` is its precompiled system prompt."""
+    content = content if content is not None else build_content(rule)
+
+    def rule_api(question: str) -> GenextAPI:
+        return GenextAPI(
+            question=question,
+            model_name=model,
+            temperature=EVALUATION_TEMPERATURE,
+            max_completion_token_count=EVALUATION_MAX_COMPLETION_TOKENS,
             content=content
         )
 
-        # print the feedback
-        response = genext_api.run()
-        answer = response['completion']
-        # print(' - ' + answer + '\n')
-        score = extract_score(answer)
-        # print('Score: ' + str(score))
+    response = rule_api(prompt).run(deadline=deadline)
+    if response is None:
+        raise RuntimeError("No response received from the LLM API")
+    answer = response['completion']
+    assessment = parse_assessment(answer)
+    if assessment is None:
+        # ask once more, a second malformed answer marks the rule as failed;
+        # a new request, the payload (and its cache key) is built from the question
+        parse_counters.increment("reasked")
+        response = rule_api(prompt + REASK_INSTRUCTION).run(deadline=deadline)
+        if response is not None:
+            answer = response['completion']
+            assessment = parse_assessment(answer)
+    if assessment is None:
+        return None, answer
+    return assessment.score, assessment.render()
+
+
+def _evaluate_rule_safe(rule_id: str, rule: str, prompt: str, model: LlmApiModel = EVALUATION_MODEL,
+                        deadline: Optional[float] = None, content: Optional[str] = None):
+    # a failing rule must not take the rest of the job down with it,
+    # a score of None marks the failure for the caller; a missed deadline is
+    # not a failure and is left to the caller
+    try:
+        return evaluate_rule(rule, prompt, model, deadline, content)
+    except DeadlineExceededError:
+        raise
+    except Exception as e:
+        logger.exception(f"Evaluation of rule {rule_id} failed: {e}")
+        return None, f"Evaluation failed for rule {rule_id}: {e}"
+
+
+def evaluate_rule_routed(rule_id: str, rule: str, prompt: str, route: ModelRoute, start: int = 0,
+                         content: Optional[str] = None) -> Tuple[Optional[int], str, str]:
+    """
+    Evaluate a rule along its model route, starting with ``route.models[start]``.
+
+    A stronger model is only asked when the score falls in the escalation band
+    of the route or the answer did not parse. Returns (score, answer, model).
+    Raises DeadlineExceededError when no model answered within the rule
+    deadline, an escalation cut short by the deadline keeps the earlier answer.
+    """
+    deadline = rule_deadline()
+    last = len(route.models) - 1
+    for position in range(start, last + 1):
+        model = route.models[position]
+        try:
+            score, answer = _evaluate_rule_safe(rule_id, rule, prompt, model, deadline, content)
+        except DeadlineExceededError:
+            if position == start:
+                raise
+            logger.warning(f"Escalation of rule {rule_id} to {model.value} missed the deadline, "
+                           f"keeping the answer of {route.models[position - 1].value}")
+            return score, answer, route.models[position - 1].value
+        if position == last or not route.should_escalate(score):
+            break
+        model_metrics.increment(model.value, "escalations")
+        logger.info(f"Escalating rule {rule_id} from {model.value} to {route.models[position + 1].value} (score {score})")
+    return score, answer, model.value
+
+
+def build_batch_content(rules: Sequence[str]) -> str:
+    return ''.join((
+        'TASK: You evaluate documents based on several evaluation criteria and provide a rating out of 10 for each of them.',
+        'Evaluate the document separately against every rule below. ',
+        'EVALUATION CRITERIA: ',
+        '\n'.join(rules),
+        'SCORING: The scoring is out of 10 and you always give a score for every rule. ',
+        'OUTPUT: Answer only with a JSON array containing one object per rule, in the order of the rules, like ',
+        '[{"rule_id": "<Rule ID>", "score": 5, "feedback": "Your document still needs work, for example it is missing contact information.", "evidence": ["Contact: TBD"]}]',
+    ))
+
+
+def _parse_batch_answer(answer: str, rule_ids: Sequence[str]) -> Optional[List[Tuple[int, str]]]:
+    """Per-rule (score, answer) pairs from a batch answer, None when it does not parse."""
+    assessments = parse_batch_assessments(answer, rule_ids)
+    if assessments is None:
+        return None
+    return [(assessment.score, assessment.render()) for assessment in assessments]
+
+
+def evaluate_rule_batch(rules: Sequence[str], rule_ids: Sequence[str], prompt: str, max_completion_tokens: int,
+                        model: LlmApiModel = EVALUATION_MODEL):
+    """
+    Evaluate several rules of the same section in one request.
+
+    Returns the (score, answer) pairs in rule order or None when the answer is
+    not the expected JSON, so the caller can fall back to one request per rule.
+    Raises DeadlineExceededError when the batch missed the rule deadline.
+    """
+    genext_api = GenextAPI(
+        question=prompt,
+        model_name=model,
+        temperature=EVALUATION_TEMPERATURE,
+        max_completion_token_count=max_completion_tokens,
+        content=build_batch_content(rules)
+    )
+
+    try:
+        response = genext_api.run(deadline=rule_deadline())
+    except DeadlineExceededError:
+        raise
+    except Exception as e:
+        logger.exception(f"Batch evaluation of rules {', '.join(rule_ids)} failed: {e}")
+        return None
+    if response is None:
+        return None
+    results = _parse_batch_answer(response['completion'], rule_ids)
+    if results is None:
+        logger.warning(f"Could not parse batch answer for rules {', '.join(rule_ids)}, falling back to single rules")
+    return results
+
+
+def _merge_chunk_results(results: List[Tuple[Optional[int], str, str]], chunks: List[PromptChunk],
+                         timed_out: bool = False):
+    """
+    Reduce the per-chunk (score, answer, model) results of one rule to a single result.
+
+    A rule with a chunk that missed the deadline or failed has no score (None),
+    a score of the remaining chunks alone would overrate it.
+    """
+    if len(results) == 1:
+        return results[0]
+    # chunks may have been answered by different models of the route
+    model = ', '.join(dict.fromkeys(m for _, _, m in results))
+    if timed_out or any(score is None for score, _, _ in results):
+        return None, '\n\n'.join(answer for _, answer, _ in results if answer), model
+
+    score = merge_scores([s for s, _, _ in results], weights=[chunk.tokens for chunk in chunks])
+    answer = '\n\n'.join(f"Part {i}/{len(results)} (score {s}): {a}"
+                          for i, (s, a, _) in enumerate(results, start=1))
+    return score, answer, model
+
+
+@dataclass(frozen=True)
+class ParsedDocument:
+    """A document parsed once and shared by every stage of an evaluation."""
+    content_hash: str
+    parser: DocParser
+    text: str
+    index: SectionIndex
+
+    @property
+    def root(self) -> DocNode:
+        return self.parser.root
+
+    def section_text(self, section: str) -> str:
+        return self.index.section_text(section)
+
+
+@dataclass(frozen=True)
+class ParsedChecklist:
+    """The rules of a checklist, in checklist order."""
+    content_hash: str
+    sections: Tuple[str, ...]
+    rules: Tuple[str, ...]
+    rule_ids: Tuple[str, ...]
+    # the model route per rule, empty for the default route of every rule
+    routes: Tuple[ModelRoute, ...] = ()
+    # the rendered system prompt per rule, empty to render them on demand
+    system_prompts: Tuple[str, ...] = ()
+
+    def route(self, index: int) -> ModelRoute:
+        return self.routes[index] if self.routes else default_route(EVALUATION_MODEL)
+
+    def system_prompt(self, index: int) -> str:
+        return self.system_prompts[index] if self.system_prompts else build_content(self.rules[index])
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON serialisable form, the content hash is kept by the caller."""
+        return {
+            "sections": list(self.sections),
+            "rules": list(self.rules),
+            "rule_ids": list(self.rule_ids),
+            "routes": [route.to_dict() for route in self.routes],
+            "system_prompts": list(self.system_prompts),
+        }
+
+    @classmethod
+    def from_dict(cls, content_hash: str, data: Dict[str, Any]) -> "ParsedChecklist":
+        return cls(content_hash, tuple(data["sections"]), tuple(data["rules"]), tuple(data["rule_ids"]),
+                   tuple(ModelRoute.from_dict(route) for route in data.get("routes", [])),
+                   tuple(data.get("system_prompts", [])))
 
-        lt_score.append(score)
-        lt_answer.append(answer)
 
-    return lt_score, lt_answer
+_document_cache = ArtifactCache(settings.DOCUMENT_CACHE_SIZE)
+_checklist_cache = ArtifactCache(settings.CHECKLIST_CACHE_SIZE)
 
 
-def perform_evaluation(document_path, yaml_file_path):
+def _read_file(file_path: str) -> Tuple[bytes, str]:
+    with open(file_path, 'rb') as file:
+        data = file.read()
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def render_document(parser: DocParser) -> str:
+    tree = parser.tree
+    texts = (("  " * level, tree.text(i)) for i, level in tree.walk())
+    return ''.join(f"{indent}- {text}\n" for indent, text in texts if text != '')
+
+
+def document_from_tree(content_hash: str, tree: DocTree) -> ParsedDocument:
+    """Wrap an already parsed tree, e.g. one restored from the artifact store."""
+    parser = DocParser()
+    parser.tree = tree
+    return ParsedDocument(content_hash, parser, render_document(parser), SectionIndex(tree))
+
+
+def load_document(document_path: str, sections: Optional[Sequence[str]] = None) -> ParsedDocument:
+    """
+    Parse a PDF or .docx document, reusing an earlier parse of identical content.
+
+    With ``sections`` the loader may load only the parts of the document that
+    contain them; such a partial parse is cached and hashed separately.
+    """
+    _, content_hash = _read_file(document_path)
+    if sections is not None:
+        content_hash = f"{content_hash}-{_fingerprint('sections', *sorted(set(sections)))[:16]}"
+
+    def parse() -> ParsedDocument:
+        loader = get_loader(document_path)
+        loader.load(sections)
+        return document_from_tree(content_hash, loader.tree)
+
+    return _document_cache.get_or_create(content_hash, parse)
+
+
+def document_sections(checklist: ParsedChecklist) -> Optional[Tuple[str, ...]]:
+    """
+    The sections to load of a document evaluated against ``checklist``, None
+    for the whole document. Rules without section and retrieval need all of it.
+    """
+    if not settings.LAZY_SECTION_LOADING or settings.EVAL_RETRIEVAL or '' in checklist.sections:
+        return None
+    return checklist.sections
+
+
+def load_checklist(yaml_file_path: str) -> ParsedChecklist:
+    """
+    The compiled checklist of a YAML file, reusing an earlier compilation of
+    identical content. Raises ChecklistError when the checklist is malformed.
+    """
+    # imported here, the compiler depends on this module
+    from worker.utils.checklist_compiler import load_compiled_checklist
+
+    data, content_hash = _read_file(yaml_file_path)
+    return _checklist_cache.get_or_create(content_hash, lambda: load_compiled_checklist(data, content_hash))
+
+
+def _budget_model(route: ModelRoute) -> LlmApiModel:
+    # prompts must fit every model of the route, size them for the smallest context
+    return min(route.models, key=lambda model: MODEL_CONTEXT_TOKENS.get(model, 8_192))
+
+
+def _batch_max_completion_tokens(rule_count: int) -> int:
+    return min(EVALUATION_MAX_COMPLETION_TOKENS * rule_count, 4096)
+
+
+def _retrieve_rule_texts(document: ParsedDocument, sections: Sequence[str], rules: Sequence[str],
+                         texts: Sequence[Tuple[str, bool]]) -> dict:
+    """
+    Top-k document chunks for the rules that would otherwise get the whole
+    document or whose section was not found. Falls back to the original text
+    when the embedding API is unavailable.
+    """
+    indices = [i for i, (section, (text, _)) in enumerate(zip(sections, texts))
+               if section == '' or not text.strip()]
+    if not indices:
+        return {}
+    try:
+        retriever = get_document_retriever(document.content_hash, document.text)
+        # concurrent evaluations in the worker share the requests for their rules
+        rule_vectors = embed_texts([rules[i] for i in indices], coalesce=True)
+        return dict(zip(indices, retriever.retrieve(rule_vectors)))
+    except Exception as e:
+        logger.exception(f"Retrieval failed, evaluating on the full text: {e}")
+        return {}
+
+
+def do_evaluation(document: ParsedDocument, checklist: ParsedChecklist, max_workers: Optional[int] = None,
+                  batch_rules: Optional[bool] = None, use_retrieval: Optional[bool] = None,
+                  on_result: Optional[Callable[[int, Optional[int], str, str, bool], None]] = None):
+    """
+    Evaluate the document against every rule of the checklist.
+
+    Rules are sent to the LLM concurrently with at most ``max_workers`` requests
+    in flight (defaults to ``settings.EVAL_MAX_CONCURRENCY``, ``1`` evaluates
+    sequentially). Text that does not fit the model context is split into
+    overlapping chunks which are evaluated concurrently and whose scores are
+    merged per rule. With ``batch_rules`` (defaults to ``settings.EVAL_BATCH_RULES``)
+    the rules sharing a section are asked in a single request, a batch whose
+    answer does not parse is re-evaluated rule by rule. With ``use_retrieval``
+    (defaults to ``settings.EVAL_RETRIEVAL``) rules without a matching section
+    only get the document chunks closest to the rule in embedding space.
+    Every rule is evaluated along its model route (see ``evaluate_rule_routed``).
+    With ``settings.EVAL_RULE_DEADLINE`` a rule without an answer in time gets
+    the score None instead of holding up the job.
+    ``on_result(index, score, answer, model, timed_out)`` is called as soon as a
+    rule is scored. Scores, answers, the answering models and whether the rule
+    missed its deadline are returned in rule order.
+    """
+    sections, rules, rules_id = checklist.sections, checklist.rules, checklist.rule_ids
+    routes = [checklist.route(index) for index in range(len(rules))]
+    if batch_rules is None:
+        batch_rules = settings.EVAL_BATCH_RULES
+
+    # the text every rule is evaluated on, a rule without section gets the whole document
+    texts: List[Tuple[str, bool]] = [
+        (document.section_text(section), True) if section != '' else (document.text, False)
+        for section in sections
+    ]
+    if use_retrieval is None:
+        use_retrieval = settings.EVAL_RETRIEVAL
+    retrieved = _retrieve_rule_texts(document, sections, rules, texts) if use_retrieval else {}
+    for index, text in retrieved.items():
+        texts[index] = (text, True)
+
+    # group the rules by section and route, retrieved texts are specific to their rule
+    groups: "OrderedDict[object, List[int]]" = OrderedDict()
+    for index, section in enumerate(sections):
+        key = ('retrieved', index) if index in retrieved else (section, routes[index])
+        groups.setdefault(key, []).append(index)
+
+    def rule_chunks(index: int) -> List[PromptChunk]:
+        text, quoted = texts[index]
+        builder = PromptBuilder(_budget_model(routes[index]), EVALUATION_MAX_COMPLETION_TOKENS)
+        return builder.build(text, checklist.system_prompt(index), quoted=quoted)
+
+    # build one batch prompt per section that fits in a single request
+    batches = []
+    single_rules = []
+    for indices in groups.values():
+        if batch_rules and len(indices) > 1:
+            text, quoted = texts[indices[0]]
+            batch_tokens = _batch_max_completion_tokens(len(indices))
+            chunks = PromptBuilder(_budget_model(routes[indices[0]]), batch_tokens).build(
+                text, build_batch_content([rules[i] for i in indices]), quoted=quoted)
+            if len(chunks) == 1:
+                batches.append((indices, chunks[0].prompt, batch_tokens))
+                continue
+        single_rules.extend(indices)
+
+    # evaluate the document
+    if max_workers is None:
+        max_workers = settings.EVAL_MAX_CONCURRENCY
+    # not capped by the rule count, a rule may be split into several chunk requests;
+    # the pool only starts threads for the requests actually submitted
+    max_workers = max(1, max_workers)
+    logger.info(f"Evaluating {len(rules)} rules in {len(batches)} batches and {len(single_rules)} single rules "
+                f"with {max_workers} concurrent requests")
+
+    results: List[Optional[Tuple[int, str, str]]] = [None] * len(rules)
+    # rules finished without an answer within the deadline
+    missed = [False] * len(rules)
+
+    def finish(index: int, result: Tuple[int, str, str], timed_out_rule: bool = False):
+        results[index] = result
+        missed[index] = timed_out_rule
+        if on_result is not None:
+            on_result(index, *result, timed_out_rule)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="evaluate-rule") as executor:
+        # future -> ('batch', rule indices) or ('chunk', (rule index, chunk position))
+        pending = {}
+        rule_chunk_lists = {}
+        chunk_results = {}
+        timed_out = set()
+        # batch answers of escalated rules, kept when the escalation misses the deadline
+        batch_answers = {}
+
+        def submit_rule(index: int, start: int = 0):
+            chunks = rule_chunks(index)
+            rule_chunk_lists[index] = chunks
+            chunk_results[index] = [None] * len(chunks)
+            for position, chunk in enumerate(chunks):
+                future = executor.submit(evaluate_rule_routed, rules_id[index], rules[index], chunk.prompt,
+                                         routes[index], start, checklist.system_prompt(index))
+                pending[future] = ('chunk', (index, position))
+
+        for indices, prompt, batch_tokens in batches:
+            future = executor.submit(evaluate_rule_batch, [rules[i] for i in indices],
+                                     [rules_id[i] for i in indices], prompt, batch_tokens,
+                                     routes[indices[0]].models[0])
+            pending[future] = ('batch', indices)
+        for index in single_rules:
+            submit_rule(index)
+
+        # handle results in completion order so callers see every rule as soon as it is scored
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, key = pending.pop(future)
+                if kind == 'batch':
+                    if isinstance(future.exception(), DeadlineExceededError):
+                        logger.warning(f"Batch of rules {', '.join(rules_id[i] for i in key)} missed the deadline")
+                        for index in key:
+                            finish(index, (None, timed_out_answer([rules_id[index]]), routes[index].models[0].value),
+                                   timed_out_rule=True)
+                        continue
+                    batch_results = future.result()
+                    if batch_results is None:
+                        for index in key:
+                            submit_rule(index)
+                    else:
+                        for index, (score, answer) in zip(key, batch_results):
+                            route = routes[index]
+                            if len(route.models) > 1 and route.should_escalate(score):
+                                # the cheap model already answered in the batch, continue with the next one
+                                model_metrics.increment(route.models[0].value, "escalations")
+                                batch_answers[index] = (score, answer, route.models[0].value)
+                                submit_rule(index, start=1)
+                            else:
+                                finish(index, (score, answer, route.models[0].value))
+                else:
+                    index, position = key
+                    partial = chunk_results[index]
+                    if isinstance(future.exception(), DeadlineExceededError):
+                        logger.warning(f"Rule {rules_id[index]} missed the deadline")
+                        timed_out.add(index)
+                        partial[position] = (None, timed_out_answer([rules_id[index]]),
+                                             routes[index].models[0].value)
+                    else:
+                        partial[position] = future.result()
+                    if all(result is not None for result in partial):
+                        if index in timed_out and index in batch_answers and len(partial) == 1:
+                            finish(index, batch_answers[index])
+                        else:
+                            finish(index, _merge_chunk_results(partial, rule_chunk_lists[index], index in timed_out),
+                                   timed_out_rule=index in timed_out)
+
+    lt_score = [score for score, _, _ in results]
+    lt_answer = [answer for _, answer, _ in results]
+    lt_model = [model for _, _, model in results]
+    logger.info(f"Model metrics: {model_metrics.snapshot()}")
+
+    return lt_score, lt_answer, lt_model, missed
+
+
+def checklist_subset(checklist: ParsedChecklist, indices: Sequence[int]) -> ParsedChecklist:
+    """The rules at ``indices`` as a checklist of their own, e.g. for one subtask."""
+    return ParsedChecklist(
+        checklist.content_hash,
+        tuple(checklist.sections[i] for i in indices),
+        tuple(checklist.rules[i] for i in indices),
+        tuple(checklist.rule_ids[i] for i in indices),
+        tuple(checklist.routes[i] for i in indices) if checklist.routes else (),
+        tuple(checklist.system_prompts[i] for i in indices) if checklist.system_prompts else (),
+    )
+
+
+def _fingerprint(*parts: str) -> str:
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+def section_fingerprint(document: ParsedDocument, section: str) -> str:
+    """Fingerprint of the text a rule of ``section`` is evaluated on."""
+    return _fingerprint('section', document.section_text(section) if section != '' else document.text)
+
+
+def rule_fingerprint(rule: str, rule_id: str, route: Optional[ModelRoute] = None) -> str:
+    """Fingerprint of a rule together with everything that shapes its answer."""
+    route = route or ModelRoute((EVALUATION_MODEL,))
+    return _fingerprint('rule', route.describe(), str(EVALUATION_TEMPERATURE),
+                        str(EVALUATION_MAX_COMPLETION_TOKENS), rule_id, build_content(rule))
+
+
+def evaluation_fingerprints(document: ParsedDocument, checklist: ParsedChecklist) -> List[Tuple[str, str]]:
+    """``(section fingerprint, rule fingerprint)`` of every rule, in rule order."""
+    section_fingerprints = {section: section_fingerprint(document, section) for section in set(checklist.sections)}
+    return [(section_fingerprints[section], rule_fingerprint(rule, rule_id, checklist.route(index)))
+            for index, (section, rule, rule_id) in enumerate(zip(checklist.sections, checklist.rules,
+                                                                 checklist.rule_ids))]
+
+
+def build_finding(section: str, score: Optional[int], answer: str, rule_id: Optional[str] = None,
+                  fingerprints: Optional[Tuple[str, str]] = None, model: Optional[str] = None,
+                  timed_out: bool = False) -> dict:
+    finding = {
+        "section_name": section,
+        "summary": f"Score: {score} for section {section}",
+        "score": score,
+        "details": answer
+    }
+    if timed_out:
+        finding["score"] = None
+        finding["summary"] = f"No score for section {section} within the deadline"
+        finding["timed_out"] = True
+    elif score is None:
+        # the job API expects a number, a failed rule keeps reporting 0 as before
+        finding["score"] = 0
+        finding["summary"] = f"Evaluation failed for section {section}"
+        finding["failed"] = True
+    if rule_id is not None:
+        finding["rule_id"] = rule_id
+    if fingerprints is not None:
+        finding["section_fingerprint"], finding["rule_fingerprint"] = fingerprints
+    if model is not None:
+        finding["model"] = model
+    return finding
+
+
+def build_findings(sections: Sequence[str], lt_score: Sequence[int], lt_answer: Sequence[str],
+                   rule_ids: Optional[Sequence[str]] = None,
+                   fingerprints: Optional[Sequence[Tuple[str, str]]] = None,
+                   models: Optional[Sequence[str]] = None,
+                   timed_out: Optional[Sequence[bool]] = None) -> List[dict]:
+    return [
+        build_finding(section, score, answer,
+                      rule_ids[i] if rule_ids is not None else None,
+                      fingerprints[i] if fingerprints is not None else None,
+                      models[i] if models is not None else None,
+                      timed_out[i] if timed_out is not None else False)
+        for i, (section, score, answer) in enumerate(zip(sections, lt_score, lt_answer))
+    ]
+
+
+def perform_evaluation(document_path, yaml_file_path, max_workers: Optional[int] = None, batch_rules: Optional[bool] = None):
     # document_path = '/home/qxz1viq/doc_eval_latest/evaluation_processor/data/example_doc.docx'
     # yaml_file_path = '/home/qxz1viq/doc_eval_latest/evaluation_processor/data/checklist.yaml'
 
-    val_rules = ValidationRules()
-    rule_data = val_rules.read_yaml_file(yaml_file_path)
-    sections, rules, rules_id = val_rules.create_list_of_rules(rule_data)
-    
-
-    lt_score, lt_answer = do_evaluation(document_path, yaml_file_path)
-
-    findings = []
-    for section, score, answer in zip(sections, lt_score, lt_answer):
-        findings.append({
-            "section_name": section,
-            "summary": f"Score: {score} for section {section}",
-            "score": score,
-            "details": answer
-        })
+    # parse both inputs once, every later stage works on these artifacts
+    checklist = load_checklist(yaml_file_path)
+    document = load_document(document_path, document_sections(checklist))
+
+    lt_score, lt_answer, lt_model, lt_timed_out = do_evaluation(document, checklist, max_workers=max_workers,
+                                                                batch_rules=batch_rules)
+
+    findings = build_findings(checklist.sections, lt_score, lt_answer, models=lt_model, timed_out=lt_timed_out)
 
     print(findings)
     return findings
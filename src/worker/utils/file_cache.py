@@ -0,0 +1,251 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import httpx
+from opentelemetry import metrics
+
+from worker.core.config import settings
+from worker.utils.helper import cache_validators, download_file, get_http_client
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_meter = metrics.get_meter(__name__)
+
+
+class FileCache:
+    """
+    Worker-local cache of downloaded checklists and documents.
+
+    Contents are stored once per SHA-256 under ``blobs/``, the ETag and
+    Last-Modified of every URL under ``urls/``. A cached URL is fetched with a
+    conditional GET and a 304 answer serves the local copy, so a file is only
+    transferred again when it changed. The least recently used blobs are
+    evicted above ``max_bytes``. Hits, misses and saved bytes are exported
+    as OpenTelemetry counters, the hit ratio and cached bytes as gauges.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, meter: Optional[metrics.Meter] = None):
+        meter = meter or _meter
+        self.directory = Path(directory)
+        self.blobs = self.directory / "blobs"
+        self.urls = self.directory / "urls"
+        self.tmp = self.directory / "tmp"
+        for path in (self.blobs, self.urls, self.tmp):
+            path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self._lock = threading.Lock()
+        self._size = sum(path.stat().st_size for path in self._entries())
+        self._requests = meter.create_counter("file_cache.requests", unit="{request}",
+                                              description="Checklist and document fetches, by cache hit")
+        self._bytes_saved = meter.create_counter("file_cache.bytes_saved", unit="By",
+                                                 description="Bytes served from the cache instead of downloaded")
+        meter.create_observable_gauge("file_cache.hit_ratio", callbacks=[self._observe_hit_ratio], unit="1",
+                                      description="Share of the fetches of this worker served from the cache")
+        meter.create_observable_gauge("file_cache.size", callbacks=[self._observe_size], unit="By",
+                                      description="Bytes of cached files of this worker")
+
+    def _entries(self):
+        return self.blobs.glob("*/*")
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.blobs / digest[:2] / digest
+
+    def _url_path(self, url: str) -> Path:
+        return self.urls / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+    def _cached(self, url: str) -> Optional[Dict[str, str]]:
+        try:
+            with open(self._url_path(url), "r", encoding="utf-8") as file:
+                meta = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        # the blob may have been evicted since
+        return meta if self._blob_path(meta["sha256"]).exists() else None
+
+    def fetch(self, url: str, local_path: str) -> bool:
+        """Place the current content of ``url`` at ``local_path``, True when it came from the cache."""
+        meta = self._cached(url)
+        tmp_path = str(self.tmp / f"{uuid.uuid4().hex}.download")
+        try:
+            validators = None
+            if meta is not None:
+                try:
+                    validators = self._revalidate(url, meta, tmp_path)
+                except httpx.HTTPError as e:
+                    logger.warning(f"Revalidation of {url} failed, downloading it again: {e}")
+                else:
+                    if validators is None:
+                        blob = self._blob_path(meta["sha256"])
+                        self._touch(blob)
+                        self._place(blob, local_path)
+                        self._count(hit=True, size=meta["size"])
+                        return True
+            if validators is None:
+                validators = download_file(url, tmp_path)
+            blob = self._store(url, tmp_path, validators)
+        finally:
+            _remove_quietly(tmp_path)
+        self._place(blob, local_path)
+        self._count(hit=False)
+        return False
+
+    def _revalidate(self, url: str, meta: Dict[str, str], tmp_path: str) -> Optional[Dict[str, str]]:
+        """
+        Conditional GET of a cached URL, None when it is not modified. A
+        changed file is streamed to ``tmp_path`` and its new validators are
+        returned.
+        """
+        headers = {"Accept-Encoding": "identity"}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        with get_http_client().stream("GET", url, headers=headers) as response:
+            if response.status_code == httpx.codes.NOT_MODIFIED:
+                return None
+            response.raise_for_status()
+            # the file changed, its new content is already on the way
+            with open(tmp_path, "wb") as file:
+                for chunk in response.iter_bytes(settings.DOWNLOAD_CHUNK_SIZE):
+                    file.write(chunk)
+            return cache_validators(response.headers)
+
+    def _store(self, url: str, tmp_path: str, validators: Dict[str, str]) -> Path:
+        digest = hashlib.sha256()
+        with open(tmp_path, "rb") as file:
+            for chunk in iter(lambda: file.read(settings.DOWNLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        blob = self._blob_path(sha256)
+        blob.parent.mkdir(exist_ok=True)
+        size = os.path.getsize(tmp_path)
+        with self._lock:
+            if blob.exists():
+                # same content under another URL or after a revert
+                self._touch(blob)
+            else:
+                os.replace(tmp_path, blob)
+                self._size += size
+        if validators:
+            # without validators the URL cannot be revalidated and is downloaded every time
+            meta_path = self._url_path(url)
+            meta_tmp = meta_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(meta_tmp, "w", encoding="utf-8") as file:
+                json.dump({"url": url, "sha256": sha256, "size": size, **validators}, file)
+            os.replace(meta_tmp, meta_path)
+        with self._lock:
+            if self._size > self.max_bytes:
+                self._evict(keep=blob)
+        return blob
+
+    @staticmethod
+    def _touch(blob: Path):
+        # access time drives eviction, atime updates are often disabled on the mount
+        now = time.time()
+        os.utime(blob, (now, now))
+
+    @staticmethod
+    def _place(blob: Path, local_path: str):
+        # a hard link costs no space and survives eviction of the blob
+        _remove_quietly(local_path)
+        try:
+            os.link(blob, local_path)
+        except OSError:
+            shutil.copyfile(blob, local_path)
+
+    def _evict(self, keep: Path):
+        # called with the lock held, drop least recently used blobs down to 90% of the budget
+        target = self.max_bytes * 0.9
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+                self._size -= size
+            except FileNotFoundError:
+                pass
+        logger.info(f"Evicted cached files, {self._size} bytes left")
+
+    def _count(self, hit: bool, size: int = 0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.bytes_saved += size
+            else:
+                self.misses += 1
+        self._requests.add(1, {"hit": hit})
+        if hit:
+            self._bytes_saved.add(size)
+
+    def _observe_hit_ratio(self, options: metrics.CallbackOptions) -> Iterable[metrics.Observation]:
+        yield metrics.Observation(self.stats()["hit_ratio"])
+
+    def _observe_size(self, options: metrics.CallbackOptions) -> Iterable[metrics.Observation]:
+        yield metrics.Observation(self.stats()["bytes_cached"])
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "bytes_cached": self._size,
+            }
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+_cache: Optional[FileCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_file_cache() -> Optional[FileCache]:
+    """Return the file cache of this worker, or None when it is disabled."""
+    global _cache
+    if not settings.FILE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = FileCache(settings.FILE_CACHE_DIR, settings.FILE_CACHE_MAX_BYTES)
+    return _cache
+
+
+def fetch_file(url: str, local_path: str):
+    """Download ``url`` to ``local_path``, through the file cache when it is enabled."""
+    cache = get_file_cache()
+    if cache is None:
+        download_file(url, local_path)
+    else:
+        cache.fetch(url, local_path)
@@ -0,0 +1,103 @@
+import hashlib
+import logging
+import time
+from typing import List, Optional, Set
+
+from worker.core.config import settings
+from worker.utils.artifact_store import get_artifact_store
+from worker.utils.helper import add_job_findings, update_job_status
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class FindingStream:
+    """
+    Posts the findings of a job in small batches while the evaluation runs.
+
+    A batch is sent once ``batch_size`` findings are buffered or
+    ``flush_interval`` seconds passed, followed by a progress update of the job.
+    The rule ids already posted for the job are kept in Redis, so a retried
+    task or a second subtask never posts a finding twice; each batch also
+    carries an ``Idempotency-Key`` derived from its rule ids. A batch whose post
+    failed is retried unchanged, under the same key, before the next one.
+    """
+
+    def __init__(self, org: str, job_id: str, job_name: str, total: int,
+                 batch_size: Optional[int] = None, flush_interval: Optional[float] = None):
+        self.org = org
+        self.job_id = job_id
+        self.job_name = job_name
+        self.total = total
+        self.batch_size = batch_size or settings.FINDINGS_BATCH_SIZE
+        self.flush_interval = settings.FINDINGS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self._buffer: List[dict] = []
+        self._failed: List[dict] = []
+        self._posted: Set[str] = set()
+        self._posted_key = f"findings-posted:{org}:{job_id}"
+        self._last_flush = time.monotonic()
+
+    def add(self, finding: dict):
+        self._buffer.append(finding)
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def close(self):
+        """Post what is left, failures are raised since nothing will retry them."""
+        self.flush(raise_errors=True)
+
+    def _already_posted(self, rule_ids: List[str]) -> Set[str]:
+        posted = {rule_id for rule_id in rule_ids if rule_id in self._posted}
+        try:
+            flags = get_artifact_store().redis.smismember(self._posted_key, rule_ids)
+            posted.update(rule_id for rule_id, flag in zip(rule_ids, flags) if flag)
+        except Exception as e:
+            logger.warning(f"Could not read posted findings of job {self.job_id}: {e}")
+        return posted
+
+    def _mark_posted(self, rule_ids: List[str]) -> int:
+        """Remember ``rule_ids`` as posted, returns the number of findings posted for the job."""
+        self._posted.update(rule_ids)
+        try:
+            with get_artifact_store().redis.pipeline() as pipe:
+                pipe.sadd(self._posted_key, *rule_ids)
+                pipe.expire(self._posted_key, settings.ARTIFACT_STORE_TTL)
+                pipe.scard(self._posted_key)
+                return pipe.execute()[-1]
+        except Exception as e:
+            logger.warning(f"Could not record posted findings of job {self.job_id}: {e}")
+            return len(self._posted)
+
+    def flush(self, raise_errors: bool = False):
+        self._last_flush = time.monotonic()
+        if self._failed:
+            # the failed post may have reached the API, only the same batch carries the same key
+            batch, self._failed = self._failed, []
+            if not self._post(batch, raise_errors):
+                return
+        if self._buffer:
+            batch, self._buffer = self._buffer, []
+            self._post(batch, raise_errors)
+
+    def _post(self, batch: List[dict], raise_errors: bool) -> bool:
+        """Post the findings of ``batch`` not posted yet, False when it failed and was kept for a retry."""
+        try:
+            posted = self._already_posted([finding["rule_id"] for finding in batch])
+            new = [finding for finding in batch if finding["rule_id"] not in posted]
+            if not new:
+                return True
+            rule_ids = [finding["rule_id"] for finding in new]
+            idempotency_key = hashlib.sha256(
+                '\0'.join([self.job_id, *sorted(rule_ids)]).encode('utf-8')).hexdigest()
+            add_job_findings(self.org, self.job_id, self.job_name, new, idempotency_key=idempotency_key)
+            done = self._mark_posted(rule_ids)
+            logger.info(f"Posted {len(new)} findings of job {self.job_id}, {done}/{self.total} rules done")
+            update_job_status(self.org, self.job_id, self.job_name, "running", progress=(done, self.total))
+            return True
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.warning(f"Posting findings of job {self.job_id} failed, retrying with the next flush: {e}")
+            self._failed = batch
+            return False
@@ -2,14 +2,18 @@ from dotenv import load_dotenv
 import os
 from pathlib import Path
 from enum import Enum
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 import requests
 import json
 import time
+import random
+import threading
 from http import HTTPStatus
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
 import logging
 from worker.core.config import settings
+from worker.utils.llm_cache import ResponseCache, cache_key, get_response_cache
 
 # Configure logger
 logger = logging.getLogger(__name__)
@@ -46,8 +50,47 @@ CONFIG = {
 
 ENVIRONMENT = "PROD"
 POLLING_INTERVAL = 0.6
+# refresh the M2M token this many seconds before it actually expires
+TOKEN_EXPIRY_MARGIN = 60
+# used when the auth endpoint does not report an expiry
+DEFAULT_TOKEN_LIFETIME = 300
 
 API_BASE_PATH = f"https://{CONFIG[ENVIRONMENT]['HOSTNAME']}/generaid/llm/v1"
+AUTH_ENDPOINT = f"https://{'auth' if ENVIRONMENT == 'PROD' else 'auth-i'}.bmwgroup.net/auth/oauth2/realms/root/realms/machine2machine/access_token"
+CHAT_REQUEST_PATH = f"{API_BASE_PATH}/tenant_id/text-prediction/generate-chat-request"
+EMBEDDING_REQUEST_PATH = f"{API_BASE_PATH}/tenant_id/embedding/generate-embedding-request"
+
+
+# gateway answers worth another attempt after a pause
+RETRYABLE_STATUS = {HTTPStatus.TOO_MANY_REQUESTS, HTTPStatus.BAD_GATEWAY, HTTPStatus.SERVICE_UNAVAILABLE,
+                    HTTPStatus.GATEWAY_TIMEOUT, HTTPStatus.INTERNAL_SERVER_ERROR}
+
+
+class PollingTimeoutError(Exception):
+    """Raised when a Genext request is still pending after the polling deadline."""
+
+
+class DeadlineExceededError(PollingTimeoutError):
+    """Raised when a Genext request did not finish before the deadline of its caller."""
+
+
+def backoff_delays(initial: Optional[float] = None, maximum: Optional[float] = None, factor: float = 2.0):
+    """Yield exponentially growing polling delays with jitter, capped at ``maximum``."""
+    delay = settings.GENEXT_POLL_INITIAL_INTERVAL if initial is None else initial
+    maximum = settings.GENEXT_POLL_MAX_INTERVAL if maximum is None else maximum
+    while True:
+        # jitter keeps many pollers from hitting the gateway in lockstep
+        yield random.uniform(delay / 2, delay)
+        delay = min(delay * factor, maximum)
+
+
+def token_request_data() -> Dict[str, str]:
+    return {
+        "grant_type": "client_credentials",
+        "client_id": CONFIG[ENVIRONMENT]["CLIENT_ID"],
+        "client_secret": CONFIG[ENVIRONMENT]["CLIENT_SECRET"],
+        "scope": "machine2machine",
+    }
 
 
 
@@ -62,14 +105,19 @@ class LlmApiModel(str, Enum):
 
 
 class GenextAPI:
-    def __init__(self, question: str, model_name: LlmApiModel = LlmApiModel.HAIKU, temperature: float = 0.0, max_completion_token_count: int = 400, content: str = "You are a friendly AI assistant, helping humans with their questions."):
+    def __init__(self, question: str, model_name: LlmApiModel = LlmApiModel.HAIKU, temperature: float = 0.0, max_completion_token_count: int = 400, content: str = "You are a friendly AI assistant, helping humans with their questions.", client: Optional["GenextClient"] = None, cache: Optional[ResponseCache] = None, cache_nondeterministic: bool = False):
         self.question = question
+        self.client = client
+        self.cache = cache
+        self.cache_nondeterministic = cache_nondeterministic
         self.model_name = model_name
         self.temperature = temperature
         self.max_completion_token_count = max_completion_token_count
         self.content = content
         self.conversation_id = None  # Added this line
-        
+        # counted on first use, the payload does not change after __init__
+        self._prompt_token_count: Optional[int] = None
+
         self.payload = self._create_payload()
         
     def _create_payload(self) -> Dict[str, Any]:
@@ -140,53 +188,137 @@ class GenextAPI:
 
     @staticmethod
     def get_webeam_access_token(requests_session: requests.Session) -> str:
-        auth_endpoint = f"https://{'auth' if ENVIRONMENT == 'PROD' else 'auth-i'}.bmwgroup.net/auth/oauth2/realms/root/realms/machine2machine/access_token"
+        access_token, _ = GenextAPI.request_webeam_access_token(requests_session)
+        return access_token
+
+    @staticmethod
+    def request_webeam_access_token(requests_session: requests.Session) -> Tuple[str, int]:
+        """Request a new M2M token, returns the token and its lifetime in seconds."""
         auth_response = requests_session.post(
-            auth_endpoint,
+            AUTH_ENDPOINT,
             headers={"Content-Type": "application/x-www-form-urlencoded"},
-            data={
-                "grant_type": "client_credentials",
-                "client_id": CONFIG[ENVIRONMENT]["CLIENT_ID"],
-                "client_secret": CONFIG[ENVIRONMENT]["CLIENT_SECRET"],
-                "scope": "machine2machine",
-            },
+            data=token_request_data(),
         )
         if auth_response.status_code != HTTPStatus.OK:
             raise Exception(
                 f"OAuth2 authentication failed. HTTP status code: {auth_response.status_code}."
             )
         else:
-            access_token = auth_response.json().get("access_token")
+            token_data = auth_response.json()
+            access_token = token_data.get("access_token")
+            expires_in = int(token_data.get("expires_in") or DEFAULT_TOKEN_LIFETIME)
             logger.info("Successfully received WEN token.")
-            return access_token
+            return access_token, expires_in
 
     def get_generate_chat_request(self, requests_session: requests.Session, request_id: str) -> Any:
         response = requests_session.get(
-            f"{API_BASE_PATH}/tenant_id/text-prediction/generate-chat-request/{request_id}"
+            f"{CHAT_REQUEST_PATH}/{request_id}"
         )
         return response.json()
 
     @staticmethod
     def post_generate_chat_request(requests_session: requests.Session, payload: Any) -> str:
         response = requests_session.post(
-            f"{API_BASE_PATH}/tenant_id/text-prediction/generate-chat-request",
+            CHAT_REQUEST_PATH,
             json=payload,
         )
         return response.json()["request_id"]
 
-    def poll_get_generate_chat_request(self, requests_session: requests.Session, request_id: str):
+    def poll_get_generate_chat_request(self, requests_session: requests.Session, request_id: str,
+                                       deadline: Optional[float] = None, hedge_after: Optional[float] = None):
+        """
+        Poll until the request is no longer pending.
+
+        ``deadline`` (a ``time.monotonic()`` value) ends polling before the poll
+        timeout. With ``hedge_after`` a duplicate of the request is posted once
+        the first one is still pending after that many seconds; both are polled
+        and whichever finishes first wins, the other one is ignored. Failed
+        status requests are retried up to the same deadline, see
+        ``_poll_retry_delay``.
+        """
         logger.info(f"Start polling for request with ID {request_id}")
-        start_time = time.time()
-        count = 0
-        while count < 50:
-            response = self.get_generate_chat_request(requests_session, request_id)
-            if response["status"] != "PENDING":
-                duration = time.time() - start_time
-                logger.info(f"Finished polling after {duration:.2f} seconds.")
-                self.conversation_id = response.get("conversation_id")  # Added this line
-                return response
-            time.sleep(POLLING_INTERVAL)
-        raise Exception("Polling took too long, aborting")
+        start_time = time.monotonic()
+        poll_deadline = start_time + settings.GENEXT_POLL_TIMEOUT
+        if deadline is not None:
+            poll_deadline = min(poll_deadline, deadline)
+        model = LlmApiModel(self.model_name).value
+        request_ids = [request_id]
+        for delay in backoff_delays(initial=POLLING_INTERVAL):
+            wait = None
+            for current_id in request_ids:
+                try:
+                    response = self.get_generate_chat_request(requests_session, current_id)
+                except HTTPError as e:
+                    wait = self._poll_retry_delay(model, e)
+                    if wait is None:
+                        raise
+                    break
+                if response["status"] != "PENDING":
+                    duration = time.monotonic() - start_time
+                    logger.info(f"Finished polling after {duration:.2f} seconds.")
+                    if current_id != request_id:
+                        self._count("hedge_wins")
+                    self.conversation_id = response.get("conversation_id")  # Added this line
+                    return response
+            now = time.monotonic()
+            if wait is not None:
+                delay = max(delay, wait)
+            elif hedge_after is not None and len(request_ids) == 1:
+                if now - start_time >= hedge_after:
+                    if self._hedge(requests_session, request_ids):
+                        logger.info(f"Request {request_id} still pending after {hedge_after:.1f} seconds, "
+                                    f"hedged with request {request_ids[-1]}")
+                    else:
+                        hedge_after = None
+                    continue
+                # wake up in time to hedge
+                delay = min(delay, start_time + hedge_after - now)
+            if now + delay > poll_deadline:
+                break
+            time.sleep(delay)
+        if deadline is not None and poll_deadline == deadline:
+            raise DeadlineExceededError(f"Request {request_id} still pending at the deadline, aborting")
+        raise PollingTimeoutError(f"Polling for request {request_id} took too long, aborting")
+
+    def _hedge(self, requests_session: requests.Session, request_ids: list) -> bool:
+        # a duplicate is only worth it when the rate limit has room for it right away
+        from worker.utils.rate_limiter import get_rate_limiter
+
+        limiter = get_rate_limiter()
+        model = LlmApiModel(self.model_name).value
+        if limiter is not None and not limiter.try_acquire(model, self._estimated_tokens()):
+            logger.info(f"Not hedging {model}, no rate limit budget left")
+            return False
+        try:
+            request_ids.append(self.post_generate_chat_request(requests_session, self.payload))
+        except HTTPError as e:
+            logger.warning(f"Could not send hedged request: {e}")
+            return False
+        from worker.utils.model_metrics import model_metrics
+
+        # the duplicate is billed too, its answer is not counted when it loses
+        model_metrics.record_tokens(model, self._prompt_tokens())
+        self._count("hedged")
+        return True
+
+    def _count(self, name: str):
+        from worker.utils.model_metrics import model_metrics
+
+        model_metrics.increment(LlmApiModel(self.model_name).value, name)
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds after which a pending chat request is hedged, None when hedging is off."""
+        if not settings.GENEXT_HEDGE:
+            return None
+        from worker.utils.model_metrics import model_metrics
+
+        percentile = model_metrics.latency_percentile(LlmApiModel(self.model_name).value,
+                                                      settings.GENEXT_HEDGE_PERCENTILE,
+                                                      min_samples=settings.GENEXT_HEDGE_MIN_SAMPLES)
+        # too few samples to know what slow means for this model yet
+        if percentile is None:
+            return None
+        return max(percentile, settings.GENEXT_HEDGE_MIN_DELAY)
     
     def post_generate_embedding_request(self, requests_session: requests.Session, input_text: str) -> str:
         payload = {
@@ -194,83 +326,308 @@ class GenextAPI:
             "input": input_text
         }
         response = requests_session.post(
-            f"{API_BASE_PATH}/tenant_id/embedding/generate-embedding-request",
+            EMBEDDING_REQUEST_PATH,
             json=payload,
         )
         return response.json()["request_id"]
 
     def get_generate_embedding_request(self, requests_session: requests.Session, request_id: str) -> Any:
         response = requests_session.get(
-            f"{API_BASE_PATH}/tenant_id/embedding/generate-embedding-request/{request_id}"
+            f"{EMBEDDING_REQUEST_PATH}/{request_id}"
         )
         return response.json()
 
     def poll_generate_embedding_request(self, requests_session: requests.Session, request_id: str):
         logger.info(f"Start polling for embedding request with ID {request_id}")
-        start_time = time.time()
-        count = 0
-        while count < 50:
-            response = self.get_generate_embedding_request(requests_session, request_id)
+        start_time = time.monotonic()
+        deadline = start_time + settings.GENEXT_POLL_TIMEOUT
+        for delay in backoff_delays():
+            try:
+                response = self.get_generate_embedding_request(requests_session, request_id)
+            except HTTPError as e:
+                wait = self._poll_retry_delay(LlmApiModel.ADA.value, e)
+                if wait is None:
+                    raise
+                delay = max(delay, wait)
+                response = {"status": "PENDING"}
             if response["status"] != "PENDING":
-                duration = time.time() - start_time
+                duration = time.monotonic() - start_time
                 logger.info(f"Finished polling after {duration:.2f} seconds.")
                 return response
-            time.sleep(1)  # Wait at least 1 second between polls
-        raise Exception("Polling took too long, aborting")
+            if time.monotonic() + delay > deadline:
+                break
+            time.sleep(delay)
+        raise PollingTimeoutError(f"Polling for embedding request {request_id} took too long, aborting")
 
     def generate_embedding(self, input_text: str) -> Any:
+        from worker.utils.prompt_builder import count_tokens
+
+        texts = [input_text] if isinstance(input_text, str) else input_text
+        tokens = sum(count_tokens(text, LlmApiModel.ADA) for text in texts)
+
+        def embed():
+            requests_session = (self.client or get_genext_client()).session
+            request_id = self.post_generate_embedding_request(requests_session, input_text)
+            return self.poll_generate_embedding_request(requests_session, request_id)
+
         try:
-            with requests.Session() as requests_session:
-                requests_session.verify = self.load_and_get_bmw_ca()
-                requests_session.trust_env = False
-                requests_session.proxies = {"http": "", "https": ""}
-                requests_session.hooks = {
-                    "response": lambda r, *args, **kwargs: r.raise_for_status()
-                }
-
-                wen_token = self.get_webeam_access_token(requests_session)
-                requests_session.headers.update(
-                    {
-                        "Accept": "application/json",
-                        "x-apikey": CONFIG[ENVIRONMENT]["API_KEY"],
-                        "Authorization": f"Bearer {wen_token}",
-                    }
-                )
-
-                request_id = self.post_generate_embedding_request(requests_session, input_text)
-                embedding_response = self.poll_generate_embedding_request(requests_session, request_id)
-                #print(embedding_response)
-                logger.info("Received embedding response.")
-                return embedding_response
+            embedding_response = self._call_limited(LlmApiModel.ADA.value, tokens, embed)
+            logger.info("Received embedding response.")
+            return embedding_response
         except HTTPError as e:
                 logger.exception(f"Error with embedding request:\n{e.response.json()}")	
 
-    def run(self, use_m2m=False, m2m_token=""):
+    def _prompt_tokens(self) -> int:
+        if self._prompt_token_count is None:
+            # imported here, prompt_builder depends on this module
+            from worker.utils.prompt_builder import count_tokens
+
+            model = LlmApiModel(self.model_name)
+            self._prompt_token_count = count_tokens(self.content, model) + count_tokens(self.question, model)
+        return self._prompt_token_count
+
+    def _estimated_tokens(self) -> int:
+        return self._prompt_tokens() + self.max_completion_token_count
+
+    @staticmethod
+    def _call_limited(model: str, tokens: int, call, deadline: Optional[float] = None):
+        """
+        Run a gateway call within the shared rate limit of ``model``.
+
+        429 and 5xx answers are retried up to ``GENEXT_MAX_RETRIES`` times after
+        the Retry-After period or an exponential backoff; a 429 also lowers the
+        budget of the model for every worker. No attempt starts after ``deadline``.
+        """
+        from worker.utils.rate_limiter import get_rate_limiter, retry_after_seconds
+
+        limiter = get_rate_limiter()
+        delays = backoff_delays(initial=1.0, maximum=30.0)
+        for attempt in range(settings.GENEXT_MAX_RETRIES + 1):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceededError(f"Deadline passed before attempt {attempt + 1} for {model}")
+            if limiter is not None:
+                limiter.acquire(model, tokens, deadline)
+            try:
+                result = call()
+            except HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status not in RETRYABLE_STATUS or attempt == settings.GENEXT_MAX_RETRIES:
+                    raise
+                retry_after = retry_after_seconds(e.response)
+                if status == HTTPStatus.TOO_MANY_REQUESTS and limiter is not None:
+                    # the limiter blocks the model until Retry-After for every worker
+                    limiter.throttle(model, retry_after)
+                    logger.warning(f"Gateway answered {status} for {model}, retrying once the rate limit allows "
+                                   f"(attempt {attempt + 1} of {settings.GENEXT_MAX_RETRIES})")
+                    continue
+                delay = retry_after if retry_after is not None else next(delays)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    raise DeadlineExceededError(f"Gateway answered {status} for {model}, "
+                                                f"no time left to retry before the deadline") from e
+                logger.warning(f"Gateway answered {status} for {model}, retrying in {delay:.1f} seconds "
+                               f"(attempt {attempt + 1} of {settings.GENEXT_MAX_RETRIES})")
+                time.sleep(delay)
+                continue
+            if limiter is not None:
+                limiter.success(model)
+            return result
+
+    @staticmethod
+    def _poll_retry_delay(model: str, error: HTTPError) -> Optional[float]:
+        """
+        Seconds to wait before polling again after a failed status request, None if it is not retryable.
+
+        The gateway already accepted the request, so only the status request is
+        repeated within the polling deadline; letting the error reach
+        ``_call_limited`` would post the prompt again. A 429 still lowers the
+        budget of the model for every worker.
+        """
+        from worker.utils.rate_limiter import get_rate_limiter, retry_after_seconds
+
+        status = error.response.status_code if error.response is not None else None
+        if status not in RETRYABLE_STATUS:
+            return None
+        retry_after = retry_after_seconds(error.response)
+        limiter = get_rate_limiter()
+        if status == HTTPStatus.TOO_MANY_REQUESTS and limiter is not None:
+            limiter.throttle(model, retry_after)
+        logger.warning(f"Polling {model} answered {status}, polling again without resubmitting the request")
+        return retry_after or 0.0
+
+    def _response_cache(self) -> Optional[ResponseCache]:
+        # sampled answers differ between calls, only cache them on explicit opt-in
+        deterministic = self.temperature == 0
+        if not (deterministic or self.cache_nondeterministic or settings.LLM_CACHE_NONDETERMINISTIC):
+            return None
+        return self.cache or get_response_cache()
+
+    def run(self, use_m2m=False, m2m_token="", deadline: Optional[float] = None):
+        cache = self._response_cache()
+        key = None
+        if cache is not None:
+            key = cache_key(self.payload)
+            cached = cache.get(key)
+            if cached is not None:
+                logger.info(f"Using cached answer {key[:12]}.")
+                self.conversation_id = cached.get("conversation_id")
+                return cached
+
+        from worker.utils.model_metrics import model_metrics
+        from worker.utils.prompt_builder import count_tokens
+
+        model = LlmApiModel(self.model_name)
+        prompt_tokens = self._prompt_tokens()
+        started = time.monotonic()
         try:
-            with requests.Session() as requests_session:
-                requests_session.verify = self.load_and_get_bmw_ca()
-                requests_session.trust_env = False
-                requests_session.proxies = {"http": "", "https": ""}
-                requests_session.hooks = {
-                    "response": lambda r, *args, **kwargs: r.raise_for_status()
-                }
-
-                if use_m2m:
-                    wen_token = m2m_token
-                else:
-                    wen_token = self.get_webeam_access_token(requests_session)
-
-                requests_session.headers.update(
-                    {
-                        "Accept": "application/json",
-                        "x-apikey": CONFIG[ENVIRONMENT]["API_KEY"],
-                        "Authorization": f"Bearer {wen_token}",
-                    }
-                )
-
-                request_id = self.post_generate_chat_request(requests_session, self.payload)
-                answer = self.poll_get_generate_chat_request(requests_session, request_id)
-                logger.info(f"Received answer.")
-                return answer
+            if use_m2m:
+                # caller provided token, do not touch the shared client
+                with GenextClient(static_token=m2m_token) as client:
+                    answer = self._run(client.session, deadline)
+            else:
+                answer = self._call_limited(model.value, prompt_tokens + self.max_completion_token_count,
+                                            lambda: self._run((self.client or get_genext_client()).session, deadline),
+                                            deadline)
         except HTTPError as e:
-            logger.exception(f"Error with request:\n{e.response.json()}")
\ No newline at end of file
+            model_metrics.record(model.value, time.monotonic() - started, prompt_tokens, 0, failed=True)
+            logger.exception(f"Error with request:\n{e.response.json()}")
+            return None
+        except Exception:
+            model_metrics.record(model.value, time.monotonic() - started, prompt_tokens, 0, failed=True)
+            raise
+        model_metrics.record(model.value, time.monotonic() - started, prompt_tokens,
+                             count_tokens(answer.get("completion") or "", model))
+
+        if key is not None and answer.get("completion") is not None:
+            cache.set(key, answer)
+        return answer
+
+    async def arun(self, client: Optional["AsyncGenextClient"] = None, timeout: Optional[float] = None):
+        """Async variant of ``run`` using the shared httpx client of the running event loop."""
+        from worker.utils.genext_async import get_async_genext_client
+
+        client = client or get_async_genext_client()
+        answer = await client.chat(self.payload, timeout=timeout)
+        self.conversation_id = answer.get("conversation_id")
+        logger.info(f"Received answer.")
+        return answer
+
+    async def agenerate_embedding(self, input_text: str, client: Optional["AsyncGenextClient"] = None, timeout: Optional[float] = None) -> Any:
+        from worker.utils.genext_async import get_async_genext_client
+
+        client = client or get_async_genext_client()
+        return await client.embed(input_text, timeout=timeout)
+
+    def _run(self, requests_session: requests.Session, deadline: Optional[float] = None):
+        from worker.utils.model_metrics import model_metrics
+
+        posted = time.monotonic()
+        request_id = self.post_generate_chat_request(requests_session, self.payload)
+        answer = self.poll_get_generate_chat_request(requests_session, request_id, deadline, self._hedge_delay())
+        # the hedging window only sees the gateway, not rate limit waits and retries around it
+        model_metrics.record_gateway_latency(LlmApiModel(self.model_name).value, time.monotonic() - posted)
+        logger.info(f"Received answer.")
+        return answer
+
+
+class GenextClient:
+    """
+    Long-lived HTTPS client for the Genext gateway.
+
+    Holds one pooled keep-alive session for the whole process, resolves the CA
+    bundle once and caches the M2M token until shortly before it expires. The
+    token is attached to every outgoing request, so the session can be shared
+    between threads.
+    """
+
+    def __init__(self, pool_maxsize: Optional[int] = None, static_token: Optional[str] = None):
+        if pool_maxsize is None:
+            pool_maxsize = settings.GENEXT_POOL_MAXSIZE
+        self.ca_path = GenextAPI.load_and_get_bmw_ca()
+
+        self._token = static_token
+        self._token_expires_at = float("inf") if static_token else 0.0
+        self._static_token = static_token is not None
+        self._token_lock = threading.Lock()
+
+        self._auth_session = self._create_session(pool_maxsize=1)
+        self.session = self._create_session(pool_maxsize)
+        self.session.hooks = {"response": [self._on_response]}
+        self.session.headers.update(
+            {
+                "Accept": "application/json",
+                "x-apikey": CONFIG[ENVIRONMENT]["API_KEY"],
+            }
+        )
+        self.session.auth = self._authenticate
+
+    def _create_session(self, pool_maxsize: int) -> requests.Session:
+        session = requests.Session()
+        session.verify = self.ca_path
+        session.trust_env = False
+        session.proxies = {"http": "", "https": ""}
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def get_token(self) -> str:
+        # fast path without the lock, the token is replaced atomically
+        if self._token is not None and time.monotonic() < self._token_expires_at:
+            return self._token
+        with self._token_lock:
+            # another thread may have refreshed while we were waiting
+            if self._token is not None and time.monotonic() < self._token_expires_at:
+                return self._token
+            token, expires_in = GenextAPI.request_webeam_access_token(self._auth_session)
+            self._token = token
+            self._token_expires_at = time.monotonic() + max(expires_in - TOKEN_EXPIRY_MARGIN, 0)
+            return token
+
+    def invalidate_token(self):
+        if self._static_token:
+            return
+        with self._token_lock:
+            self._token_expires_at = 0.0
+
+    def _authenticate(self, request):
+        request.headers["Authorization"] = f"Bearer {self.get_token()}"
+        return request
+
+    def _on_response(self, response, *args, **kwargs):
+        if response.status_code == HTTPStatus.UNAUTHORIZED:
+            self.invalidate_token()
+        response.raise_for_status()
+
+    def close(self):
+        self.session.close()
+        self._auth_session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+_client: Optional[GenextClient] = None
+_client_lock = threading.Lock()
+
+
+def get_genext_client() -> GenextClient:
+    """Return the process-wide Genext client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GenextClient()
+    return _client
+
+
+def _reset_client_after_fork():
+    # pooled sockets and locks must not be shared with a forked worker process
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_client_after_fork)
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import ssl
+import time
+import weakref
+from http import HTTPStatus
+from typing import Any, Dict, Optional
+
+import httpx
+
+from worker.core.config import settings
+from worker.utils.genext import (
+    AUTH_ENDPOINT,
+    CHAT_REQUEST_PATH,
+    CONFIG,
+    DEFAULT_TOKEN_LIFETIME,
+    EMBEDDING_REQUEST_PATH,
+    ENVIRONMENT,
+    POLLING_INTERVAL,
+    TOKEN_EXPIRY_MARGIN,
+    GenextAPI,
+    LlmApiModel,
+    PollingTimeoutError,
+    backoff_delays,
+    token_request_data,
+)
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class AsyncGenextClient:
+    """
+    Async (httpx) client for the Genext chat and embedding endpoints.
+
+    A request is posted once and then polled with exponential backoff and
+    jitter until it leaves the PENDING state or its deadline passes. Polling
+    only awaits, so a single event loop can keep hundreds of requests in
+    flight; cancelling the awaiting task stops the polling immediately.
+    """
+
+    def __init__(self, max_connections: Optional[int] = None, timeout: float = 30.0):
+        if max_connections is None:
+            max_connections = settings.GENEXT_POOL_MAXSIZE
+        ssl_context = ssl.create_default_context(cafile=GenextAPI.load_and_get_bmw_ca())
+        self._client = httpx.AsyncClient(
+            verify=ssl_context,
+            trust_env=False,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            headers={
+                "Accept": "application/json",
+                "x-apikey": CONFIG[ENVIRONMENT]["API_KEY"],
+            },
+        )
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+
+    async def get_token(self) -> str:
+        if self._token is not None and time.monotonic() < self._token_expires_at:
+            return self._token
+        async with self._token_lock:
+            if self._token is not None and time.monotonic() < self._token_expires_at:
+                return self._token
+            response = await self._client.post(
+                AUTH_ENDPOINT,
+                headers={"Content-Type": "application/x-www-form-urlencoded"},
+                data=token_request_data(),
+            )
+            if response.status_code != HTTPStatus.OK:
+                raise Exception(
+                    f"OAuth2 authentication failed. HTTP status code: {response.status_code}."
+                )
+            token_data = response.json()
+            expires_in = int(token_data.get("expires_in") or DEFAULT_TOKEN_LIFETIME)
+            self._token = token_data.get("access_token")
+            self._token_expires_at = time.monotonic() + max(expires_in - TOKEN_EXPIRY_MARGIN, 0)
+            logger.info("Successfully received WEN token.")
+            return self._token
+
+    async def _request(self, method: str, url: str, **kwargs) -> Any:
+        token = await self.get_token()
+        response = await self._client.request(
+            method, url, headers={"Authorization": f"Bearer {token}"}, **kwargs
+        )
+        if response.status_code == HTTPStatus.UNAUTHORIZED:
+            self._token_expires_at = 0.0
+        response.raise_for_status()
+        return response.json()
+
+    async def _poll(self, url: str, timeout: Optional[float], initial_interval: Optional[float] = None) -> Dict[str, Any]:
+        if timeout is None:
+            timeout = settings.GENEXT_POLL_TIMEOUT
+        start_time = time.monotonic()
+        try:
+            async with asyncio.timeout(timeout):
+                for delay in backoff_delays(initial=initial_interval):
+                    response = await self._request("GET", url)
+                    if response["status"] != "PENDING":
+                        duration = time.monotonic() - start_time
+                        logger.info(f"Finished polling after {duration:.2f} seconds.")
+                        return response
+                    await asyncio.sleep(delay)
+        except TimeoutError:
+            raise PollingTimeoutError(f"Polling {url} took longer than {timeout}s, aborting") from None
+
+    async def chat(self, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Post a chat request and wait for its completion."""
+        posted = await self._request("POST", CHAT_REQUEST_PATH, json=payload)
+        request_id = posted["request_id"]
+        logger.info(f"Start polling for request with ID {request_id}")
+        return await self._poll(f"{CHAT_REQUEST_PATH}/{request_id}", timeout, initial_interval=POLLING_INTERVAL)
+
+    async def embed(self, input_text: Any, model_name: LlmApiModel = LlmApiModel.ADA, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Post an embedding request and wait for its completion."""
+        payload = {"model_name": model_name, "input": input_text}
+        posted = await self._request("POST", EMBEDDING_REQUEST_PATH, json=payload)
+        request_id = posted["request_id"]
+        logger.info(f"Start polling for embedding request with ID {request_id}")
+        return await self._poll(f"{EMBEDDING_REQUEST_PATH}/{request_id}", timeout)
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+# httpx.AsyncClient is bound to the loop it was first used on, keep one per loop
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncGenextClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_genext_client() -> AsyncGenextClient:
+    """Return the shared async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = AsyncGenextClient()
+        _clients[loop] = client
+    return client
@@ -1,10 +1,17 @@
 import httpx
 import asyncio
+import hashlib
+import threading
 import tempfile
 import os
 import logging
-from typing import List, Dict
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Optional, Tuple
 import json
+from tenacity import before_sleep_log, retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
 from worker.core.config import settings
 
 # Configure logger
@@ -13,46 +20,243 @@ logger.setLevel(logging.INFO)
 
 EVAL_API_BASE_URL = str(settings.EVAL_API_BASE_PATH)
 
+# keep content-length and byte ranges in terms of file bytes
+_IDENTITY_ENCODING = {"Accept-Encoding": "identity"}
 
+_http_client: Optional[httpx.Client] = None
+_http_client_lock = threading.Lock()
 
-def download_file(url: str, local_path: str):
+
+def _create_http_client() -> httpx.Client:
+    # HTTP/2 comes from the http2 extra of httpx, servers without it keep HTTP/1.1
+    logger.info("Creating pooled HTTP client")
+    return httpx.Client(
+        http2=True,
+        timeout=httpx.Timeout(settings.EVAL_API_TIMEOUT, connect=settings.EVAL_API_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=settings.EVAL_API_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.EVAL_API_MAX_CONNECTIONS,
+            keepalive_expiry=60.0,
+        ),
+    )
+
+
+def init_http_client() -> httpx.Client:
+    """Create the worker scoped HTTP client, called once per Celery worker process."""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = _create_http_client()
+    return _http_client
+
+
+def get_http_client() -> httpx.Client:
+    """Return the pooled HTTP client, creating it when the worker did not do so yet."""
+    if _http_client is None:
+        return init_http_client()
+    return _http_client
+
+
+def close_http_client():
+    global _http_client
+    with _http_client_lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+def _is_retryable_post(exc: BaseException) -> bool:
+    # a POST may have reached the server, only retry when it surely did not
+    return isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+
+def _api_retry(predicate):
+    return retry(
+        retry=retry_if_exception(predicate),
+        wait=wait_exponential_jitter(initial=0.5, max=10),
+        stop=stop_after_attempt(settings.EVAL_API_RETRIES),
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+        reraise=True,
+    )
+
+
+
+class DownloadError(Exception):
+    """Raised when a download fails or does not match the expected size or hash."""
+
+
+def cache_validators(headers: httpx.Headers) -> Dict[str, str]:
+    """The ETag and Last-Modified of a response, used to revalidate a cached copy."""
+    validators = {}
+    if headers.get("etag"):
+        validators["etag"] = headers["etag"]
+    if headers.get("last-modified"):
+        validators["last_modified"] = headers["last-modified"]
+    return validators
+
+
+def _probe(client: httpx.Client, url: str) -> Tuple[Optional[int], bool, Dict[str, str]]:
+    """Return the content length, whether the server accepts range requests and the cache validators."""
+    try:
+        response = client.head(url, headers=_IDENTITY_ENCODING)
+        response.raise_for_status()
+    except httpx.HTTPError as e:
+        # not every endpoint implements HEAD, fall back to a plain streamed GET
+        logger.info(f"HEAD request for {url} failed, downloading without ranges: {e}")
+        return None, False, {}
+    length = response.headers.get("content-length")
+    accepts_ranges = response.headers.get("accept-ranges", "").lower() == "bytes"
+    return (int(length) if length is not None else None), accepts_ranges, cache_validators(response.headers)
+
+
+def _fetch_range(client: httpx.Client, url: str, local_path: str, start: int, end: Optional[int], retries: int) -> int:
+    """
+    Stream ``start..end`` (inclusive, open ended when None) into the file at offset ``start``.
+
+    An interrupted transfer is resumed from the last written byte when the server
+    answers range requests, otherwise it is restarted.
+    """
+    position = start
+    attempt = 0
+    while True:
+        headers = dict(_IDENTITY_ENCODING)
+        ranged = position > 0 or end is not None
+        if ranged:
+            headers["Range"] = f"bytes={position}-{'' if end is None else end}"
+        try:
+            with client.stream("GET", url, headers=headers) as response:
+                response.raise_for_status()
+                if ranged and response.status_code != 206:
+                    # range ignored, the body starts at byte 0 again
+                    if start != 0 or end is not None:
+                        raise DownloadError(f"Server ignored range request for {url}")
+                    position = 0
+                with open(local_path, "r+b") as file:
+                    file.seek(position)
+                    if position == 0 and end is None:
+                        file.truncate()
+                    # bytes are written as they arrive, a chunk size would hold back what a resume needs
+                    for chunk in response.iter_bytes():
+                        file.write(chunk)
+                        position += len(chunk)
+            return position - start
+        except httpx.HTTPStatusError:
+            raise
+        except (httpx.TransportError, httpx.DecodingError) as e:
+            attempt += 1
+            if attempt > retries:
+                raise DownloadError(f"Download of {url} failed after {retries} retries: {e}") from e
+            logger.warning(f"Download of {url} interrupted at byte {position}, resuming ({attempt}/{retries}): {e}")
+            time.sleep(min(2 ** attempt, 10))
+
+
+def _verify_download(local_path: str, expected_size: Optional[int], expected_sha256: Optional[str]):
+    size = os.path.getsize(local_path)
+    if expected_size is not None and size != expected_size:
+        raise DownloadError(f"Downloaded {size} bytes to {local_path}, expected {expected_size}")
+    if expected_sha256 is not None:
+        digest = hashlib.sha256()
+        with open(local_path, "rb") as file:
+            for chunk in iter(lambda: file.read(settings.DOWNLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        if digest.hexdigest() != expected_sha256.lower():
+            raise DownloadError(f"SHA-256 mismatch for {local_path}")
+
+
+def download_file(url: str, local_path: str, expected_size: Optional[int] = None,
+                  expected_sha256: Optional[str] = None) -> Dict[str, str]:
+    """
+    Stream ``url`` to ``local_path`` without holding the file in memory.
+
+    Large files (above ``DOWNLOAD_PARALLEL_THRESHOLD``) are fetched as parallel
+    byte ranges when the server supports them, interrupted transfers resume
+    from the last written byte. The data goes to a ``.part`` file that is only
+    moved into place after the optional size / SHA-256 checks pass. Errors are
+    raised instead of leaving a missing file behind. Returns the ETag and
+    Last-Modified the server reported, if any.
+    """
     logger.info(f"Downloading file from {url} to {local_path}")
-    print(f"Downloading file from {url} to {local_path}")
+    part_path = local_path + ".part"
+    retries = settings.DOWNLOAD_RETRIES
 
     try:
-        with httpx.Client() as client:
-            response = client.get(url)
-            response.raise_for_status()
-            with open(local_path, 'wb') as file:
-                file.write(response.content)
+        client = get_http_client()
+        size, accepts_ranges, validators = _probe(client, url)
+        if expected_size is not None and size is not None and size != expected_size:
+            raise DownloadError(f"{url} has {size} bytes, expected {expected_size}")
+
+        with open(part_path, "wb") as file:
+            if size:
+                file.truncate(size)
+
+        parts = min(settings.DOWNLOAD_MAX_PARTS, max(1, (size or 0) // settings.DOWNLOAD_PARALLEL_THRESHOLD + 1))
+        if size and accepts_ranges and size >= settings.DOWNLOAD_PARALLEL_THRESHOLD and parts > 1:
+            part_size = -(-size // parts)
+            ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+            logger.info(f"Downloading {size} bytes in {len(ranges)} parallel ranges")
+            with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="download") as executor:
+                futures = [executor.submit(_fetch_range, client, url, part_path, start, end, retries)
+                           for start, end in ranges]
+                for future in futures:
+                    future.result()
+        else:
+            _fetch_range(client, url, part_path, 0, None, retries)
+
+        _verify_download(part_path, expected_size if expected_size is not None else size, expected_sha256)
+        os.replace(part_path, local_path)
+        return validators
     except httpx.HTTPStatusError as e:
         logger.error(f"HTTP error occurred: {e}")
-        print(f"HTTP error occurred: {e}")
-    except httpx.RequestError as e:
-        logger.error(f"Error during request: {e}")
-        print(f"Error during request: {e}")
-    except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
-        print(f"An unexpected error occurred: {e}")
+        _remove_quietly(part_path)
+        raise DownloadError(f"Download of {url} failed: {e}") from e
+    except Exception:
+        _remove_quietly(part_path)
+        raise
 
 
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@_api_retry(_is_retryable)
 def get_job_info(org: str, job_id: str):
     endpoint = f"{EVAL_API_BASE_URL}/orgs/{org}/evaluation_jobs/{job_id}"
     logger.info(f"Fetching job info from {endpoint}")
-    response = httpx.get(endpoint)
+    response = get_http_client().get(endpoint)
     response.raise_for_status()
     return response.json()
 
 
-def update_job_status(org: str, job_id: str, job_name: str, status: str):
+@_api_retry(_is_retryable)
+def update_job_status(org: str, job_id: str, job_name: str, status: str,
+                      progress: Optional[Tuple[int, int]] = None, partial: bool = False,
+                      errors: Optional[List[str]] = None):
     endpoint = f"{EVAL_API_BASE_URL}/orgs/{org}/evaluation_jobs/{job_id}"
     logger.info(f"Fetching job info from {endpoint}")
     job_data = {
         "job_name": job_name,
         "status": status
     }
+    if progress is not None:
+        job_data["rules_done"], job_data["rules_total"] = progress
+    if partial:
+        # some rules ran out of time and have no score
+        job_data["partial"] = True
+    if errors:
+        # why the job failed, e.g. the problems of a malformed checklist
+        job_data["errors"] = errors
     try:
-        response = httpx.put(endpoint, json=job_data)
+        response = get_http_client().put(endpoint, json=job_data)
         response.raise_for_status()
         return response.json()
     except httpx.RequestError as exc:
@@ -63,12 +267,15 @@ def update_job_status(org: str, job_id: str, job_name: str, status: str):
         raise
 
 
-def add_job_findings(org: str, job_id: str, job_name: str, findings: List[Dict[str, str]]):
+@_api_retry(_is_retryable_post)
+def add_job_findings(org: str, job_id: str, job_name: str, findings: List[Dict[str, str]],
+                     idempotency_key: Optional[str] = None):
     endpoint = f"{EVAL_API_BASE_URL}/orgs/{org}/evaluation_jobs/{job_id}/findings"
     logger.info(f"Adding job findings to {endpoint}")
-    
+    headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+
     try:
-        response = httpx.post(endpoint, json=findings)
+        response = get_http_client().post(endpoint, json=findings, headers=headers)
         response.raise_for_status()
         return response.json()
     except httpx.HTTPStatusError as e:
@@ -91,6 +298,41 @@ def create_temp_folder():
     return temp_dir
 
 
+_SCRATCH_PREFIX = "doc-eval-job-"
+
+
+@contextmanager
+def job_scratch(job_id: str):
+    """A scratch folder for the files of one job, removed with everything in it when the job ends."""
+    directory = settings.JOB_SCRATCH_DIR
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(prefix=f"{_SCRATCH_PREFIX}{job_id}-", dir=directory)
+    logger.info(f"Scratch folder of job {job_id} created at: {temp_dir}")
+    try:
+        yield temp_dir
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def clean_stale_scratch(max_age: Optional[float] = None):
+    """Remove scratch folders left behind by killed workers, e.g. at worker start."""
+    max_age = settings.JOB_SCRATCH_MAX_AGE if max_age is None else max_age
+    root = settings.JOB_SCRATCH_DIR or tempfile.gettempdir()
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.name.startswith(_SCRATCH_PREFIX) and entry.is_dir() and entry.stat().st_mtime < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                logger.info(f"Removed stale scratch folder {entry.path}")
+        except FileNotFoundError:
+            continue
+
+
 # org = "ITSCM_DEV"
 # repository = "itscmdev-repository"
 # repository_filename="ehb_checklist_v1_completed.yaml"
@@ -0,0 +1,138 @@
+import json
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from worker.core.config import settings
+from worker.utils.artifact_store import get_artifact_store
+from worker.utils.evaluate_doc import (
+    ParsedChecklist, ParsedDocument, build_finding, build_findings, checklist_subset, do_evaluation,
+    evaluation_fingerprints,
+)
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def pair_key(fingerprints: Tuple[str, str]) -> str:
+    section_fingerprint, rule_fingerprint = fingerprints
+    return f"{section_fingerprint}:{rule_fingerprint}"
+
+
+class FindingStore:
+    """
+    Scores, answers and answering models of earlier evaluations by (section, rule) fingerprint.
+
+    Entries are scoped (per organization) so findings never cross tenants, and
+    expire after ``FINDING_REUSE_TTL`` seconds.
+    """
+
+    def __init__(self, ttl: int, prefix: str = "finding"):
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, scope: str, key: str) -> str:
+        return f"{self.prefix}:{scope}:{key}"
+
+    def get_many(self, scope: str, keys: Sequence[str]) -> List[Optional[Tuple[int, str, Optional[str]]]]:
+        if not keys:
+            return []
+        values = get_artifact_store().redis.mget([self._key(scope, key) for key in keys])
+        results: List[Optional[Tuple[int, str, Optional[str]]]] = []
+        for value in values:
+            if value is None:
+                results.append(None)
+            else:
+                data = json.loads(value)
+                # entries stored before model routing carry no model
+                results.append((data["score"], data["answer"], data.get("model")))
+        return results
+
+    def put_many(self, scope: str, results: Dict[str, Tuple[Optional[int], str, str]]):
+        """Remember scored results, failed and timed out rules (score None) are left out to be retried."""
+        results = {key: result for key, result in results.items() if result[0] is not None}
+        if not results:
+            return
+        with get_artifact_store().redis.pipeline() as pipe:
+            for key, (score, answer, model) in results.items():
+                pipe.set(self._key(scope, key), json.dumps({"score": score, "answer": answer, "model": model}),
+                         ex=self.ttl)
+            pipe.execute()
+
+
+_finding_store = FindingStore(settings.FINDING_REUSE_TTL)
+
+
+@dataclass(frozen=True)
+class IncrementalEvaluation:
+    findings: List[dict]
+    reused: int
+    rescored: int
+
+
+def reusable_results(scope: Optional[str],
+                     fingerprints: Sequence[Tuple[str, str]]) -> Dict[int, Tuple[int, str, Optional[str]]]:
+    """Earlier ``(score, answer, model)`` by rule index for the rules whose fingerprints are unchanged."""
+    if scope is None:
+        return {}
+    try:
+        previous = _finding_store.get_many(scope, [pair_key(pair) for pair in fingerprints])
+    except Exception as e:
+        logger.warning(f"Could not read earlier findings, evaluating every rule: {e}")
+        return {}
+    return {index: result for index, result in enumerate(previous) if result is not None}
+
+
+def evaluate_incrementally(scope: Optional[str], document: ParsedDocument, checklist: ParsedChecklist,
+                           max_workers: Optional[int] = None, batch_rules: Optional[bool] = None,
+                           reused: Optional[Dict[int, Tuple[int, str, Optional[str]]]] = None,
+                           on_finding: Optional[Callable[[int, dict], None]] = None) -> IncrementalEvaluation:
+    """
+    Evaluate the checklist, reusing the results of earlier evaluations.
+
+    Only rules whose section text or rule changed since an earlier evaluation in
+    ``scope`` are sent to the LLM, the new results are remembered for the next
+    run. Without a scope every rule is evaluated. Findings carry the rule id,
+    both fingerprints and the answering model, ``on_finding(index, finding)`` receives every finding as
+    soon as it is known.
+    """
+    fingerprints = evaluation_fingerprints(document, checklist)
+    if reused is None:
+        reused = reusable_results(scope, fingerprints)
+    missing = [i for i in range(len(checklist.rules)) if i not in reused]
+    timed_out_rules = set()
+
+    def finding(index: int, score: Optional[int], answer: str, model: Optional[str], timed_out: bool = False) -> dict:
+        return build_finding(checklist.sections[index], score, answer, checklist.rule_ids[index], fingerprints[index],
+                             model, timed_out)
+
+    results: Dict[int, Tuple[int, str, Optional[str]]] = dict(reused)
+    if on_finding is not None:
+        for index, (score, answer, model) in sorted(reused.items()):
+            on_finding(index, finding(index, score, answer, model))
+    if missing:
+        on_result = None
+        if on_finding is not None:
+            def on_result(position: int, score: Optional[int], answer: str, model: str, timed_out: bool):
+                on_finding(missing[position], finding(missing[position], score, answer, model, timed_out))
+
+        lt_score, lt_answer, lt_model, lt_timed_out = do_evaluation(document, checklist_subset(checklist, missing),
+                                                                    max_workers=max_workers, batch_rules=batch_rules,
+                                                                    on_result=on_result)
+        results.update(zip(missing, zip(lt_score, lt_answer, lt_model)))
+        timed_out_rules = {index for index, missed in zip(missing, lt_timed_out) if missed}
+        if scope is not None:
+            # failed and timed out rules have no score and are retried next time
+            fresh = {pair_key(fingerprints[i]): results[i] for i in missing}
+            try:
+                _finding_store.put_many(scope, fresh)
+            except Exception as e:
+                logger.warning(f"Could not store findings for reuse: {e}")
+
+    logger.info(f"{len(reused)} rules reused, {len(missing)} rules re-scored")
+    order = range(len(checklist.rules))
+    findings = build_findings(checklist.sections, [results[i][0] for i in order], [results[i][1] for i in order],
+                              checklist.rule_ids, fingerprints, [results[i][2] for i in order],
+                              [i in timed_out_rules for i in order])
+    return IncrementalEvaluation(findings, len(reused), len(missing))
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import redis
+
+from worker.core.config import settings
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    """
+    Content address of a chat payload.
+
+    Only model, parameters and history are hashed; the conversation id does
+    not change the answer of a single-turn request.
+    """
+    material = {
+        "model_name": payload.get("model_name"),
+        "model_parameters": payload.get("model_parameters"),
+        "history": payload.get("history"),
+    }
+    encoded = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(ABC):
+    """Base class for LLM response caches with hit/miss counters."""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = self._get(key)
+        except Exception as e:
+            # the cache is an optimisation, never fail a request because of it
+            logger.warning(f"Response cache lookup failed: {e}")
+            value = None
+        with self._stats_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        try:
+            self._set(key, value)
+        except Exception as e:
+            logger.warning(f"Response cache write failed: {e}")
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+    @abstractmethod
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def _set(self, key: str, value: Dict[str, Any]):
+        pass
+
+
+# drops the members of entries written before ARGV[1] from the last use (KEYS[1]) and write (KEYS[2]) indexes
+_PRUNE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for i = 1, #expired, 1000 do
+  redis.call('ZREM', KEYS[1], unpack(expired, i, math.min(i + 999, #expired)))
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+return #expired
+"""
+
+
+class RedisResponseCache(ResponseCache):
+    """
+    Redis backed cache, entries expire after ``ttl`` and the oldest are evicted above ``max_entries``.
+
+    One sorted set orders the keys by last use for the eviction, a second one
+    by write time. Redis expires the entries but not their members, so members
+    of entries written more than ``ttl`` ago are pruned from both before the
+    entries are counted.
+    """
+
+    def __init__(self, url: str, ttl: int, max_entries: int, prefix: str = "llm-cache"):
+        super().__init__(ttl)
+        self.redis = redis.Redis.from_url(url)
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self.index_key = f"{prefix}:index"
+        self.written_key = f"{prefix}:written"
+        self._prune = self.redis.register_script(_PRUNE_SCRIPT)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.redis.get(self._key(key))
+        if raw is None:
+            return None
+        # bump the entry so eviction removes the least recently used ones
+        self.redis.zadd(self.index_key, {key: time.time()})
+        return json.loads(raw)
+
+    def _set(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        with self.redis.pipeline() as pipe:
+            pipe.set(self._key(key), json.dumps(value), ex=self.ttl)
+            pipe.zadd(self.index_key, {key: now})
+            pipe.zadd(self.written_key, {key: now})
+            pipe.execute()
+        self._prune(keys=[self.index_key, self.written_key], args=[now - self.ttl])
+        excess = self.redis.zcard(self.index_key) - self.max_entries
+        while excess > 0:
+            evicted = self.redis.zpopmin(self.index_key, excess)
+            if not evicted:
+                break
+            members = [member for member, _ in evicted]
+            with self.redis.pipeline() as pipe:
+                pipe.zrem(self.written_key, *members)
+                pipe.delete(*[self._key(member.decode()) for member in members])
+                # an entry that expired in the meantime frees no room
+                excess -= pipe.execute()[-1]
+
+
+class DiskResponseCache(ResponseCache):
+    """Local directory cache, one JSON file per entry, bounded by ``max_bytes``."""
+
+    def __init__(self, directory: str, ttl: int, max_bytes: int):
+        super().__init__(ttl)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = sum(path.stat().st_size for path in self._entries())
+
+    def _entries(self):
+        return self.directory.glob("*/*.json")
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        if time.time() - stat.st_mtime > self.ttl:
+            self._remove(path)
+            return None
+        with open(path, "r", encoding="utf-8") as file:
+            value = json.load(file)
+        # access time drives eviction, mtime keeps the ttl
+        os.utime(path, (time.time(), stat.st_mtime))
+        return value
+
+    def _set(self, key: str, value: Dict[str, Any]):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        data = json.dumps(value).encode("utf-8")
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        with self._lock:
+            old_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            self._size += len(data) - old_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _remove(self, path: Path):
+        with self._lock:
+            try:
+                size = path.stat().st_size
+                path.unlink()
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        # called with the lock held, drop least recently used files down to 90% of the budget
+        target = self.max_bytes * 0.9
+        entries = []
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                path.unlink()
+                self._size -= size
+            except FileNotFoundError:
+                pass
+        logger.info(f"Evicted response cache entries, {self._size} bytes left")
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the configured response cache, or None when caching is disabled."""
+    global _cache
+    if settings.LLM_CACHE_BACKEND == "none":
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if settings.LLM_CACHE_BACKEND == "redis":
+                    _cache = RedisResponseCache(
+                        url=settings.LLM_CACHE_REDIS_URL or settings.CELERY_BROKER_URL,
+                        ttl=settings.LLM_CACHE_TTL,
+                        max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                    )
+                else:
+                    _cache = DiskResponseCache(
+                        directory=settings.LLM_CACHE_DIR,
+                        ttl=settings.LLM_CACHE_TTL,
+                        max_bytes=settings.LLM_CACHE_MAX_BYTES,
+                    )
+    return _cache
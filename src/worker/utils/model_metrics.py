@@ -0,0 +1,112 @@
+import threading
+from collections import defaultdict, deque
+from typing import Deque, Dict, Optional, Tuple
+
+from opentelemetry import metrics
+
+from worker.core.config import settings
+
+# USD per 1000 prompt and completion tokens, override with GENEXT_MODEL_PRICES
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o": (0.005, 0.015),
+    "gpt-4-turbo-8k": (0.01, 0.03),
+    "gpt-35-turbo-16k": (0.003, 0.004),
+    "anthropic.claude-3-sonnet-20240229-v1:0": (0.003, 0.015),
+    "anthropic.claude-3-haiku-20240307-v1:0": (0.00025, 0.00125),
+    "text-embedding-ada-v002": (0.0001, 0.0),
+}
+
+# gateway latencies kept per model for the percentiles
+_LATENCY_WINDOW = 1000
+
+
+_meter = metrics.get_meter(__name__)
+
+
+class ModelMetrics:
+    """
+    Per-model request latency, token and cost counters.
+
+    The counters of this process are kept for the logs, the recent gateway
+    latencies (post to answer, without rate limit waits and retries) for the
+    hedging percentiles. Every update is also exported as an OpenTelemetry metric with
+    a ``model`` attribute so the collector aggregates them over all workers.
+    """
+
+    def __init__(self, meter: Optional[metrics.Meter] = None):
+        meter = meter or _meter
+        self._lock = threading.Lock()
+        self._counts: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self._latencies: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=_LATENCY_WINDOW))
+        self._requests = meter.create_counter("genext.requests", unit="{request}",
+                                               description="Chat and embedding requests per model")
+        self._duration = meter.create_histogram("genext.request.duration", unit="s",
+                                                 description="Duration of the requests per model")
+        self._tokens = meter.create_counter("genext.tokens", unit="{token}",
+                                             description="Prompt and completion tokens per model")
+        self._cost = meter.create_counter("genext.cost", unit="USD", description="Estimated cost per model")
+        self._events = meter.create_counter("genext.events", unit="{event}",
+                                             description="Escalations, hedged requests and hedge wins per model")
+
+    @staticmethod
+    def price(model: str) -> Tuple[float, float]:
+        return settings.GENEXT_MODEL_PRICES.get(model) or MODEL_PRICES.get(model, (0.0, 0.0))
+
+    def record(self, model: str, latency: float, prompt_tokens: int, completion_tokens: int, failed: bool = False):
+        with self._lock:
+            counts = self._counts[model]
+            counts["requests"] += 1
+            counts["failures"] += int(failed)
+            counts["latency_seconds"] += latency
+        self._requests.add(1, {"model": model, "failed": failed})
+        self._duration.record(latency, {"model": model})
+        self.record_tokens(model, prompt_tokens, completion_tokens)
+
+    def record_tokens(self, model: str, prompt_tokens: int, completion_tokens: int = 0):
+        """Tokens without a request of their own, e.g. of a hedged duplicate."""
+        prompt_price, completion_price = self.price(model)
+        cost = (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+        with self._lock:
+            counts = self._counts[model]
+            counts["prompt_tokens"] += prompt_tokens
+            counts["completion_tokens"] += completion_tokens
+            counts["cost_usd"] += cost
+        self._tokens.add(prompt_tokens, {"model": model, "type": "prompt"})
+        self._tokens.add(completion_tokens, {"model": model, "type": "completion"})
+        self._cost.add(cost, {"model": model})
+
+    def record_gateway_latency(self, model: str, latency: float):
+        """Seconds from posting a chat request to its answer."""
+        with self._lock:
+            self._latencies[model].append(latency)
+
+    def increment(self, model: str, name: str):
+        with self._lock:
+            self._counts[model][name] += 1
+        self._events.add(1, {"model": model, "event": name})
+
+    def latency_percentile(self, model: str, percentile: float, min_samples: int = 1) -> Optional[float]:
+        """
+        The gateway latency below which ``percentile`` percent of the recent
+        requests were answered, None with fewer than ``min_samples`` requests.
+        """
+        with self._lock:
+            samples = sorted(self._latencies.get(model, ()))
+        if not samples or len(samples) < min_samples:
+            return None
+        position = min(int(len(samples) * percentile / 100), len(samples) - 1)
+        return samples[position]
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            snapshot = {model: dict(counts) for model, counts in self._counts.items()}
+        for model, counts in snapshot.items():
+            if counts.get("requests"):
+                counts["mean_latency_seconds"] = counts["latency_seconds"] / counts["requests"]
+            p95 = self.latency_percentile(model, 95)
+            if p95 is not None:
+                counts["p95_gateway_latency_seconds"] = p95
+        return snapshot
+
+
+model_metrics = ModelMetrics()
@@ -0,0 +1,61 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from worker.core.config import settings
+from worker.utils.genext import LlmApiModel
+
+
+def resolve_model(name: str) -> LlmApiModel:
+    """A model by its API name (``gpt-4o``) or enum name (``GPT_4o``, ``haiku``)."""
+    if isinstance(name, LlmApiModel):
+        return name
+    lowered = str(name).strip().lower()
+    for model in LlmApiModel:
+        if lowered in (model.value.lower(), model.name.lower()):
+            return model
+    raise ValueError(f"Unknown model in routing configuration: {name}")
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """
+    The models a rule is evaluated with, cheapest first.
+
+    The next model is only asked when the score of the previous one falls in
+    the inclusive ``escalate_band`` or its answer could not be parsed.
+    """
+    models: Tuple[LlmApiModel, ...]
+    escalate_band: Tuple[int, int] = (4, 7)
+
+    def should_escalate(self, score: Optional[int]) -> bool:
+        return score is None or self.escalate_band[0] <= score <= self.escalate_band[1]
+
+    def describe(self) -> str:
+        # a single model route describes itself like the model, which keeps fingerprints stable
+        if len(self.models) == 1:
+            return self.models[0].value
+        return '>'.join(model.value for model in self.models) + f"@{self.escalate_band[0]}-{self.escalate_band[1]}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"models": [model.value for model in self.models], "escalate_band": list(self.escalate_band)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], base: Optional["ModelRoute"] = None) -> "ModelRoute":
+        """A route from its YAML / JSON form, missing keys are taken from ``base``."""
+        models = data.get("models")
+        band = data.get("escalate_band")
+        if models is None and base is None:
+            raise ValueError("A routing configuration needs models")
+        return cls(
+            tuple(resolve_model(model) for model in models) if models is not None else base.models,
+            (int(band[0]), int(band[1])) if band is not None else (base.escalate_band if base else (4, 7)),
+        )
+
+
+def default_route(model: LlmApiModel) -> ModelRoute:
+    """The route of rules without routing configuration."""
+    if settings.EVAL_ROUTING:
+        return ModelRoute(tuple(resolve_model(name) for name in settings.EVAL_ROUTE_MODELS),
+                          tuple(settings.EVAL_ESCALATE_BAND))
+    return ModelRoute((model,))
+
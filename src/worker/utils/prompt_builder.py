@@ -0,0 +1,178 @@
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from worker.core.config import settings
+from worker.utils.genext import LlmApiModel
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# context window per model in tokens
+MODEL_CONTEXT_TOKENS = {
+    LlmApiModel.GPT_35_TURBO_16K: 16_384,
+    LlmApiModel.GPT_4_TURBO: 8_192,
+    LlmApiModel.ADA: 8_191,
+    LlmApiModel.SONNET: 200_000,
+    LlmApiModel.HAIKU: 200_000,
+    LlmApiModel.GPT_4o: 128_000,
+}
+
+# rough characters per token when no tokenizer is installed
+_CHARS_PER_TOKEN = {
+    LlmApiModel.SONNET: 3.5,
+    LlmApiModel.HAIKU: 3.5,
+}
+_DEFAULT_CHARS_PER_TOKEN = 4.0
+
+# room for chat formatting, prompt framing and estimation error
+_PROMPT_OVERHEAD_TOKENS = 64
+_SAFETY_FACTOR = 0.9
+
+
+@lru_cache(maxsize=None)
+def _tokenizer(model: LlmApiModel) -> Optional[Callable[[str], list]]:
+    # tiktoken is optional, only OpenAI models have a public tokenizer
+    if model in (LlmApiModel.SONNET, LlmApiModel.HAIKU):
+        return None
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    encoding = tiktoken.get_encoding("o200k_base" if model == LlmApiModel.GPT_4o else "cl100k_base")
+    return encoding.encode
+
+
+def count_tokens(text: str, model: LlmApiModel) -> int:
+    """Number of tokens of ``text`` for ``model``, estimated when no tokenizer is available."""
+    encode = _tokenizer(model)
+    if encode is not None:
+        return len(encode(text))
+    return int(len(text) / _CHARS_PER_TOKEN.get(model, _DEFAULT_CHARS_PER_TOKEN)) + 1
+
+
+def prompt_budget(model: LlmApiModel, system_content: str, max_completion_tokens: int) -> int:
+    """Tokens left for the user prompt after system content and completion."""
+    context = MODEL_CONTEXT_TOKENS.get(model, 8_192)
+    if settings.PROMPT_MAX_TOKENS:
+        context = min(context, settings.PROMPT_MAX_TOKENS + max_completion_tokens)
+    available = context - max_completion_tokens - count_tokens(system_content, model) - _PROMPT_OVERHEAD_TOKENS
+    return max(int(available * _SAFETY_FACTOR), 1)
+
+
+def build_prompt(text: str, quoted: bool = True) -> str:
+    if quoted:
+        return ''.join(('Please evaluate this document: "', text, '"'))
+    return ''.join(('Please evaluate this document: ', text))
+
+
+def _split_long_line(line: str, budget: int, model: LlmApiModel) -> List[str]:
+    # a single node larger than the budget is cut by characters
+    chars = max(int(budget * len(line) / max(count_tokens(line, model), 1)), 1)
+    return [line[start:start + chars] for start in range(0, len(line), chars)]
+
+
+def split_into_chunks(text: str, model: LlmApiModel, budget: int, overlap_tokens: Optional[int] = None) -> List[str]:
+    """
+    Split ``text`` on line boundaries into chunks of at most ``budget`` tokens.
+
+    Consecutive chunks share up to ``overlap_tokens`` of trailing lines so that
+    content at a boundary is seen in context by both chunks.
+    """
+    return [text[start:end] for start, end in split_into_spans(text, model, budget, overlap_tokens)]
+
+
+def split_into_spans(text: str, model: LlmApiModel, budget: int,
+                     overlap_tokens: Optional[int] = None) -> List[Tuple[int, int]]:
+    """The ``(start, end)`` character offsets of the chunks of ``split_into_chunks``."""
+    if overlap_tokens is None:
+        overlap_tokens = settings.PROMPT_CHUNK_OVERLAP_TOKENS
+    overlap_tokens = min(overlap_tokens, budget // 4)
+
+    # (start, end, tokens) of every line, long lines are cut into parts
+    lines: List[Tuple[int, int, int]] = []
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        tokens = count_tokens(line, model)
+        if tokens > budget:
+            for part in _split_long_line(line, budget, model):
+                lines.append((offset, offset + len(part), count_tokens(part, model)))
+                offset += len(part)
+        else:
+            lines.append((offset, offset + len(line), tokens))
+            offset += len(line)
+
+    spans: List[Tuple[int, int]] = []
+    current: List[Tuple[int, int, int]] = []
+    current_tokens = 0
+    for line in lines:
+        tokens = line[2]
+        if current and current_tokens + tokens > budget:
+            spans.append((current[0][0], current[-1][1]))
+            # carry the tail of the previous chunk over as overlap
+            carried: List[Tuple[int, int, int]] = []
+            carried_tokens = 0
+            for part in reversed(current):
+                part_tokens = part[2]
+                if carried_tokens + part_tokens > overlap_tokens or carried_tokens + part_tokens + tokens > budget:
+                    break
+                carried.append(part)
+                carried_tokens += part_tokens
+            current = list(reversed(carried))
+            current_tokens = carried_tokens
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        spans.append((current[0][0], current[-1][1]))
+    elif not spans:
+        spans.append((0, 0))
+    return spans
+
+
+def merge_scores(scores: Sequence[int], weights: Optional[Sequence[float]] = None, reduction: Optional[str] = None) -> int:
+    """
+    Combine the scores of the chunks of one rule.
+
+    ``min`` treats the rule as only as good as its weakest part, ``mean`` and
+    ``weighted_mean`` (weighted by chunk size) average them, ``max`` keeps the
+    best chunk, which suits rules that only need to be met somewhere.
+    """
+    if not scores:
+        return 0
+    reduction = reduction or settings.PROMPT_SCORE_REDUCTION
+    if reduction == "min":
+        return min(scores)
+    if reduction == "max":
+        return max(scores)
+    if reduction == "mean":
+        return round(sum(scores) / len(scores))
+    if reduction == "weighted_mean":
+        weights = weights or [1.0] * len(scores)
+        total = sum(weights) or 1.0
+        return round(sum(score * weight for score, weight in zip(scores, weights)) / total)
+    raise ValueError(f"Unknown score reduction: {reduction}")
+
+
+@dataclass(frozen=True)
+class PromptChunk:
+    prompt: str
+    tokens: int
+
+
+class PromptBuilder:
+    """Builds the user prompts of one rule within the token budget of a model."""
+
+    def __init__(self, model: LlmApiModel, max_completion_tokens: int):
+        self.model = model
+        self.max_completion_tokens = max_completion_tokens
+
+    def build(self, text: str, system_content: str, quoted: bool = True) -> List[PromptChunk]:
+        budget = prompt_budget(self.model, system_content, self.max_completion_tokens)
+        tokens = count_tokens(text, self.model)
+        if tokens <= budget:
+            return [PromptChunk(build_prompt(text, quoted), tokens)]
+        chunks = split_into_chunks(text, self.model, budget)
+        logger.info(f"Prompt of {tokens} tokens exceeds the budget of {budget}, split into {len(chunks)} chunks")
+        return [PromptChunk(build_prompt(chunk, quoted), count_tokens(chunk, self.model)) for chunk in chunks]
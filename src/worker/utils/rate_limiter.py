@@ -0,0 +1,201 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import redis
+
+from worker.core.config import settings
+from worker.utils.genext import DeadlineExceededError
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+class RateLimitTimeout(Exception):
+    """Raised when no request budget became available within the maximum wait."""
+
+
+# Token buckets for requests and tokens of one model, refilled continuously at
+# rpm/60 and tpm/60 per second and scaled by the adaptive factor. Returns "0"
+# when the request may go ahead, otherwise the seconds to wait (as a string,
+# Lua numbers would be truncated to integers).
+_ACQUIRE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'ts', 'factor', 'blocked_until')
+local factor = tonumber(state[4]) or 1.0
+local blocked_until = tonumber(state[5]) or 0
+if blocked_until > now then
+  return tostring(blocked_until - now)
+end
+local rpm = tonumber(ARGV[1]) * factor
+local tpm = tonumber(ARGV[2]) * factor
+local cost = math.min(tonumber(ARGV[3]), tpm)
+local elapsed = math.max(now - (tonumber(state[3]) or now), 0)
+local requests = math.min((tonumber(state[1]) or rpm) + elapsed * rpm / 60, rpm)
+local tokens = math.min((tonumber(state[2]) or tpm) + elapsed * tpm / 60, tpm)
+local wait = 0
+if requests < 1 then
+  wait = (1 - requests) * 60 / rpm
+end
+if tokens < cost then
+  wait = math.max(wait, (cost - tokens) * 60 / tpm)
+end
+if wait == 0 then
+  requests = requests - 1
+  tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'requests', tostring(requests), 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+# Multiplicative decrease of the budget on a 429, blocking the model until Retry-After.
+# Every worker in flight sees the same 429 window, only the first one to report it
+# shrinks the budget; the others only extend the block.
+_THROTTLE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'factor', 'blocked_until')
+local factor = tonumber(state[1]) or 1.0
+local blocked_until = tonumber(state[2]) or 0
+if blocked_until <= now then
+  factor = math.max(factor * tonumber(ARGV[2]), tonumber(ARGV[3]))
+end
+blocked_until = math.max(blocked_until, now + tonumber(ARGV[1]))
+redis.call('HSET', KEYS[1], 'factor', tostring(factor), 'blocked_until', tostring(blocked_until), 'requests', '0')
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(factor)
+"""
+
+# Additive increase of the budget after a successful request.
+_RECOVER_SCRIPT = """
+local factor = tonumber(redis.call('HGET', KEYS[1], 'factor'))
+if factor == nil or factor >= 1.0 then
+  return '1'
+end
+factor = math.min(factor + tonumber(ARGV[1]), 1.0)
+redis.call('HSET', KEYS[1], 'factor', tostring(factor))
+return tostring(factor)
+"""
+
+
+def retry_after_seconds(response) -> Optional[float]:
+    """The Retry-After of a response in seconds, given either as seconds or as an HTTP date."""
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class RateLimiter:
+    """
+    Distributed token-bucket limiter for the Genext gateway.
+
+    Every worker draws from the same Redis buckets per model, one for requests
+    and one for tokens per minute. A 429 shrinks the budget of the model
+    (multiplicative decrease, once per Retry-After window however many
+    workers report it) and blocks it for the Retry-After period, every
+    success grows it back (additive increase), so the workers together settle
+    just below the quota. Redis problems never block a request.
+    """
+
+    def __init__(self, client: redis.Redis, limits: Dict[str, Tuple[int, int]], default: Tuple[int, int],
+                 max_wait: float, prefix: str = "genext-rate"):
+        self.redis = client
+        self.limits = limits
+        self.default = default
+        self.max_wait = max_wait
+        self.prefix = prefix
+        self._acquire = client.register_script(_ACQUIRE_SCRIPT)
+        self._throttle = client.register_script(_THROTTLE_SCRIPT)
+        self._recover = client.register_script(_RECOVER_SCRIPT)
+
+    def _key(self, model: str) -> str:
+        return f"{self.prefix}:{model}"
+
+    def limits_for(self, model: str) -> Tuple[int, int]:
+        return self.limits.get(model, self.default)
+
+    def _try_acquire(self, model: str, tokens: int) -> float:
+        rpm, tpm = self.limits_for(model)
+        try:
+            return float(self._acquire(keys=[self._key(model)], args=[rpm, tpm, tokens]))
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter unavailable, sending request without limit: {e}")
+            return 0.0
+
+    def try_acquire(self, model: str, tokens: int) -> bool:
+        """Take budget for one request only if it is available right now."""
+        return self._try_acquire(model, tokens) <= 0
+
+    def acquire(self, model: str, tokens: int, deadline: Optional[float] = None):
+        """
+        Block until the model has budget for one request of ``tokens`` tokens.
+
+        Raises RateLimitTimeout after the maximum wait and DeadlineExceededError
+        when the budget would only become available after ``deadline``.
+        """
+        max_deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = self._try_acquire(model, tokens)
+            if wait <= 0:
+                return
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise DeadlineExceededError(f"No budget for {model} before the deadline")
+            if time.monotonic() + wait > max_deadline:
+                raise RateLimitTimeout(f"No budget for {model} within {self.max_wait} seconds")
+            # jitter spreads the waiting workers over the refill
+            time.sleep(wait + random.uniform(0, min(wait, 1.0)))
+
+    def throttle(self, model: str, retry_after: Optional[float] = None):
+        """Record a 429 for the model."""
+        retry_after = settings.GENEXT_RATE_LIMIT_DEFAULT_BACKOFF if retry_after is None else retry_after
+        try:
+            factor = float(self._throttle(keys=[self._key(model)],
+                                          args=[retry_after, settings.GENEXT_RATE_LIMIT_DECREASE,
+                                                settings.GENEXT_RATE_LIMIT_MIN_FACTOR]))
+            logger.warning(f"Rate limited on {model}, budget at {factor:.0%} for the next requests")
+        except redis.RedisError as e:
+            logger.warning(f"Could not record rate limit of {model}: {e}")
+
+    def success(self, model: str):
+        try:
+            self._recover(keys=[self._key(model)], args=[settings.GENEXT_RATE_LIMIT_INCREASE])
+        except redis.RedisError as e:
+            logger.warning(f"Could not update rate limit of {model}: {e}")
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """The shared limiter, None when rate limiting is disabled."""
+    global _limiter
+    if not settings.GENEXT_RATE_LIMIT:
+        return None
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                limits = {model: (rpm, tpm) for model, (rpm, tpm) in settings.GENEXT_MODEL_LIMITS.items()}
+                _limiter = RateLimiter(
+                    redis.Redis.from_url(settings.GENEXT_RATE_LIMIT_REDIS_URL or settings.CELERY_BROKER_URL),
+                    limits,
+                    (settings.GENEXT_DEFAULT_RPM, settings.GENEXT_DEFAULT_TPM),
+                    settings.GENEXT_RATE_LIMIT_MAX_WAIT,
+                )
+    return _limiter
@@ -0,0 +1,159 @@
+import json
+import logging
+import re
+import threading
+from typing import Dict, List, Optional, Sequence
+
+from pydantic import BaseModel, Field, PrivateAttr, TypeAdapter, ValidationError, field_validator
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+MIN_SCORE = 0
+MAX_SCORE = 10
+
+# only the start of an answer is searched for a score, which bounds the regex work
+_SCAN_CHARS = 2000
+_SCORE_PATTERNS = (
+    re.compile(r'\b(?:score|rating)\s*[:=]?\s*(\d{1,3}(?:\.\d+)?)', re.IGNORECASE),
+    re.compile(r'\b(\d{1,3}(?:\.\d+)?)\s*(?:/|out of)\s*10\b', re.IGNORECASE),
+    re.compile(r'\d+'),
+)
+_FENCE_PATTERN = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+REASK_INSTRUCTION = ('\n\nYour previous answer could not be read. Answer only with a JSON object of the form '
+                     '{"score": <0-10>, "feedback": "<feedback>", "evidence": ["<quote from the document>"]}.')
+
+
+def clamp_score(value) -> int:
+    return min(max(int(round(float(value))), MIN_SCORE), MAX_SCORE)
+
+
+class RuleAssessment(BaseModel):
+    """The structured answer of the model for one rule."""
+    score: int
+    feedback: str = ""
+    evidence: List[str] = Field(default_factory=list)
+    # the original answer when the score was found in free text
+    _text: Optional[str] = PrivateAttr(default=None)
+
+    @field_validator("score", mode="before")
+    @classmethod
+    def _clamp(cls, value):
+        if isinstance(value, bool):
+            raise ValueError("score must be a number")
+        return clamp_score(value)
+
+    @field_validator("evidence", mode="before")
+    @classmethod
+    def _listify(cls, value):
+        if value is None:
+            return []
+        return [value] if isinstance(value, str) else value
+
+    def render(self) -> str:
+        """The familiar ``"<score> - <feedback>"`` answer, followed by the cited evidence."""
+        if self._text is not None:
+            return self._text
+        answer = f"{self.score} - {self.feedback}"
+        if self.evidence:
+            answer += '\nEvidence:\n' + '\n'.join(f'- {quote}' for quote in self.evidence)
+        return answer
+
+
+class BatchRuleAssessment(RuleAssessment):
+    rule_id: str
+
+    @field_validator("rule_id", mode="before")
+    @classmethod
+    def _strip(cls, value):
+        return str(value).strip()
+
+
+_batch_adapter = TypeAdapter(List[BatchRuleAssessment])
+
+
+class ParseCounters:
+    """How answers were parsed in this process, exposed for monitoring."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {"structured": 0, "regex": 0, "failed": 0, "reasked": 0, "batch_failed": 0}
+
+    def increment(self, name: str):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+parse_counters = ParseCounters()
+
+
+def _json_candidate(answer: str, open_char: str, close_char: str) -> Optional[str]:
+    text = _FENCE_PATTERN.sub('', answer.strip())
+    start, end = text.find(open_char), text.rfind(close_char)
+    if start < 0 or end <= start:
+        return None
+    return text[start:end + 1]
+
+
+def _structured(answer: str) -> Optional[RuleAssessment]:
+    candidate = _json_candidate(answer, '{', '}')
+    if candidate is None:
+        return None
+    try:
+        return RuleAssessment.model_validate(json.loads(candidate))
+    except (ValueError, ValidationError):
+        return None
+
+
+def extract_score_text(answer: str) -> Optional[int]:
+    """The score of a free text answer, None when it contains no number."""
+    head = answer[:_SCAN_CHARS]
+    for pattern in _SCORE_PATTERNS:
+        match = pattern.search(head)
+        if match:
+            return clamp_score(match.group(1) if match.groups() else match.group(0))
+    return None
+
+
+def parse_assessment(answer: str) -> Optional[RuleAssessment]:
+    """
+    The assessment in a model answer.
+
+    Structured JSON output is preferred, free text falls back to a bounded
+    regex search for the score. Returns None when neither finds a score.
+    """
+    assessment = _structured(answer)
+    if assessment is not None:
+        parse_counters.increment("structured")
+        return assessment
+    score = extract_score_text(answer)
+    if score is not None:
+        parse_counters.increment("regex")
+        assessment = RuleAssessment(score=score, feedback=answer)
+        assessment._text = answer
+        return assessment
+    parse_counters.increment("failed")
+    logger.warning(f"No score found in answer: {answer[:200]!r}")
+    return None
+
+
+def parse_batch_assessments(answer: str, rule_ids: Sequence[str]) -> Optional[List[RuleAssessment]]:
+    """Per-rule assessments of a batch answer in rule order, None when it does not parse."""
+    candidate = _json_candidate(answer, '[', ']')
+    assessments = None
+    if candidate is not None:
+        try:
+            assessments = _batch_adapter.validate_json(candidate)
+        except ValidationError:
+            assessments = None
+    by_rule = {assessment.rule_id: assessment for assessment in assessments or ()}
+    if assessments is None or any(rule_id not in by_rule for rule_id in rule_ids):
+        parse_counters.increment("batch_failed")
+        return None
+    return [by_rule[rule_id] for rule_id in rule_ids]
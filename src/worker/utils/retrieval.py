@@ -0,0 +1,129 @@
+import hashlib
+import logging
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+from worker.core.config import settings
+from worker.utils.artifact_cache import ArtifactCache
+from worker.utils.embeddings import EMBEDDING_MODEL, embed_batch, get_embedding_coalescer
+from worker.utils.genext import LlmApiModel
+from worker.utils.llm_cache import get_response_cache
+from worker.utils.prompt_builder import split_into_spans
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_embedding_cache = ArtifactCache(settings.EMBEDDING_CACHE_SIZE)
+_index_cache = ArtifactCache(settings.DOCUMENT_CACHE_SIZE)
+
+
+def embedding_key(text: str, model: LlmApiModel = EMBEDDING_MODEL) -> str:
+    return hashlib.sha256(f"embedding\0{model.value}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _cached_embedding(key: str) -> Optional[np.ndarray]:
+    vector = _embedding_cache.get(key)
+    if vector is not None:
+        return vector
+    cache = get_response_cache()
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            vector = np.asarray(cached["embedding"], dtype=np.float32)
+            _embedding_cache.put(key, vector)
+            return vector
+    return None
+
+
+def _store_embedding(key: str, vector: np.ndarray):
+    _embedding_cache.put(key, vector)
+    cache = get_response_cache()
+    if cache is not None:
+        cache.set(key, {"embedding": vector.tolist()})
+
+
+def embed_texts(texts: Sequence[str], coalesce: bool = False) -> np.ndarray:
+    """
+    Embeddings of ``texts`` as a ``len(texts) x dim`` matrix.
+
+    Vectors are cached by content hash in process and, when configured, in the
+    LLM response cache, so chunks and rules shared between jobs are embedded once.
+    With ``coalesce`` the uncached texts share requests with the other callers
+    of the worker process (see ``EmbeddingCoalescer``), meant for the handful of
+    rule texts every evaluation embeds.
+    """
+    keys = [embedding_key(text) for text in texts]
+    vectors: List[Optional[np.ndarray]] = [_cached_embedding(key) for key in keys]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        logger.info(f"{len(missing)} of {len(texts)} embeddings not cached")
+        if coalesce:
+            coalescer = get_embedding_coalescer()
+            futures = [coalescer.submit(texts[i]) for i in missing]
+            embedded = [future.result() for future in futures]
+        else:
+            embedded = embed_batch([texts[i] for i in missing])
+        for i, vector in zip(missing, embedded):
+            _store_embedding(keys[i], vector)
+            vectors[i] = vector
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack(vectors)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorIndex:
+    """Brute-force cosine similarity index, plenty fast for a few thousand chunks."""
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+
+    def search(self, queries: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the ``k`` most similar vectors for every query row, best first."""
+        k = min(k, len(self.vectors))
+        if k == 0:
+            return np.zeros((len(queries), 0), dtype=np.int64)
+        scores = _normalize(np.atleast_2d(queries)) @ self.vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        return np.take_along_axis(top, order, axis=1)
+
+
+class DocumentRetriever:
+    """Embedded chunks of one document for top-k retrieval per rule."""
+
+    def __init__(self, text: str):
+        self.spans = [(start, end) for start, end in split_into_spans(
+            text, EMBEDDING_MODEL, settings.RETRIEVAL_CHUNK_TOKENS, settings.RETRIEVAL_CHUNK_OVERLAP_TOKENS)
+            if text[start:end].strip()]
+        self.chunks = [text[start:end] for start, end in self.spans]
+        self.index = VectorIndex(embed_texts(self.chunks)) if self.chunks else None
+
+    def retrieve(self, query_vectors: np.ndarray, k: Optional[int] = None) -> List[str]:
+        """The top-k chunk texts for every query, each joined in document order without repeating overlaps."""
+        if self.index is None:
+            return ['' for _ in range(len(query_vectors))]
+        k = k or settings.RETRIEVAL_TOP_K
+        return [self._join(row) for row in self.index.search(query_vectors, k)]
+
+    def _join(self, indices: Sequence[int]) -> str:
+        parts = []
+        end = 0
+        for i in sorted(indices):
+            start, stop = self.spans[i]
+            # neighbouring chunks share their overlap, only the part after the previous chunk is new
+            parts.append(self.chunks[i][max(end - start, 0):])
+            end = max(end, stop)
+        return ''.join(parts)
+
+
+def get_document_retriever(content_hash: str, text: str) -> DocumentRetriever:
+    """Retriever of a parsed document, built once per document content."""
+    return _index_cache.get_or_create(content_hash, lambda: DocumentRetriever(text))
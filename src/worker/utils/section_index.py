@@ -0,0 +1,140 @@
+import difflib
+import logging
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from worker.core.config import settings
+from worker.utils.doc_tree import DocTree, DocTreeNode
+
+# Configure logger
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+_WORD_PATTERN = re.compile(r'\w+')
+_SPACE_PATTERN = re.compile(r'\s+')
+# sorts after every string starting with a given prefix
+_PREFIX_END = '\U0010ffff'
+# words are indexed by all their substrings of up to this many characters
+_GRAM_SIZE = 3
+
+
+def normalize(text: str) -> str:
+    return _SPACE_PATTERN.sub(' ', text).strip().lower()
+
+
+class SectionIndex:
+    """
+    Lookup of document sections by text, built once per parsed document.
+
+    Works directly on the pre-order ranges of the DocTree, so a section and
+    everything below it is the node range ``start .. end``. A word index
+    narrows the candidates before the substring check, which keeps the results
+    identical to ``DocParser.find_text_with_subnodes``. Words cut off at the
+    edges of the search text are looked up in sorted lists of the words and of
+    the reversed words, or through their trigrams when the search text starts
+    and ends inside a word. The optional fuzzy matching only compares against the
+    normalized heading texts.
+    """
+
+    def __init__(self, tree: DocTree, fuzzy: Optional[bool] = None, fuzzy_cutoff: Optional[float] = None):
+        self.fuzzy = settings.SECTION_FUZZY_MATCH if fuzzy is None else fuzzy
+        self.fuzzy_cutoff = settings.SECTION_FUZZY_CUTOFF if fuzzy_cutoff is None else fuzzy_cutoff
+
+        self.tree = tree
+        self.lowered: List[str] = []
+        self.headings: Dict[str, List[int]] = defaultdict(list)
+        self.postings: Dict[str, Set[int]] = defaultdict(set)
+        self._build()
+        self.tokens: List[str] = sorted(self.postings)
+        self.reversed_tokens: List[str] = sorted(token[::-1] for token in self.tokens)
+        # grows with the total length of the words, text without spaces only makes long words
+        self.grams: Dict[str, Set[str]] = defaultdict(set)
+        for token in self.tokens:
+            for size in range(1, _GRAM_SIZE + 1):
+                for i in range(len(token) - size + 1):
+                    self.grams[token[i:i + size]].add(token)
+        # bound per instance so the cache dies with the index
+        self._positions = lru_cache(maxsize=1024)(self._find_positions)
+
+    def _build(self):
+        for position in range(len(self.tree)):
+            lowered = self.tree.text(position).lower()
+            self.lowered.append(lowered)
+            if lowered:
+                if self.tree.style(position).startswith('Heading'):
+                    self.headings[normalize(lowered)].append(position)
+                for word in set(_WORD_PATTERN.findall(lowered)):
+                    self.postings[word].add(position)
+
+    def _words_matching(self, word: str, is_first: bool, is_last: bool) -> Set[int]:
+        # inner words of the search text must be whole words of the node,
+        # the outer ones may be cut off by the substring match
+        if not is_first and not is_last:
+            return self.postings.get(word, set())
+        if is_first and is_last:
+            tokens: Iterable[str] = self._tokens_containing(word)
+        elif is_first:
+            # the token ends with the word, i.e. the reversed token starts with the reversed word
+            backwards = word[::-1]
+            start = bisect_left(self.reversed_tokens, backwards)
+            tokens = [token[::-1] for token in
+                      self.reversed_tokens[start:bisect_left(self.reversed_tokens, backwards + _PREFIX_END, start)]]
+        else:
+            start = bisect_left(self.tokens, word)
+            tokens = self.tokens[start:bisect_left(self.tokens, word + _PREFIX_END, start)]
+        positions: Set[int] = set()
+        for token in tokens:
+            positions |= self.postings[token]
+        return positions
+
+    def _tokens_containing(self, word: str) -> Set[str]:
+        if len(word) <= _GRAM_SIZE:
+            return self.grams.get(word, set())
+        # every trigram of the word occurs in the token, which makes it a candidate only
+        candidates: Optional[Set[str]] = None
+        for i in range(len(word) - _GRAM_SIZE + 1):
+            tokens = self.grams.get(word[i:i + _GRAM_SIZE], set())
+            candidates = tokens if candidates is None else candidates & tokens
+            if not candidates:
+                return set()
+        return {token for token in candidates if word in token}
+
+    def _find_positions(self, search_text: str) -> Tuple[int, ...]:
+        lowered = search_text.lower()
+        words = _WORD_PATTERN.findall(lowered)
+        if words:
+            # the search may start or end in the middle of a word unless it is delimited
+            starts_open = lowered[:1].isalnum() or lowered[:1] == '_'
+            ends_open = lowered[-1:].isalnum() or lowered[-1:] == '_'
+            candidates: Optional[Set[int]] = None
+            for i, word in enumerate(words):
+                positions = self._words_matching(word, i == 0 and starts_open, i == len(words) - 1 and ends_open)
+                candidates = positions if candidates is None else candidates & positions
+                if not candidates:
+                    break
+            candidates = candidates or set()
+        else:
+            candidates = range(len(self.tree))
+
+        matches = tuple(i for i in sorted(candidates) if lowered in self.lowered[i])
+        if not matches and self.fuzzy:
+            close = difflib.get_close_matches(normalize(lowered), self.headings.keys(), n=1, cutoff=self.fuzzy_cutoff)
+            if close:
+                logger.info(f"Section '{search_text}' matched fuzzily to '{close[0]}'")
+                matches = tuple(self.headings[close[0]])
+        return matches
+
+    def spans(self, search_text: str) -> List[Tuple[int, int]]:
+        """Pre-order ranges ``(start, end)`` of every node matching the text and its subtree."""
+        return [(i, self.tree.ends[i]) for i in self._positions(search_text)]
+
+    def find(self, search_text: str) -> List[DocTreeNode]:
+        """Matching nodes, each followed by all of its subnodes."""
+        return [self.tree.node(i) for start, end in self.spans(search_text) for i in range(start, end)]
+
+    def section_text(self, search_text: str) -> str:
+        tree = self.tree
+        return ''.join(tree.text(i) + '\n' for start, end in self.spans(search_text) for i in range(start, end))